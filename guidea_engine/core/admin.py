@@ -1,5 +1,9 @@
 from django.contrib import admin
-from .models import Location, TextSnippet, AudioSnippet, Tour, StitchCache
+from django.core.exceptions import ValidationError
+from django.forms.models import BaseInlineFormSet
+from .utils.search import search_locations
+from .utils.tours import TourOrderError, set_location_order, validate_location_order
+from .models import Location, TextSnippet, AudioSnippet, Tour, TourStop, StitchCache, Job
 
 @admin.register(Location)
 class LocationAdmin(admin.ModelAdmin):
@@ -8,20 +12,69 @@ class LocationAdmin(admin.ModelAdmin):
     search_fields = ['name']
     readonly_fields = ['created', 'updated']
 
+    def get_search_results(self, request, queryset, search_term):
+        # Use the full-text index rather than an ILIKE scan over every name
+        if not search_term:
+            return queryset, False
+        return queryset.filter(pk__in=[location_id for location_id, _ in search_locations(search_term)]), False
+
 @admin.register(TextSnippet)
 class TextSnippetAdmin(admin.ModelAdmin):
     list_display = ['location', 'length', 'is_current', 'created']
     list_filter = ['length', 'is_current', 'created']
     search_fields = ['location__name', 'text']
+    list_select_related = ['location']
 
 @admin.register(AudioSnippet)
 class AudioSnippetAdmin(admin.ModelAdmin):
     list_display = ['text_snippet', 'voice_id', 'is_current', 'created']
     list_filter = ['voice_id', 'is_current', 'created']
+    list_select_related = ['text_snippet__location']
+
+class TourStopFormSet(BaseInlineFormSet):
+    def location_ids(self):
+        """Location ids of the rows being kept, ordered by the positions entered"""
+        rows = [
+            (form.cleaned_data['position'], index, form.cleaned_data['location'].pk)
+            for index, form in enumerate(self.forms)
+            if form.cleaned_data.get('location') and not form.cleaned_data.get('DELETE')
+        ]
+        return [location_id for _, _, location_id in sorted(rows)]
+
+    def clean(self):
+        super().clean()
+        if any(self.errors):
+            return
+        try:
+            validate_location_order(self.location_ids())
+        except TourOrderError as e:
+            raise ValidationError(str(e))
+
+class TourStopInline(admin.TabularInline):
+    model = TourStop
+    formset = TourStopFormSet
+    raw_id_fields = ['location']
+    extra = 0
 
 @admin.register(Tour)
 class TourAdmin(admin.ModelAdmin):
     list_display = ['name', 'created', 'updated']
     search_fields = ['name', 'description']
+    inlines = [TourStopInline]
+
+    def save_formset(self, request, form, formset, change):
+        if not isinstance(formset, TourStopFormSet):
+            return super().save_formset(request, form, formset, change)
+        # Stops are rewritten through set_location_order so the tour is touched,
+        # its caches and stitches dropped and the change logged for sync.
+        # commit=False only collects what changed for the admin history.
+        formset.save(commit=False)
+        set_location_order(form.instance, formset.location_ids())
 
 admin.site.register(StitchCache)
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['kind', 'status', 'attempts', 'run_after', 'created']
+    list_filter = ['kind', 'status']
+    readonly_fields = ['created', 'updated']
@@ -0,0 +1,182 @@
+"""
+Native async versions of the hottest read-only endpoints, served at the same
+paths when the app runs under ASGI (see guidea_engine/asgi_urls.py).
+
+Responses match the DRF views byte for byte. Requests the fast path does not
+cover (writes, field projection, ?lite, the orjson and msgpack renderers) are
+handed to the sync view in a thread.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.renderers import JSONRenderer
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from .authentication import atoken_user
+from .models import Location, TextSnippet, Tour
+from .renderers import wants_alternate_renderer
+from .serializers import LocationSerializer, TextSnippetSerializer, TourSerializer
+from .utils import response_cache
+from .utils.geo import afind_nearby
+from .views import (
+    LocationViewSet, TourViewSet, bundle_locations, bundle_payload, nearby_params, nearby_payload,
+    stops_prefetch
+)
+
+_jwt = JWTAuthentication()
+_renderer = JSONRenderer()
+
+_sync_location_detail = LocationViewSet.as_view({
+    'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'
+})
+_sync_location_snippets = LocationViewSet.as_view({'get': 'get_snippets'})
+_sync_nearby_locations = LocationViewSet.as_view({'get': 'nearby_locations'})
+_sync_tour_bundle = TourViewSet.as_view({'get': 'bundle'})
+
+
+def json_response(data, status_code=status.HTTP_200_OK):
+    """Render like DRF's JSONRenderer so async and sync responses are identical"""
+    return HttpResponse(_renderer.render(data), status=status_code, content_type='application/json')
+
+
+def cached_response(request, entry):
+    """Async counterpart of response_cache.respond"""
+    if response_cache.not_modified(request, entry):
+        response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = json_response(entry['data'])
+    for header, value in response_cache.validator_headers(entry).items():
+        response[header] = value
+    return response
+
+
+def not_found(model):
+    return json_response({'detail': f'No {model._meta.object_name} matches the given query.'},
+                         status.HTTP_404_NOT_FOUND)
+
+
+async def authenticate(request):
+    """
+    The token user for the request's JWT, None without credentials; raises
+    AuthenticationFailed. Same checks as StatelessJWTAuthentication.
+    """
+    header = _jwt.get_header(request)
+    raw_token = _jwt.get_raw_token(header) if header is not None else None
+    if raw_token is None:
+        return None
+    return await atoken_user(_jwt.get_validated_token(raw_token))
+
+
+def jwt_required(view):
+    """Reject the request the way DRF's IsAuthenticated + StatelessJWTAuthentication would"""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            user = await authenticate(request)
+        except AuthenticationFailed as e:
+            detail = e.detail if isinstance(e.detail, dict) else {'detail': e.detail}
+            response = json_response(detail, e.status_code)
+            response['WWW-Authenticate'] = _jwt.authenticate_header(request)
+            return response
+        if user is None:
+            response = json_response({'detail': 'Authentication credentials were not provided.'},
+                                     status.HTTP_401_UNAUTHORIZED)
+            response['WWW-Authenticate'] = _jwt.authenticate_header(request)
+            return response
+        request.user = user
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+def falls_back_to(sync_view):
+    """
+    Serve plain GET/HEAD reads with the async view. Writes, field projection
+    (?fields=, ?lite=) and alternate renderers go to the DRF view in a thread
+    instead.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if (
+                request.method not in ('GET', 'HEAD') or 'fields' in request.GET or 'lite' in request.GET
+                or wants_alternate_renderer(request)
+            ):
+                return await sync_to_async(sync_view)(request, *args, **kwargs)
+            return await view(request, *args, **kwargs)
+        # Report metrics under the DRF view's label
+        wrapper.cls, wrapper.actions = sync_view.cls, sync_view.actions
+        return csrf_exempt(wrapper)
+    return decorator
+
+
+@falls_back_to(_sync_location_detail)
+@jwt_required
+async def location_detail(request, pk):
+    key = response_cache.location_key(pk)
+    entry = await response_cache.aget(key)
+    if entry is None:
+        try:
+            location = await Location.objects.aget(pk=pk)
+        except Location.DoesNotExist:
+            return not_found(Location)
+        entry = await response_cache.astore(
+            key, response_cache.location_etag(location), location.updated, LocationSerializer(location).data
+        )
+    return cached_response(request, entry)
+
+
+@falls_back_to(_sync_location_snippets)
+@jwt_required
+async def location_snippets(request, pk):
+    key = response_cache.snippets_key(pk)
+    entry = await response_cache.aget(key)
+    if entry is None:
+        try:
+            location = await Location.objects.only('id', 'updated').aget(pk=pk)
+        except Location.DoesNotExist:
+            return json_response({'error': 'Location not found'}, status.HTTP_404_NOT_FOUND)
+        snippets = [
+            snippet async for snippet in
+            TextSnippet.objects.filter(location_id=pk).select_related('location').order_by('length')
+        ]
+        last_modified = max((snippet.updated for snippet in snippets), default=location.updated)
+        entry = await response_cache.astore(
+            key, response_cache.snippets_etag(snippets), last_modified,
+            TextSnippetSerializer(snippets, many=True).data
+        )
+    return cached_response(request, entry)
+
+
+@falls_back_to(_sync_nearby_locations)
+@jwt_required
+async def nearby_locations(request):
+    params, error = nearby_params(request.GET)
+    if error:
+        return json_response({'error': error}, status.HTTP_400_BAD_REQUEST)
+
+    matches = await afind_nearby(Location.objects.all(), params['lat'], params['lon'], params['radius'])
+    page = matches[params['offset']:params['offset'] + params['limit']]
+    locations_by_id = await Location.objects.ain_bulk([location_id for location_id, _ in page])
+    return json_response(nearby_payload(params, matches, page, locations_by_id))
+
+
+@falls_back_to(_sync_tour_bundle)
+@jwt_required
+async def tour_bundle(request, pk):
+    length = request.GET.get('length', 'medium')
+    voice_id = request.GET.get('voice')
+
+    try:
+        tour = await Tour.objects.prefetch_related(stops_prefetch()).aget(pk=pk)
+    except Tour.DoesNotExist:
+        return not_found(Tour)
+    if length not in dict(TextSnippet.LENGTH_CHOICES):
+        return json_response({'error': 'length must be short, medium or long'}, status.HTTP_400_BAD_REQUEST)
+
+    location_order = tour.location_order
+    locations = await bundle_locations(length, voice_id).ain_bulk(location_order)
+    return json_response(bundle_payload(TourSerializer(tour).data, location_order, locations, length, voice_id))
@@ -0,0 +1,165 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Small thread-safe LRU whose entries expire ttl seconds after being set"""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# user id -> (is_active, md5 of the password hash), or None for a deleted user
+_user_states = TTLCache(settings.JWT_STATE_CACHE_SIZE, settings.JWT_STATE_CACHE_TTL)
+# access token jti -> revoked?
+_revoked_tokens = TTLCache(settings.JWT_STATE_CACHE_SIZE, settings.JWT_STATE_CACHE_TTL)
+
+
+def _as_datetime(timestamp):
+    return datetime.fromtimestamp(timestamp, tz=dt_timezone.utc) if timestamp else None
+
+
+def revoke_access_token(token):
+    """
+    Deny an access token until it expires, e.g. on logout. It goes into
+    simplejwt's blacklist tables, which every process reads, and is pruned
+    with the refresh tokens once expired (prune_tokens).
+    """
+    jti = token.get(api_settings.JTI_CLAIM)
+    if not jti or token.get('exp', 0) <= time.time():
+        return
+    outstanding, _ = OutstandingToken.objects.get_or_create(jti=jti, defaults={
+        'user': User.objects.filter(**{api_settings.USER_ID_FIELD: token.get(api_settings.USER_ID_CLAIM)}).first(),
+        'token': str(token),
+        'created_at': _as_datetime(token.get('iat')),
+        'expires_at': _as_datetime(token['exp']),
+    })
+    BlacklistedToken.objects.get_or_create(token=outstanding)
+    _revoked_tokens.set(jti, True)
+
+
+def _revoked_query(jti):
+    return BlacklistedToken.objects.filter(token__jti=jti)
+
+
+def forget_user(user_id):
+    """Drop this process's memoised state for a user, e.g. after it is saved"""
+    _user_states.discard(user_id)
+
+
+def _user_id(validated_token):
+    try:
+        return validated_token[api_settings.USER_ID_CLAIM]
+    except KeyError:
+        raise InvalidToken('Token contained no recognizable user identification')
+
+
+def _user_state_query(user_id):
+    return User.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).values_list('is_active', 'password')
+
+
+def _as_state(row):
+    return None if row is None else (row[0], get_md5_hash_password(row[1]))
+
+
+def _token_user(validated_token, revoked, state):
+    if revoked:
+        raise AuthenticationFailed('Token has been revoked', code='token_revoked')
+    if state is None:
+        raise AuthenticationFailed('User not found', code='user_not_found')
+    is_active, password_hash = state
+    if not is_active:
+        raise AuthenticationFailed('User is inactive', code='user_inactive')
+    if api_settings.CHECK_REVOKE_TOKEN and validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != password_hash:
+        raise AuthenticationFailed("The user's password has been changed.", code='password_changed')
+    return api_settings.TOKEN_USER_CLASS(validated_token)
+
+
+def token_user(validated_token):
+    """
+    TOKEN_USER_CLASS for a validated access token, after the revocation and
+    user checks JWTAuthentication makes. Their results are memoised for
+    JWT_STATE_CACHE_TTL seconds, so a warm token costs no queries.
+    """
+    user_id = _user_id(validated_token)
+    jti = validated_token.get(api_settings.JTI_CLAIM)
+    revoked = _revoked_tokens.get(jti, _MISSING) if jti else False
+    if revoked is _MISSING:
+        revoked = _revoked_query(jti).exists()
+        _revoked_tokens.set(jti, revoked)
+    state = _user_states.get(user_id, _MISSING)
+    if state is _MISSING:
+        state = _as_state(_user_state_query(user_id).first())
+        _user_states.set(user_id, state)
+    return _token_user(validated_token, revoked, state)
+
+
+async def atoken_user(validated_token):
+    """Async token_user for async views"""
+    user_id = _user_id(validated_token)
+    jti = validated_token.get(api_settings.JTI_CLAIM)
+    revoked = _revoked_tokens.get(jti, _MISSING) if jti else False
+    if revoked is _MISSING:
+        revoked = await _revoked_query(jti).aexists()
+        _revoked_tokens.set(jti, revoked)
+    state = _user_states.get(user_id, _MISSING)
+    if state is _MISSING:
+        state = _as_state(await _user_state_query(user_id).afirst())
+        _user_states.set(user_id, state)
+    return _token_user(validated_token, revoked, state)
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """
+    Opt-in JWTAuthentication for read-only endpoints that trusts the token's
+    claims: request.user is a TOKEN_USER_CLASS rather than a User row.
+    Deactivation, password changes and logout still lock the token out: all
+    three are read from the database, so other processes see them within
+    JWT_STATE_CACHE_TTL seconds.
+    """
+
+    def get_user(self, validated_token):
+        return token_user(validated_token)
@@ -0,0 +1,90 @@
+import math
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.models import Location
+from core.utils.geo import encode_geohash, find_nearby, haversine_km, parse_latlon
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the nearby-locations radius search at growing catalogue sizes (all writes are rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--radius', type=float, default=10.0, help='Search radius in km')
+        parser.add_argument('--scan', action='store_true',
+                            help='Also time a full-table haversine scan for comparison')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        try:
+            with transaction.atomic():
+                self._run(rng, options)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _random_point(self, rng):
+        # Uniform over the sphere so density grows with catalogue size
+        lat = math.degrees(math.asin(rng.uniform(-1.0, 1.0)))
+        lon = rng.uniform(-180.0, 180.0)
+        return lat, lon
+
+    def _run(self, rng, options):
+        radius = options['radius']
+        total = 0
+        self.stdout.write(f'{"rows":>10} {"median ms":>10} {"p95 ms":>10} {"avg hits":>9}'
+                          + (f' {"scan ms":>10}' if options['scan'] else ''))
+
+        for size in sorted(options['sizes']):
+            self._insert(rng, size - total)
+            total = size
+
+            probes = [self._random_point(rng) for _ in range(options['queries'])]
+            timings = []
+            hits = 0
+            for lat, lon in probes:
+                start = time.perf_counter()
+                hits += len(find_nearby(Location.objects.all(), lat, lon, radius))
+                timings.append((time.perf_counter() - start) * 1000)
+
+            line = (f'{size:>10} {statistics.median(timings):>10.2f} '
+                    f'{statistics.quantiles(timings, n=20)[-1]:>10.2f} {hits / len(probes):>9.2f}')
+            if options['scan']:
+                line += f' {self._scan(probes[:5], radius):>10.2f}'
+            self.stdout.write(line)
+
+    def _insert(self, rng, count, batch_size=5000):
+        while count > 0:
+            batch = []
+            for _ in range(min(batch_size, count)):
+                lat, lon = self._random_point(rng)
+                batch.append(Location(
+                    name='bench',
+                    raw_text='',
+                    latlon_json={'lat': lat, 'lon': lon},
+                    geohash=encode_geohash(lat, lon),
+                ))
+            Location.objects.bulk_create(batch, batch_size=batch_size)
+            count -= len(batch)
+
+    def _scan(self, probes, radius):
+        timings = []
+        for lat, lon in probes:
+            start = time.perf_counter()
+            for latlon in Location.objects.values_list('latlon_json', flat=True).iterator(chunk_size=5000):
+                point = parse_latlon(latlon)
+                if point is not None:
+                    haversine_km(lat, lon, point[0], point[1]) <= radius
+            timings.append((time.perf_counter() - start) * 1000)
+        return statistics.median(timings)
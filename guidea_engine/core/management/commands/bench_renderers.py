@@ -0,0 +1,73 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from core.middleware import BrotliEncoder, GzipEncoder, brotli
+from core.models import Location
+from core.renderers import MessagePackRenderer, ORJSONRenderer, msgpack
+from core.serializers import LocationSerializer
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Compare CPU time and bytes on the wire of each renderer and content coding (writes are rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        renderers = [('json', JSONRenderer()), ('orjson', ORJSONRenderer())]
+        if msgpack is not None:
+            renderers.append(('msgpack', MessagePackRenderer()))
+        encoders = [('identity', None), ('gzip', GzipEncoder)]
+        if brotli is not None:
+            encoders.append(('br', BrotliEncoder))
+
+        try:
+            with transaction.atomic():
+                Location.objects.bulk_create([
+                    Location(
+                        name=f'Bench location {index}',
+                        raw_text='A sentence about this place, with a café and a view. ' * 20,
+                        latlon_json={'lat': 51.5 + index / 1e4, 'lon': -0.12 - index / 1e4},
+                    )
+                    for index in range(options['rows'])
+                ], batch_size=1000)
+                locations = list(Location.objects.order_by('-id')[:options['rows']])
+
+                start = time.process_time()
+                data = LocationSerializer(locations, many=True).data
+                self.stdout.write(f'serialize {len(data)} rows: {(time.process_time() - start) * 1000:.1f} ms CPU')
+
+                self.stdout.write(f'{"renderer":>9} {"coding":>9} {"bytes":>10} {"render ms":>10} {"encode ms":>10}')
+                for name, renderer in renderers:
+                    body, render_ms = self._measure(lambda: renderer.render(data), options['repeat'])
+                    for coding, encoder_class in encoders:
+                        if encoder_class is None:
+                            wire, encode_ms = body, 0.0
+                        else:
+                            wire, encode_ms = self._measure(lambda: self._encode(encoder_class, body), options['repeat'])
+                        self.stdout.write(f'{name:>9} {coding:>9} {len(wire):>10} {render_ms:>10.1f} {encode_ms:>10.1f}')
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _encode(self, encoder_class, body):
+        encoder = encoder_class()
+        return encoder.compress(body) + encoder.finish()
+
+    def _measure(self, run, repeat):
+        """(result, median CPU ms) over repeat runs"""
+        timings = []
+        for _ in range(repeat):
+            start = time.process_time()
+            result = run()
+            timings.append((time.process_time() - start) * 1000)
+        return result, statistics.median(timings)
@@ -0,0 +1,96 @@
+import statistics
+import time
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from core.utils.tokens import prune_expired_tokens
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark /api/auth/refresh/ latency as the refresh-token blacklist grows by simulated '
+        'rotations, and again after pruning (all writes are rolled back)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[0, 10000, 100000, 1000000],
+                            help='Rotations recorded in the blacklist tables')
+        parser.add_argument('--refreshes', type=int, default=200, help='Timed refreshes per size')
+        parser.add_argument('--expired-fraction', type=float, default=0.9,
+                            help='Share of simulated rotations whose refresh token has expired')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self._run(options)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _run(self, options):
+        user = User.objects.create_user(f'bench-{uuid.uuid4().hex[:8]}')
+        refresh = str(RefreshToken.for_user(user))
+        client = Client()
+        total = 0
+        self.stdout.write(f'{"rotations":>10} {"median ms":>10} {"p95 ms":>10}')
+
+        for size in sorted(options['sizes']):
+            self._insert(size - total, options['expired_fraction'])
+            total = size
+            self._analyse()
+            refresh, timings = self._time_refreshes(client, refresh, options['refreshes'])
+            self._report(f'{size}', timings)
+
+        start = time.perf_counter()
+        stats = prune_expired_tokens()
+        self.stdout.write(f'pruned {stats["outstanding"]} expired tokens in {time.perf_counter() - start:.1f}s')
+        self._analyse()
+        refresh, timings = self._time_refreshes(client, refresh, options['refreshes'])
+        self._report('pruned', timings)
+
+    def _insert(self, count, expired_fraction, batch_size=10000):
+        """Rows as left behind by `count` rotations with BLACKLIST_AFTER_ROTATION"""
+        now = timezone.now()
+        inserted = 0
+        while inserted < count:
+            batch = []
+            for index in range(inserted, min(inserted + batch_size, count)):
+                expired = index % 100 < expired_fraction * 100
+                expires_at = now + (timedelta(days=-1) if expired else timedelta(days=7))
+                batch.append(OutstandingToken(jti=uuid.uuid4().hex, token='', expires_at=expires_at))
+            tokens = OutstandingToken.objects.bulk_create(batch)
+            BlacklistedToken.objects.bulk_create([BlacklistedToken(token=token) for token in tokens])
+            inserted += len(batch)
+
+    def _analyse(self):
+        # Fresh planner statistics, as autovacuum would keep them in production
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE token_blacklist_outstandingtoken, token_blacklist_blacklistedtoken')
+
+    def _time_refreshes(self, client, refresh, count):
+        timings = []
+        for _ in range(count):
+            start = time.perf_counter()
+            response = client.post('/api/auth/refresh/', {'refresh': refresh}, content_type='application/json')
+            timings.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 200:
+                raise RuntimeError(f'Refresh failed: {response.status_code} {response.content!r}')
+            refresh = response.json()['refresh']
+        return refresh, timings
+
+    def _report(self, label, timings):
+        self.stdout.write(f'{label:>10} {statistics.median(timings):>10.2f} '
+                          f'{statistics.quantiles(timings, n=20)[-1]:>10.2f}')
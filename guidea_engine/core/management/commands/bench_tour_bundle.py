@@ -0,0 +1,98 @@
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from core.models import AudioSnippet, Location, TextSnippet, Tour
+from core.utils.snippets import build_snippet_texts, snippet_hash
+from core.utils.tours import set_location_order
+from core.views import AudioSnippetViewSet, LocationViewSet, TourViewSet
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Compare the tour bundle endpoint with the per-location fan-out a client does today (writes are rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stops', type=int, nargs='+', default=[5, 20, 50])
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        self.factory = APIRequestFactory()
+        self.views = {
+            'tour': TourViewSet.as_view({'get': 'retrieve'}),
+            'bundle': TourViewSet.as_view({'get': 'bundle'}),
+            'location': LocationViewSet.as_view({'get': 'retrieve'}),
+            'snippets': LocationViewSet.as_view({'get': 'get_snippets'}),
+            'audio': AudioSnippetViewSet.as_view({'get': 'list'}),
+        }
+        try:
+            with transaction.atomic():
+                self.user = User.objects.create_user('bench-tour-bundle')
+                self.stdout.write(f'{"stops":>6} {"pattern":>8} {"requests":>9} {"queries":>8} {"median ms":>10}')
+                for stops in options['stops']:
+                    tour = self._make_tour(stops)
+                    for name, run in (('fan-out', self._fan_out), ('bundle', self._bundle)):
+                        self._report(stops, name, tour, run, options['repeat'])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _make_tour(self, stops):
+        locations = Location.objects.bulk_create([
+            Location(name=f'Stop {index}', raw_text='A sentence about this stop. ' * 80, latlon_json={})
+            for index in range(stops)
+        ])
+        snippets = TextSnippet.objects.bulk_create([
+            TextSnippet(location=location, length=length, text=text, hash=snippet_hash(text), is_current=True)
+            for location in locations
+            for length, text in build_snippet_texts(location.raw_text).items()
+        ])
+        AudioSnippet.objects.bulk_create([
+            AudioSnippet(text_snippet=snippet, voice_id='default', audio_url=f'/bench/{snippet.pk}.wav', is_current=True)
+            for snippet in snippets
+        ])
+        tour = Tour.objects.create(name='Bench tour', description='')
+        set_location_order(tour, [location.pk for location in locations])
+        return tour
+
+    def _get(self, view, path, **kwargs):
+        request = self.factory.get(path)
+        force_authenticate(request, user=self.user)
+        response = self.views[view](request, **kwargs)
+        response.render()
+        return response
+
+    def _fan_out(self, tour):
+        requests = 1
+        self._get('tour', f'/api/tours/{tour.pk}/', pk=tour.pk)
+        for location_id in tour.location_order:
+            self._get('location', f'/api/locations/{location_id}/', pk=location_id)
+            self._get('snippets', f'/api/locations/{location_id}/snippets/', pk=location_id)
+            self._get('audio', f'/api/audio-snippets/?location_id={location_id}')
+            requests += 3
+        return requests
+
+    def _bundle(self, tour):
+        self._get('bundle', f'/api/tours/{tour.pk}/bundle/?length=medium', pk=tour.pk)
+        return 1
+
+    def _report(self, stops, name, tour, run, repeat):
+        timings = []
+        for _ in range(repeat):
+            cache.clear()  # Compare cold paths; the response cache would flatter the fan-out
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                requests = run(tour)
+                timings.append((time.perf_counter() - start) * 1000)
+        self.stdout.write(
+            f'{stops:>6} {name:>8} {requests:>9} {len(queries):>8} {statistics.median(timings):>10.2f}'
+        )
@@ -0,0 +1,80 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from core.models import Location, TextSnippet, Tour, TourStop
+from core.serializers import LocationValuesSerializer, TextSnippetValuesSerializer, TourValuesSerializer
+from core.views import TextSnippetViewSet, stops_prefetch
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Per-row cost of the ModelSerializer and .values() list paths (writes are rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self._populate(options['rows'])
+                cases = (
+                    ('location', LocationValuesSerializer, Location.objects.order_by('-id')),
+                    ('text_snippet', TextSnippetValuesSerializer, TextSnippetViewSet.queryset.order_by('-id')),
+                    ('tour', TourValuesSerializer, Tour.objects.prefetch_related(stops_prefetch()).order_by('-id')),
+                )
+                self.stdout.write(f'{"list":>13} {"path":>6} {"rows":>6} {"queries":>8} {"median ms":>10} {"us/row":>8}')
+                for name, values_serializer_class, queryset in cases:
+                    queryset = queryset[:options['rows']]
+
+                    def model_path():
+                        return values_serializer_class.serializer_class(list(queryset.all()), many=True).data
+
+                    def values_path():
+                        serializer = values_serializer_class()
+                        return serializer.to_representation(list(serializer.select(queryset.all())))
+
+                    for path, run in (('model', model_path), ('values', values_path)):
+                        self._report(name, path, run, options['repeat'])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _populate(self, rows):
+        locations = Location.objects.bulk_create([
+            Location(name=f'Bench location {index}', raw_text='A sentence about this place. ' * 20,
+                     latlon_json={'lat': 51.5, 'lon': -0.12})
+            for index in range(rows)
+        ], batch_size=1000)
+        TextSnippet.objects.bulk_create([
+            TextSnippet(location=location, length='short', text='A sentence about this place.', hash=str(location.pk))
+            for location in locations
+        ], batch_size=1000)
+        tours = Tour.objects.bulk_create([
+            Tour(name=f'Bench tour {index}', description='A tour') for index in range(rows)
+        ], batch_size=1000)
+        # Ten stops per tour, taken from a sliding window of locations
+        TourStop.objects.bulk_create([
+            TourStop(tour=tour, location=locations[(index + offset) % len(locations)], position=offset)
+            for index, tour in enumerate(tours)
+            for offset in range(10)
+        ], batch_size=5000)
+
+    def _report(self, name, path, run, repeat):
+        timings = []
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                data = run()
+                timings.append((time.perf_counter() - start) * 1000)
+        median = statistics.median(timings)
+        self.stdout.write(
+            f'{name:>13} {path:>6} {len(data):>6} {len(queries):>8} {median:>10.1f} {median * 1000 / len(data):>8.1f}'
+        )
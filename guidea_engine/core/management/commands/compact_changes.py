@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.utils.changes import DEFAULT_COMPACT_CHUNK_SIZE, compact_changes
+
+
+class Command(BaseCommand):
+    help = (
+        'Compact the sync change log: drop superseded entries and expired tombstones. '
+        'Run it on a schedule (e.g. daily from cron), or enqueue a compact_changes job.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_COMPACT_CHUNK_SIZE,
+                            help='Entries deleted per transaction')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive')
+
+        start = time.perf_counter()
+        stats = compact_changes(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Removed {stats["superseded"]} superseded entries and {stats["tombstones"]} expired tombstones '
+            f'in {time.perf_counter() - start:.1f}s'
+        ))
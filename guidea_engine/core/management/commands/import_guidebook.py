@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.utils.ingest import DEFAULT_CHUNK_SIZE, import_guidebook
+
+
+class Command(BaseCommand):
+    help = "Import a markdown guidebook, upserting one Location per loc_map section"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Markdown file with a loc_map in its front matter')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive')
+
+        start = time.perf_counter()
+        try:
+            stats = import_guidebook(options['path'], chunk_size=options['chunk_size'])
+        except OSError as e:
+            raise CommandError(f'Cannot read {options["path"]}: {e}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported in {time.perf_counter() - start:.1f}s: {stats["created"]} created, '
+            f'{stats["updated"]} updated, {stats["unchanged"]} unchanged'
+        ))
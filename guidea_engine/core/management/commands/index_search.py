@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Location
+from core.utils.search import DEFAULT_CHUNK_SIZE, index_locations, stale_documents
+
+
+class Command(BaseCommand):
+    help = 'Build search documents for locations whose document is missing or stale (or all with --all)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Rebuild every document')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive')
+        locations = Location.objects.all() if options['all'] else stale_documents()
+        start = time.perf_counter()
+        written = index_locations(
+            locations.order_by('pk').values_list('pk', flat=True).iterator(), chunk_size=options['chunk_size']
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {written} locations in {time.perf_counter() - start:.1f}s'
+        ))
@@ -0,0 +1,136 @@
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core.models import Location, Tour
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare requests/sec and latency of the hot read endpoints under WSGI and ASGI at high concurrency. '
+        'Start the servers first, against the same database, e.g. '
+        '`gunicorn guidea_engine.wsgi -w 4 --threads 8 -b :8000` and '
+        '`uvicorn guidea_engine.asgi:application --workers 4 --port 8001`.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wsgi', help='Base URL of the WSGI server, e.g. http://127.0.0.1:8000')
+        parser.add_argument('--asgi', help='Base URL of the ASGI server, e.g. http://127.0.0.1:8001')
+        parser.add_argument('--concurrency', type=int, default=200, help='Open connections sending requests')
+        parser.add_argument('--requests', type=int, default=5000, help='Requests per server')
+        parser.add_argument('--warmup', type=int, default=200, help='Untimed requests sent first')
+        parser.add_argument('--username', help='User to mint an access token for (default: first active user)')
+        parser.add_argument('--paths', nargs='+', help='Paths to cycle through (default: bundle, detail, '
+                                                       'snippets and nearby for existing rows)')
+
+    def handle(self, *args, **options):
+        targets = [(name, options[name]) for name in ('wsgi', 'asgi') if options[name]]
+        if not targets:
+            raise CommandError('Give --wsgi and/or --asgi')
+        if options['concurrency'] < 1 or options['requests'] < 1:
+            raise CommandError('--concurrency and --requests must be positive')
+
+        token = self._token(options['username'])
+        paths = options['paths'] or self._default_paths()
+        self.stdout.write(f'{len(paths)} paths, {options["requests"]} requests, concurrency {options["concurrency"]}')
+        self.stdout.write(f'{"server":>6} {"ok":>7} {"errors":>7} {"req/s":>9} {"p50 ms":>8} {"p99 ms":>8}')
+
+        for name, base_url in targets:
+            asyncio.run(self._run(base_url, paths, token, options['concurrency'], options['warmup']))
+            ok, errors, elapsed, latencies = asyncio.run(
+                self._run(base_url, paths, token, options['concurrency'], options['requests'])
+            )
+            latencies.sort()
+            p50 = statistics.median(latencies) if latencies else 0
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] if latencies else 0
+            self.stdout.write(
+                f'{name:>6} {ok:>7} {errors:>7} {ok / elapsed:>9.1f} {p50 * 1000:>8.1f} {p99 * 1000:>8.1f}'
+            )
+
+    def _token(self, username):
+        users = User.objects.filter(is_active=True)
+        user = users.filter(username=username).first() if username else users.order_by('pk').first()
+        if user is None:
+            raise CommandError('No active user to authenticate as; create one or pass --username')
+        return str(AccessToken.for_user(user))
+
+    def _default_paths(self):
+        paths = []
+        tour = Tour.objects.filter(stops__isnull=False).order_by('pk').first()
+        if tour is not None:
+            paths.append(f'/api/tours/{tour.pk}/bundle/?length=medium')
+        location = Location.objects.exclude(geohash='').order_by('pk').first() or Location.objects.first()
+        if location is not None:
+            paths += [f'/api/locations/{location.pk}/', f'/api/locations/{location.pk}/snippets/']
+            lat_lon = location.latlon_json or {}
+            if 'lat' in lat_lon and ('lon' in lat_lon or 'lng' in lat_lon):
+                lon = lat_lon.get('lon', lat_lon.get('lng'))
+                paths.append(f'/api/locations/nearby/?lat={lat_lon["lat"]}&lon={lon}&radius=5')
+        if not paths:
+            raise CommandError('No tours or locations to request; pass --paths')
+        return paths
+
+    async def _run(self, base_url, paths, token, concurrency, total):
+        url = urlsplit(base_url)
+        host, port = url.hostname, url.port or 80
+        remaining = iter(range(total))
+        latencies = []
+        errors = 0
+
+        async def worker():
+            nonlocal errors
+            connection = None
+            for index in remaining:
+                path = paths[index % len(paths)]
+                start = time.perf_counter()
+                try:
+                    if connection is None:
+                        connection = await asyncio.open_connection(host, port)
+                    status, keep_alive = await self._get(*connection, url.netloc, path, token)
+                except (OSError, asyncio.IncompleteReadError, ValueError):
+                    status, keep_alive = None, False
+                if status is not None and 200 <= status < 400:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors += 1
+                if not keep_alive and connection is not None:
+                    connection[1].close()
+                    connection = None
+            if connection is not None:
+                connection[1].close()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return len(latencies), errors, time.perf_counter() - start, latencies
+
+    async def _get(self, reader, writer, netloc, path, token):
+        """One keep-alive GET; returns (status, keep_alive) after draining the body"""
+        writer.write(
+            f'GET {path} HTTP/1.1\r\nHost: {netloc}\r\nAuthorization: Bearer {token}\r\n'
+            f'Accept: application/json\r\n\r\n'.encode()
+        )
+        await writer.drain()
+        head = await reader.readuntil(b'\r\n\r\n')
+        lines = head.decode('latin-1').split('\r\n')
+        status = int(lines[0].split(' ', 2)[1])
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip().lower()
+
+        if 'content-length' in headers:
+            await reader.readexactly(int(headers['content-length']))
+        elif headers.get('transfer-encoding') == 'chunked':
+            while size := int((await reader.readline()).split(b';')[0], 16):
+                await reader.readexactly(size + 2)
+            await reader.readline()
+        elif status not in (204, 304):
+            await reader.read()  # Body ends when the server closes
+            return status, False
+        return status, headers.get('connection') != 'close'
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.utils.tokens import DEFAULT_PRUNE_CHUNK_SIZE, prune_expired_tokens, token_table_stats
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete expired refresh tokens from the simplejwt outstanding and blacklist tables. '
+        'Run it on a schedule (e.g. hourly from cron), or enqueue a prune_tokens job.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_PRUNE_CHUNK_SIZE,
+                            help='Rows deleted per transaction')
+        parser.add_argument('--pause', type=float, default=0.0, help='Seconds to sleep between chunks')
+        parser.add_argument('--stats', action='store_true', help='Only report table sizes')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive')
+
+        self._report(token_table_stats())
+        if options['stats']:
+            return
+
+        start = time.perf_counter()
+        stats = prune_expired_tokens(chunk_size=options['chunk_size'], pause=options['pause'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Pruned {stats["outstanding"]} expired tokens ({stats["blacklisted"]} blacklisted) '
+            f'in {stats["chunks"]} chunks, {time.perf_counter() - start:.1f}s'
+        ))
+
+    def _report(self, stats):
+        for table in ('outstanding', 'blacklisted'):
+            size = stats[f'{table}_bytes']
+            self.stdout.write(
+                f'{table}: {stats[f"{table}_rows"]} rows' + (f', {size / 2 ** 20:.1f} MiB' if size is not None else '')
+            )
+        self.stdout.write(f'expired: {stats["expired_rows"]} rows')
@@ -0,0 +1,63 @@
+import os
+import socket
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections, connection
+
+from core.utils.jobs import HANDLERS, claim_job, requeue_stale_jobs, run_job
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs (snippet generation, audio synthesis, tour stitching)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=2, help='Jobs run in parallel by this worker')
+        parser.add_argument('--kinds', nargs='+', choices=sorted(HANDLERS), help='Only run these job kinds')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is drained')
+
+    def handle(self, *args, **options):
+        worker = f'{socket.gethostname()}:{os.getpid()}'
+        requeue_stale_jobs()
+        self.stdout.write(f'Worker {worker} running {options["concurrency"]} slot(s)')
+
+        stop = threading.Event()
+        slots = [
+            threading.Thread(target=self._slot, args=(f'{worker}:{index}', options, stop), daemon=True)
+            for index in range(options['concurrency'])
+        ]
+        for slot in slots:
+            slot.start()
+        try:
+            for slot in slots:
+                while slot.is_alive():
+                    slot.join(timeout=0.5)
+        except KeyboardInterrupt:
+            stop.set()
+            self.stdout.write('Stopping after running jobs finish')
+            for slot in slots:
+                slot.join()
+
+    def _slot(self, worker_id, options, stop):
+        try:
+            while not stop.is_set():
+                close_old_connections()
+                try:
+                    job = claim_job(worker_id, options['kinds'])
+                except DatabaseError as e:
+                    # Lock contention or a dropped connection; try again next poll
+                    self.stderr.write(f'[{worker_id}] claim failed: {e}')
+                    stop.wait(options['poll_interval'])
+                    continue
+                if job is None:
+                    if options['once']:
+                        return
+                    stop.wait(options['poll_interval'])
+                    continue
+                started = time.perf_counter()
+                job = run_job(job)
+                self.stdout.write(f'[{worker_id}] {job} in {time.perf_counter() - started:.2f}s')
+        finally:
+            connection.close()
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import TextSnippet
+from core.utils.snippets import DEFAULT_CHUNK_SIZE
+from core.utils.tts import synthesise_snippets
+
+
+class Command(BaseCommand):
+    help = 'Synthesise audio for current text snippets that have none for the voice'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--voice', help='Voice id (defaults to TTS_DEFAULT_VOICE)')
+        parser.add_argument('--ids', type=int, nargs='+', help='Only snippets of these location ids')
+        parser.add_argument('--length', choices=[choice for choice, _ in TextSnippet.LENGTH_CHOICES])
+        parser.add_argument('--workers', type=int, help='Synthesis threads (defaults to TTS_WORKERS)')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive')
+
+        snippets = TextSnippet.objects.all()
+        if options['ids']:
+            snippets = snippets.filter(location_id__in=options['ids'])
+        if options['length']:
+            snippets = snippets.filter(length=options['length'])
+
+        start = time.perf_counter()
+        stats = synthesise_snippets(
+            snippets,
+            voice_id=options['voice'],
+            workers=options['workers'],
+            chunk_size=options['chunk_size'],
+        )
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Created audio for {stats["snippets"]} snippets in {elapsed:.1f}s: '
+            f'{stats["synthesised"]} texts synthesised, {stats["reused"]} reused from storage'
+        ))
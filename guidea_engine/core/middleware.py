@@ -0,0 +1,209 @@
+import zlib
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+from django.utils.cache import patch_vary_headers
+
+from .utils import metrics
+
+try:
+    import brotli
+except ImportError:  # Optional; without it only gzip is offered
+    brotli = None
+
+
+class PerformanceMiddleware:
+    """
+    Records wall time, query count and time, serializer time and response
+    size per view action. Adds a Server-Timing header, feeds /metrics and logs
+    requests slower than PERFORMANCE_SLOW_REQUEST_MS. Works under WSGI and ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        # Covers a connection opened before the connection_created hook was connected
+        metrics.instrument_connection(connection)
+        token = metrics.begin_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            request_metrics = metrics.end_request(token)
+        return self.finish(request, response, request_metrics)
+
+    async def __acall__(self, request):
+        token = metrics.begin_request()
+        try:
+            response = await self.get_response(request)
+        finally:
+            request_metrics = metrics.end_request(token)
+        return self.finish(request, response, request_metrics)
+
+    def finish(self, request, response, request_metrics):
+        duration = request_metrics.elapsed
+        view = metrics.view_label(request)
+        if response.has_header('Content-Length'):
+            response_bytes = int(response['Content-Length'])
+        elif response.streaming:
+            response_bytes = 0
+        else:
+            response_bytes = len(response.content)
+        metrics.registry.observe(view, request.method, response.status_code, duration, request_metrics, response_bytes)
+
+        if settings.PERFORMANCE_SERVER_TIMING:
+            response['Server-Timing'] = (
+                f'app;dur={duration * 1000:.1f}, '
+                f'db;dur={request_metrics.db_time * 1000:.1f};desc="{request_metrics.queries} queries", '
+                f'ser;dur={request_metrics.serializer_time * 1000:.1f}'
+            )
+        if duration * 1000 >= settings.PERFORMANCE_SLOW_REQUEST_MS:
+            metrics.logger.warning(
+                'Slow request %s %s (%s): %.1f ms, %d queries in %.1f ms, serializer %.1f ms, %d bytes',
+                request.method, request.path, view, duration * 1000, request_metrics.queries,
+                request_metrics.db_time * 1000, request_metrics.serializer_time * 1000, response_bytes,
+            )
+        return response
+
+
+class GzipEncoder:
+    def __init__(self):
+        # wbits=31 writes the gzip header and trailer around the deflate stream
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class BrotliEncoder:
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=5)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+def accepted_encodings(header):
+    """Content codings in an Accept-Encoding header with a non-zero q"""
+    encodings = set()
+    for item in header.split(','):
+        coding, _, params = item.partition(';')
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                if float(params[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        encodings.add(coding.strip().lower())
+    return encodings
+
+
+class CompressionMiddleware:
+    """
+    Brotli (when installed) or gzip for GET/HEAD responses of at least
+    COMPRESSION_MIN_BYTES. Streaming responses are compressed chunk by chunk
+    without being buffered; archives, audio and images are sent as they are.
+    Responses to writes are left alone, since login and refresh bodies carry
+    tokens (BREACH). Works under WSGI and ASGI.
+
+    Strong ETags on compressed bodies are weakened (W/), as GZipMiddleware
+    does, since the encoded bytes differ from the identity ones; the
+    conditional request checks ignore the prefix. Octet-stream bodies and
+    anything advertising byte ranges are left alone so ranges stay valid.
+    """
+    sync_capable = True
+    async_capable = True
+
+    incompressible_types = (
+        'application/zip', 'application/gzip', 'application/octet-stream', 'audio/', 'image/', 'video/',
+    )
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return self.compress(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.compress(request, await self.get_response(request))
+
+    def encoder(self, request, response):
+        if request.method not in ('GET', 'HEAD') or response.status_code != 200:
+            return None
+        if response.has_header('Content-Encoding') or response.has_header('Accept-Ranges'):
+            return None
+        if response.get('Content-Type', '').startswith(self.incompressible_types):
+            return None
+        if response.has_header('Content-Length'):
+            length = int(response['Content-Length'])
+        else:
+            length = None if response.streaming else len(response.content)
+        if length is not None and length < settings.COMPRESSION_MIN_BYTES:
+            return None
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encodings = accepted_encodings(request.headers.get('Accept-Encoding', ''))
+        if brotli is not None and 'br' in encodings:
+            return 'br', BrotliEncoder()
+        if 'gzip' in encodings:
+            return 'gzip', GzipEncoder()
+        return None
+
+    def compress(self, request, response):
+        selected = self.encoder(request, response)
+        if selected is None:
+            return response
+        encoding, encoder = selected
+
+        if response.streaming:
+            # Flushing after each chunk keeps streamed responses flowing at a small cost in ratio
+            chunks = response.streaming_content
+            if response.is_async:
+                async def compressed():
+                    async for chunk in chunks:
+                        yield encoder.compress(chunk) + encoder.flush()
+                    yield encoder.finish()
+            else:
+                def compressed():
+                    for chunk in chunks:
+                        yield encoder.compress(chunk) + encoder.flush()
+                    yield encoder.finish()
+            response.streaming_content = compressed()
+            del response['Content-Length']
+        else:
+            content = encoder.compress(response.content) + encoder.finish()
+            if len(content) >= len(response.content):
+                return response
+            response.content = content
+            response['Content-Length'] = str(len(content))
+        response['Content-Encoding'] = encoding
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.3 on 2026-10-18 14:25
+
+from django.db import migrations, models
+
+from core.utils.geo import geohash_for
+
+
+def backfill_geohash(apps, schema_editor):
+    """
+    Compute the spatial index cell for every existing location
+    """
+    Location = apps.get_model('core', 'Location')
+    batch = []
+    for location in Location.objects.only('id', 'latlon_json').iterator(chunk_size=2000):
+        location.geohash = geohash_for(location.latlon_json)
+        batch.append(location)
+        if len(batch) >= 2000:
+            Location.objects.bulk_update(batch, ['geohash'])
+            batch = []
+    if batch:
+        Location.objects.bulk_update(batch, ['geohash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_stitchcache_created_tour_created_tour_updated_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=12),
+        ),
+        migrations.RunPython(backfill_geohash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 14:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_location_geohash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='snippets_version',
+            field=models.IntegerField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.3 on 2026-10-18 14:31
+
+from django.db import migrations, models
+
+
+def demote_duplicate_current_snippets(apps, schema_editor):
+    """
+    Keep only the newest current snippet per (location, length) so the
+    uniqueness constraint can be created
+    """
+    TextSnippet = apps.get_model('core', 'TextSnippet')
+    seen = set()
+    duplicates = []
+    current = TextSnippet.objects.filter(is_current=True).order_by('location_id', 'length', '-created', '-id')
+    for snippet_id, location_id, length in current.values_list('id', 'location_id', 'length').iterator():
+        if (location_id, length) in seen:
+            duplicates.append(snippet_id)
+        else:
+            seen.add((location_id, length))
+    for start in range(0, len(duplicates), 1000):
+        TextSnippet.objects.filter(pk__in=duplicates[start:start + 1000]).update(is_current=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_location_snippets_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(demote_duplicate_current_snippets, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='audiosnippet',
+            index=models.Index(fields=['text_snippet', 'voice_id', 'is_current'], name='audiosnippet_snip_voice_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='audiosnippet',
+            index=models.Index(condition=models.Q(('is_current', True)), fields=['text_snippet', 'voice_id'], name='audiosnippet_current_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stitchcache',
+            index=models.Index(fields=['tour_id_or_hash', 'length', 'location_versions_hash'], name='stitchcache_lookup_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stitchcache',
+            index=models.Index(fields=['expires_at'], name='stitchcache_expires_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='textsnippet',
+            index=models.Index(fields=['location', 'length', 'is_current'], name='textsnippet_loc_len_cur_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='textsnippet',
+            index=models.Index(fields=['hash'], name='textsnippet_hash_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='textsnippet',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_current', True)), fields=('location', 'length'), name='textsnippet_one_current_per_length'),
+        ),
+    ]
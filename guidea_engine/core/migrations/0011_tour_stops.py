@@ -0,0 +1,87 @@
+# Generated by Django 5.2.3 on 2026-10-18 14:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+STOP_SPACING = 1024
+
+
+def backfill_tour_stops(apps, schema_editor):
+    """
+    Turn each tour's location_order_json list into ordered TourStop rows,
+    dropping duplicates and ids of locations that no longer exist
+    """
+    Tour = apps.get_model('core', 'Tour')
+    TourStop = apps.get_model('core', 'TourStop')
+    Location = apps.get_model('core', 'Location')
+
+    for tour in Tour.objects.only('id', 'location_order_json').iterator():
+        order = []
+        for location_id in tour.location_order_json or []:
+            try:
+                location_id = int(location_id)
+            except (TypeError, ValueError):
+                continue
+            if location_id not in order:
+                order.append(location_id)
+        existing = set(Location.objects.filter(pk__in=order).values_list('pk', flat=True))
+        TourStop.objects.bulk_create([
+            TourStop(tour_id=tour.pk, location_id=location_id, position=(index + 1) * STOP_SPACING)
+            for index, location_id in enumerate(location_id for location_id in order if location_id in existing)
+        ])
+
+
+def restore_location_order_json(apps, schema_editor):
+    Tour = apps.get_model('core', 'Tour')
+    TourStop = apps.get_model('core', 'TourStop')
+    for tour in Tour.objects.only('id').iterator():
+        tour.location_order_json = list(
+            TourStop.objects.filter(tour_id=tour.pk).order_by('position').values_list('location_id', flat=True)
+        )
+        tour.save(update_fields=['location_order_json'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_location_slug'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TourStop',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.BigIntegerField()),
+                ('location', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tour_stops', to='core.location')),
+                ('tour', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stops', to='core.tour')),
+            ],
+            options={
+                'ordering': ['position'],
+            },
+        ),
+        migrations.AddField(
+            model_name='tour',
+            name='locations',
+            field=models.ManyToManyField(related_name='tours', through='core.TourStop', to='core.location'),
+        ),
+        migrations.AddConstraint(
+            model_name='tourstop',
+            constraint=models.UniqueConstraint(fields=('tour', 'position'), name='tourstop_unique_position'),
+        ),
+        migrations.AddConstraint(
+            model_name='tourstop',
+            constraint=models.UniqueConstraint(fields=('tour', 'location'), name='tourstop_unique_location'),
+        ),
+        migrations.RunPython(backfill_tour_stops, restore_location_order_json),
+        # A default lets the column be re-added on rollback before restore_location_order_json fills it
+        migrations.AlterField(
+            model_name='tour',
+            name='location_order_json',
+            field=models.JSONField(default=list),
+        ),
+        migrations.RemoveField(
+            model_name='tour',
+            name='location_order_json',
+        ),
+    ]
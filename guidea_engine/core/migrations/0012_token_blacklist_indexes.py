@@ -0,0 +1,23 @@
+from django.db import migrations
+
+INDEX = 'token_blacklist_outstandingtoken_expires_at_idx'
+
+
+class Migration(migrations.Migration):
+    """
+    simplejwt's outstanding-token table has no index on expires_at, so pruning
+    expired rows scans the whole table. The jti and token_id lookups used by
+    blacklist checks are already covered by their unique constraints.
+    """
+
+    dependencies = [
+        ('core', '0011_tour_stops'),
+        ('token_blacklist', '0012_alter_outstandingtoken_user'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            f'CREATE INDEX IF NOT EXISTS {INDEX} ON token_blacklist_outstandingtoken (expires_at)',
+            f'DROP INDEX IF EXISTS {INDEX}',
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.3 on 2026-10-18 15:04
+
+import django.contrib.postgres.search
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def create_vector_index(apps, schema_editor):
+    # GIN indexes are Postgres-only; elsewhere core.utils.search keeps an in-process index
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('CREATE INDEX searchdocument_vector_gin ON core_searchdocument USING gin (vector)')
+
+
+def drop_vector_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS searchdocument_vector_gin')
+
+
+def backfill_search_documents(apps, schema_editor):
+    """One document per existing location, with its tsvector on Postgres"""
+    schema_editor.execute(
+        'INSERT INTO core_searchdocument (location_id, version, snippets_version, updated) '
+        'SELECT id, version, snippets_version, CURRENT_TIMESTAMP FROM core_location'
+    )
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            "UPDATE core_searchdocument d SET vector = "
+            "setweight(to_tsvector('english', l.name), 'A') || "
+            "setweight(to_tsvector('english', l.raw_text), 'B') || "
+            "setweight(to_tsvector('english', coalesce(("
+            "SELECT string_agg(s.text, ' ' ORDER BY s.length) FROM core_textsnippet s "
+            "WHERE s.location_id = l.id AND s.is_current), '')), 'C') "
+            "FROM core_location l WHERE l.id = d.location_id"
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_token_blacklist_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('location', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='core.location')),
+                ('version', models.IntegerField()),
+                ('snippets_version', models.IntegerField(blank=True, null=True)),
+                ('vector', django.contrib.postgres.search.SearchVectorField(editable=False, null=True)),
+                ('updated', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.RunPython(create_vector_index, drop_vector_index),
+        migrations.RunPython(backfill_search_documents, migrations.RunPython.noop),
+    ]
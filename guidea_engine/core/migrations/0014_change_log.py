@@ -0,0 +1,46 @@
+# Generated by Django 5.2.3 on 2026-10-18 15:09
+
+from django.db import migrations, models
+
+
+def seed_change_log(apps, schema_editor):
+    """One entry per existing row, oldest first, so a sync from cursor 0 returns the whole catalogue"""
+    Change = apps.get_model('core', 'Change')
+    sources = [
+        ('location', apps.get_model('core', 'Location'), 'updated'),
+        ('text_snippet', apps.get_model('core', 'TextSnippet'), 'updated'),
+        ('audio_snippet', apps.get_model('core', 'AudioSnippet'), 'created'),
+        ('tour', apps.get_model('core', 'Tour'), 'updated'),
+    ]
+    for kind, model, ordering in sources:
+        batch = []
+        for object_id in model.objects.order_by(ordering, 'id').values_list('id', flat=True).iterator():
+            batch.append(Change(kind=kind, object_id=object_id))
+            if len(batch) == 5000:
+                Change.objects.bulk_create(batch)
+                batch = []
+        Change.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_search_documents'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('location', 'Location'), ('text_snippet', 'Text snippet'), ('audio_snippet', 'Audio snippet'), ('tour', 'Tour')], max_length=20)),
+                ('object_id', models.BigIntegerField()),
+                ('deleted', models.BooleanField(default=False)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['kind', 'object_id', 'id'], name='change_object_idx'), models.Index(condition=models.Q(('deleted', True)), fields=['created'], name='change_tombstone_idx')],
+            },
+        ),
+        migrations.RunPython(seed_change_log, migrations.RunPython.noop),
+    ]
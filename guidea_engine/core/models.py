@@ -1,17 +1,48 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.utils import timezone
+
+from .utils.geo import geohash_for
 
 
 class Location(models.Model):
     name = models.TextField()
+    slug = models.SlugField(max_length=255, unique=True, null=True, blank=True)  # Key from the source guidebook's loc_map
     raw_text = models.TextField()
     version = models.IntegerField(default=1)
+    snippets_version = models.IntegerField(null=True, blank=True, editable=False)  # version the current snippets were built from
     latlon_json = models.JSONField()
+    geohash = models.CharField(max_length=12, blank=True, default='', db_index=True, editable=False)
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        # Keep the spatial index cell in step with the coordinates
+        self.geohash = geohash_for(self.latlon_json)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'latlon_json' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'geohash'}
+        super().save(*args, **kwargs)
+
+
+class SearchDocument(models.Model):
+    """
+    Precomputed full-text entry for a location, covering its name, raw_text
+    and current snippets. Stale when the location's version or
+    snippets_version moves past the ones recorded here.
+    """
+    location = models.OneToOneField(Location, on_delete=models.CASCADE, primary_key=True, related_name='search_document')
+    version = models.IntegerField()
+    snippets_version = models.IntegerField(null=True, blank=True)
+    vector = SearchVectorField(null=True, editable=False)  # Postgres only, GIN-indexed by migration 0013
+    updated = models.DateTimeField(default=timezone.now, db_index=True)  # Set on every rebuild; the in-process index syncs from it
+
+    def __str__(self):
+        return f"Search document for location {self.location_id}"
+
 
 class TextSnippet(models.Model):
     LENGTH_CHOICES = [
@@ -27,6 +58,20 @@ class TextSnippet(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['location', 'length', 'is_current'], name='textsnippet_loc_len_cur_idx'),
+            models.Index(fields=['hash'], name='textsnippet_hash_idx'),
+        ]
+        constraints = [
+            # Also serves as the partial index for "current snippet for location X"
+            models.UniqueConstraint(
+                fields=['location', 'length'],
+                condition=models.Q(is_current=True),
+                name='textsnippet_one_current_per_length',
+            ),
+        ]
+
     def __str__(self):
         return f"{self.location.name} - {self.length}"
 
@@ -38,6 +83,16 @@ class AudioSnippet(models.Model):
     is_current = models.BooleanField(default=False)
     created = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['text_snippet', 'voice_id', 'is_current'], name='audiosnippet_snip_voice_idx'),
+            models.Index(
+                fields=['text_snippet', 'voice_id'],
+                condition=models.Q(is_current=True),
+                name='audiosnippet_current_idx',
+            ),
+        ]
+
     def __str__(self):
         return f"Audio for {self.text_snippet}"
 
@@ -45,13 +100,36 @@ class AudioSnippet(models.Model):
 class Tour(models.Model):
     name = models.TextField()
     description = models.TextField()
-    location_order_json = models.JSONField()
+    locations = models.ManyToManyField(Location, through='TourStop', related_name='tours')
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
 
+    @property
+    def location_order(self):
+        """Location ids in tour order; uses prefetched stops when available"""
+        if 'stops' in getattr(self, '_prefetched_objects_cache', {}):
+            return [stop.location_id for stop in self.stops.all()]
+        return list(self.stops.values_list('location_id', flat=True))
+
+
+class TourStop(models.Model):
+    tour = models.ForeignKey(Tour, on_delete=models.CASCADE, related_name='stops')
+    location = models.ForeignKey(Location, on_delete=models.CASCADE, related_name='tour_stops')
+    position = models.BigIntegerField()  # Sparse, so a stop can be placed between two others without renumbering
+
+    class Meta:
+        ordering = ['position']
+        constraints = [
+            models.UniqueConstraint(fields=['tour', 'position'], name='tourstop_unique_position'),
+            models.UniqueConstraint(fields=['tour', 'location'], name='tourstop_unique_location'),
+        ]
+
+    def __str__(self):
+        return f"{self.tour} #{self.position}: {self.location}"
+
 
 class StitchCache(models.Model):
     tour_id_or_hash = models.TextField()
@@ -61,5 +139,67 @@ class StitchCache(models.Model):
     expires_at = models.DateTimeField()
     created = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['tour_id_or_hash', 'length', 'location_versions_hash'], name='stitchcache_lookup_idx'),
+            models.Index(fields=['expires_at'], name='stitchcache_expires_idx'),
+        ]
+
     def __str__(self):
         return f"Cache for tour {self.tour_id_or_hash}"
+
+
+class Job(models.Model):
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+    kind = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)  # Pushed back between retries
+    locked_by = models.TextField(blank=True, default='')
+    locked_at = models.DateTimeField(null=True, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='job_claim_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} job {self.pk} ({self.status})"
+
+
+class Change(models.Model):
+    """
+    Append-only log of client-visible row changes, read by the sync endpoint.
+    The id doubles as the sync cursor; deleted rows leave a tombstone.
+    """
+    KIND_CHOICES = [
+        ('location', 'Location'),
+        ('text_snippet', 'Text snippet'),
+        ('audio_snippet', 'Audio snippet'),
+        ('tour', 'Tour'),
+    ]
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    deleted = models.BooleanField(default=False)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Finds superseded entries when compacting the log
+            models.Index(fields=['kind', 'object_id', 'id'], name='change_object_idx'),
+            models.Index(fields=['created'], condition=models.Q(deleted=True), name='change_tombstone_idx'),
+        ]
+
+    def __str__(self):
+        return f"{'Deleted' if self.deleted else 'Changed'} {self.kind} {self.object_id}"
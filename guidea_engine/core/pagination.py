@@ -0,0 +1,9 @@
+from rest_framework.pagination import CursorPagination
+
+
+class CreatedCursorPagination(CursorPagination):
+    """Newest first, paged by an opaque cursor on (created, id)"""
+    ordering = ('-created', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
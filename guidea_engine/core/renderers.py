@@ -0,0 +1,65 @@
+"""
+Faster renderers clients can opt into through Accept; the default stays
+DRF's JSONRenderer.
+
+    Accept: application/json; encoder=orjson    same JSON, encoded by orjson
+    Accept: application/msgpack                 MessagePack (needs msgpack)
+
+Values neither format supports natively go through DRF's JSONEncoder, so
+decimals, dates and lazy strings come out as they do in the JSON responses.
+"""
+import orjson
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.mediatypes import media_type_matches
+
+try:
+    import msgpack
+except ImportError:  # Optional; settings only offer the renderer when it is installed
+    msgpack = None
+
+_encoder = JSONEncoder()
+
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_UTC_Z
+
+
+class ORJSONRenderer(BaseRenderer):
+    # The parameter keeps plain application/json and */* on JSONRenderer
+    media_type = 'application/json; encoder=orjson'
+    format = 'orjson'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return orjson.dumps(data, default=_encoder.default, option=ORJSON_OPTIONS)
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=_encoder.default, use_bin_type=True)
+
+
+ALTERNATE_RENDERERS = (ORJSONRenderer, MessagePackRenderer)
+
+
+def wants_alternate_renderer(request):
+    """True when ?format= or Accept asks for one of the renderers above"""
+    if request.GET.get('format') in {renderer.format for renderer in ALTERNATE_RENDERERS}:
+        return True
+    # Wildcards resolve to JSONRenderer, listed ahead of MessagePackRenderer
+    accepts = [
+        media_type.strip() for media_type in request.headers.get('Accept', '').split(',')
+        if '*' not in media_type.partition(';')[0]
+    ]
+    return any(
+        media_type_matches(renderer.media_type, media_type)
+        for renderer in ALTERNATE_RENDERERS for media_type in accepts
+    )
@@ -1,23 +1,59 @@
-from rest_framework import serializers
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
-from .models import Location, TextSnippet, AudioSnippet, Tour
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from .models import Location, TextSnippet, AudioSnippet, Tour, TourStop, Job
+from .utils.metrics import serializer_timer
+from .utils.tours import TourOrderError, invalidate_stitches_for_locations, set_location_order, validate_location_order
 
 
-class LocationSerializer(serializers.ModelSerializer):
+class DynamicFieldsMixin:
+    """
+    Takes an optional `fields` argument naming the subset of fields to serialize
+    """
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
+
+
+class TimedSerializerMixin:
+    """Counts serialization and validation time towards the request's metrics"""
+
+    def to_representation(self, instance):
+        with serializer_timer():
+            return super().to_representation(instance)
+
+    def run_validation(self, data=serializers.empty):
+        with serializer_timer():
+            return super().run_validation(data)
+
+
+class LocationSerializer(TimedSerializerMixin, DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Location
-        fields = ['id', 'name', 'raw_text', 'version', 'latlon_json', 'created', 'updated']
+        fields = ['id', 'name', 'slug', 'raw_text', 'version', 'latlon_json', 'created', 'updated']
         read_only_fields = ['created', 'updated']
 
     def update(self, instance, validated_data):
-        # Increment version on content changes
+        # Increment version on content changes. The increment happens in SQL so
+        # concurrent editors cannot both write the same version number.
         if 'raw_text' in validated_data and validated_data['raw_text'] != instance.raw_text:
-            validated_data['version'] = instance.version + 1
+            validated_data['version'] = F('version') + 1
+            invalidate_stitches_for_locations([instance.pk])
+            instance = super().update(instance, validated_data)
+            instance.refresh_from_db(fields=['version'])
+            return instance
         return super().update(instance, validated_data)
 
 
-class TextSnippetSerializer(serializers.ModelSerializer):
+class TextSnippetSerializer(TimedSerializerMixin, DynamicFieldsMixin, serializers.ModelSerializer):
     location_name = serializers.CharField(source='location.name', read_only=True)
     
     class Meta:
@@ -26,7 +62,7 @@ class TextSnippetSerializer(serializers.ModelSerializer):
         read_only_fields = ['created', 'updated', 'hash']
 
 
-class AudioSnippetSerializer(serializers.ModelSerializer):
+class AudioSnippetSerializer(TimedSerializerMixin, DynamicFieldsMixin, serializers.ModelSerializer):
     text_snippet_info = serializers.SerializerMethodField()
     
     class Meta:
@@ -41,7 +77,11 @@ class AudioSnippetSerializer(serializers.ModelSerializer):
         }
 
 
-class TourSerializer(serializers.ModelSerializer):
+class TourSerializer(TimedSerializerMixin, DynamicFieldsMixin, serializers.ModelSerializer):
+    # Kept under its old name for clients; backed by the tour's TourStop rows
+    location_order_json = serializers.ListField(
+        child=serializers.IntegerField(), source='location_order', required=False
+    )
     location_count = serializers.SerializerMethodField()
     
     class Meta:
@@ -50,10 +90,148 @@ class TourSerializer(serializers.ModelSerializer):
         read_only_fields = ['created', 'updated']
     
     def get_location_count(self, obj):
-        return len(obj.location_order_json) if obj.location_order_json else 0
+        return len(obj.location_order)
+
+    def validate_location_order_json(self, value):
+        try:
+            validate_location_order(value)
+        except TourOrderError as e:
+            raise serializers.ValidationError(str(e))
+        return value
+
+    def create(self, validated_data):
+        location_order = validated_data.pop('location_order', [])
+        with transaction.atomic():
+            tour = super().create(validated_data)
+            set_location_order(tour, location_order)
+        return tour
+
+    def update(self, instance, validated_data):
+        location_order = validated_data.pop('location_order', None)
+        with transaction.atomic():
+            tour = super().update(instance, validated_data)
+            if location_order is not None:
+                set_location_order(tour, location_order)
+        return tour
+
+
+class ValuesSerializer:
+    """
+    Read-only fast path for a ModelSerializer's lists. Rows are read with
+    .values() and converted with serializer_class's own fields, so the output
+    is identical without building model instances or walking the serializer
+    for every row.
+
+    Fields map to columns through their source (location.name reads
+    location__name). annotations maps fields computed in SQL to a function
+    building the expression; fields named in computed are filled in by
+    add_computed once the page is read.
+    """
+    serializer_class = None
+    annotations = {}
+    computed = ()
+
+    def __init__(self, fields=None):
+        # (field name, values() key, serializer field); computed fields keep their place in the
+        # field order with a None key
+        self.columns = []
+        for name, field in self.serializer_class(fields=fields).fields.items():
+            if field.write_only:
+                continue
+            if name in self.computed:
+                self.columns.append((name, None, None))
+            elif name in self.annotations:
+                self.columns.append((name, name, None))
+            else:
+                self.columns.append((name, field.source.replace('.', '__'), field))
+        self.computed_fields = [name for name, key, _ in self.columns if key is None]
+
+    @staticmethod
+    def converter(field):
+        """Function from a .values() value to its representation, or None when they are the same"""
+        if field is None or isinstance(field, (serializers.IntegerField, serializers.CharField,
+                                               serializers.PrimaryKeyRelatedField)):
+            return None
+        if isinstance(field, serializers.DateTimeField) and (
+            getattr(field, 'format', api_settings.DATETIME_FORMAT) or ''
+        ).lower() == ISO_8601:
+            # DateTimeField.to_representation, with the time zone looked up once rather than per value
+            zone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+
+            def convert(value):
+                if zone is None or value.utcoffset() is None:
+                    return field.to_representation(value)
+                value = value.astimezone(zone).isoformat()
+                return value[:-6] + 'Z' if value.endswith('+00:00') else value
+            return convert
+        return field.to_representation
+
+    def select(self, queryset, extra=()):
+        """queryset as .values() rows carrying the selected fields, plus the extra keys"""
+        keys = [key for name, key, _ in self.columns if key is not None]
+        annotations = {key: self.annotations[key]() for key in keys if key in self.annotations}
+        keys += [key for key in extra if key not in keys]
+        return queryset.prefetch_related(None).annotate(**annotations).values(*keys)
+
+    def to_representation(self, rows):
+        with serializer_timer():
+            columns = [(name, key, self.converter(field)) for name, key, field in self.columns]
+            data = [
+                {
+                    name: row.get(key) if convert is None or row[key] is None else convert(row[key])
+                    for name, key, convert in columns
+                }
+                for row in rows
+            ]
+            if self.computed_fields:
+                self.add_computed(rows, data)
+        return data
+
+    def add_computed(self, rows, data):
+        raise NotImplementedError
+
+
+def tour_stop_count():
+    """Stops per tour as a correlated subquery, unaffected by joins in the outer query"""
+    stops = TourStop.objects.filter(tour=OuterRef('pk')).order_by().values('tour').annotate(count=Count('pk'))
+    return Coalesce(Subquery(stops.values('count')), 0)
+
+
+class LocationValuesSerializer(ValuesSerializer):
+    serializer_class = LocationSerializer
+
+
+class TextSnippetValuesSerializer(ValuesSerializer):
+    serializer_class = TextSnippetSerializer
+
+
+class TourValuesSerializer(ValuesSerializer):
+    serializer_class = TourSerializer
+    annotations = {'location_count': tour_stop_count}
+    computed = ('location_order_json',)
+
+    def select(self, queryset, extra=()):
+        # Stops are looked up by tour id
+        return super().select(queryset, extra=(*extra, 'id'))
+
+    def add_computed(self, rows, data):
+        orders = {row['id']: [] for row in rows}
+        stops = TourStop.objects.filter(tour_id__in=orders).order_by('tour_id', 'position')
+        for tour_id, location_id in stops.values_list('tour_id', 'location_id'):
+            orders[tour_id].append(location_id)
+        for row, item in zip(rows, data):
+            item['location_order_json'] = orders[row['id']]
+
+
+class JobSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Job
+        fields = ['id', 'kind', 'payload', 'status', 'result', 'error', 'attempts', 'max_attempts',
+                  'run_after', 'created', 'updated']
+        read_only_fields = fields
 
 
-class UserRegistrationSerializer(serializers.ModelSerializer):
+class UserRegistrationSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, min_length=8)
     password_confirm = serializers.CharField(write_only=True)
 
@@ -72,7 +250,7 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         return user
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ('id', 'username', 'email', 'first_name', 'last_name', 'date_joined')
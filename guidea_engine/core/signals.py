@@ -0,0 +1,64 @@
+from django.contrib.auth.models import User
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .authentication import forget_user
+from .models import AudioSnippet, Location, TextSnippet, Tour, TourStop
+from .utils import metrics, response_cache
+from .utils.changes import record_changes
+from .utils.search import index_locations_on_commit
+
+SYNC_KINDS = {Location: 'location', TextSnippet: 'text_snippet', AudioSnippet: 'audio_snippet', Tour: 'tour'}
+
+# Row-by-row saves and deletes (serializers, admin, cascades)
+# invalidate cached responses here. Bulk writes bypass these signals and call
+# response_cache themselves.
+
+
+@receiver([post_save, post_delete], sender=Location)
+def invalidate_location_responses(sender, instance, **kwargs):
+    response_cache.invalidate_location(instance.pk)
+
+
+@receiver(post_save, sender=Location)
+def index_location(sender, instance, **kwargs):
+    index_locations_on_commit([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=TextSnippet)
+def invalidate_snippet_responses(sender, instance, **kwargs):
+    response_cache.invalidate_snippets([instance.location_id])
+
+
+@receiver([post_save, post_delete], sender=Tour)
+def invalidate_tour_responses(sender, instance, **kwargs):
+    response_cache.invalidate_tour(instance.pk)
+
+
+@receiver(post_delete, sender=TourStop)
+def invalidate_tour_stop_responses(sender, instance, **kwargs):
+    # Catches stops cascaded away with their location; core.utils.tours
+    # touches the tour itself for deliberate edits
+    response_cache.invalidate_tour(instance.tour_id)
+    record_changes('tour', [instance.tour_id])
+
+
+@receiver([post_save, post_delete], sender=User)
+def forget_user_state(sender, instance, **kwargs):
+    # Other processes notice within JWT_STATE_CACHE_TTL
+    forget_user(instance.pk)
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    metrics.instrument_connection(connection)
+
+
+@receiver([post_save, post_delete], sender=Location)
+@receiver([post_save, post_delete], sender=TextSnippet)
+@receiver([post_save, post_delete], sender=AudioSnippet)
+@receiver([post_save, post_delete], sender=Tour)
+def record_sync_change(sender, instance, signal, **kwargs):
+    # Feeds the sync change log; bulk writes record their own changes
+    record_changes(SYNC_KINDS[sender], [instance.pk], deleted=signal is post_delete)
@@ -1,3 +1,1287 @@
-from django.test import TestCase
+import gzip
+import io
+import hashlib
+import json
+import multiprocessing
+import random
+import tempfile
+import threading
+import wave
+import zipfile
+from datetime import timedelta
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import IntegrityError, connection, connections, transaction
+from django.test import TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.contrib.postgres.search import SearchQuery
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from . import async_views, authentication
+from .models import Location, TextSnippet, AudioSnippet, Tour, TourStop, StitchCache, SearchDocument, Job, Change
+from .renderers import msgpack
+from .serializers import LocationValuesSerializer, TextSnippetValuesSerializer, TourValuesSerializer
+from .utils import stitching
+from .utils.ingest import import_guidebook
+from .utils.geo import find_nearby, geohash_for, haversine_km
+from .utils.jobs import claim_job, enqueue, run_job
+from .utils.markdown_parser import extract_locations_from_document, iter_document_sections
+from .utils.metrics import registry
+from .utils.search import inverted_index, search_locations, stale_documents
+from .utils.snippets import (
+    changed_locations, generate_snippets_bulk, snippet_hash, summarise_texts, summary_key, summary_pool,
+    sync_location_snippets,
+)
+from .utils.summarisers import TextRankSummariser, TruncateSummariser, get_summariser
+from .utils.stitching import get_or_build_stitch
+from .utils.tokens import prune_expired_tokens
+from .utils.tours import set_location_order
+from .utils.tts import get_backend, synthesise_snippets
+
+
+class QueryCountMixin:
+    """
+    Harness for asserting that an endpoint's query count does not grow with
+    the number of rows it returns.
+    """
+    row_counts = (1, 5, 25)
+
+    def count_queries(self, url):
+        # Measure the uncached path
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def assertConstantQueries(self, url, add_rows):
+        """Grow the table through add_rows(n) and check url's query count never changes"""
+        counts = {}
+        total = 0
+        for row_count in self.row_counts:
+            add_rows(row_count - total)
+            total = row_count
+            counts[row_count] = self.count_queries(url)
+        self.assertEqual(len(set(counts.values())), 1, f'{url} query count varies with row count: {counts}')
+
+
+class ListQueryCountTests(QueryCountMixin, TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('reader', password='password123'))
+        self.sequence = 0
+
+    def make_location(self):
+        self.sequence += 1
+        return Location.objects.create(
+            name=f'Location {self.sequence}',
+            raw_text='Some text about the place.',
+            latlon_json={'lat': 48.85, 'lon': 2.35},
+        )
+
+    def make_text_snippet(self):
+        return TextSnippet.objects.create(
+            location=self.make_location(), length='short', text='Short text', hash='abc', is_current=True
+        )
+
+    def add_locations(self, count):
+        for _ in range(count):
+            self.make_location()
+
+    def add_text_snippets(self, count):
+        for _ in range(count):
+            self.make_text_snippet()
+
+    def add_audio_snippets(self, count):
+        for _ in range(count):
+            AudioSnippet.objects.create(
+                text_snippet=self.make_text_snippet(), voice_id='default', audio_url='/a.mp3', is_current=True
+            )
+
+    def add_tours(self, count):
+        for _ in range(count):
+            tour = Tour.objects.create(name='Tour', description='')
+            set_location_order(tour, [self.make_location().pk, self.make_location().pk])
+
+    def test_location_list(self):
+        self.assertConstantQueries('/api/locations/', self.add_locations)
+
+    def test_text_snippet_list(self):
+        self.assertConstantQueries('/api/text-snippets/', self.add_text_snippets)
+
+    def test_audio_snippet_list(self):
+        self.assertConstantQueries('/api/audio-snippets/', self.add_audio_snippets)
+
+    def test_tour_list(self):
+        self.assertConstantQueries('/api/tours/', self.add_tours)
+
+    def test_location_snippets(self):
+        location = self.make_location()
+
+        def add_rows(count):
+            for _ in range(count):
+                TextSnippet.objects.create(location=location, length='short', text='t', hash='h')
+
+        self.assertConstantQueries(f'/api/locations/{location.pk}/snippets/', add_rows)
+
+
+class TourBundleTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('reader', password='password123'))
+        self.tour = Tour.objects.create(name='Tour', description='')
+
+    def add_stops(self, count):
+        locations = []
+        for index in range(count):
+            location = Location.objects.create(name=f'Stop {index}', raw_text='Text', latlon_json={})
+            snippet = TextSnippet.objects.create(
+                location=location, length='short', text=f'Short {index}', hash=str(index), is_current=True
+            )
+            for voice_id in ('alto', 'bass'):
+                AudioSnippet.objects.create(
+                    text_snippet=snippet, voice_id=voice_id, audio_url=f'/{voice_id}-{index}.mp3', is_current=True
+                )
+            locations.append(location)
+        set_location_order(self.tour, [location.pk for location in reversed(locations)])
+
+    def bundle(self, **params):
+        cache.clear()
+        return self.client.get(f'/api/tours/{self.tour.pk}/bundle/', {'length': 'short', **params})
+
+    def test_query_count_is_bounded(self):
+        self.add_stops(20)
+        # Tour, its stops, then one query each for locations, snippets and audio
+        with self.assertNumQueries(5):
+            response = self.bundle(voice='alto')
+        self.assertEqual(response.status_code, 200)
+        stops = response.json()['locations']
+        self.assertEqual([stop['name'] for stop in stops], [f'Stop {index}' for index in reversed(range(20))])
+        self.assertEqual([stop['snippet']['text'] for stop in stops[:2]], ['Short 19', 'Short 18'])
+        self.assertEqual([[audio['voice_id'] for audio in stop['audio']] for stop in stops[:2]], [['alto'], ['alto']])
+
+
+class CursorProjectionTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('reader', password='password123'))
+        self.locations = [
+            Location.objects.create(name=f'Place {index}', raw_text='Text', latlon_json={}) for index in range(5)
+        ]
+
+    def test_cursor_pages_carry_projected_fields(self):
+        url = '/api/locations/?fields=id,name&page_size=2'
+        ids = []
+        pages = 0
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            for row in response.data['results']:
+                self.assertEqual(set(row), {'id', 'name'})
+                ids.append(row['id'])
+            url = response.data['next']
+            pages += 1
+        self.assertEqual(pages, 3)
+        self.assertEqual(ids, [location.pk for location in reversed(self.locations)])
+
+    def test_lite_and_unknown_fields(self):
+        row = self.client.get('/api/locations/', {'lite': 'true'}).data['results'][0]
+        self.assertNotIn('raw_text', row)
+        self.assertIn('name', row)
+        detail = self.client.get(f'/api/locations/{self.locations[0].pk}/', {'fields': 'name'})
+        self.assertEqual(detail.data, {'name': 'Place 0'})
+        self.assertEqual(self.client.get('/api/locations/', {'fields': 'nonsense'}).status_code, 400)
+
+
+class IndexUsageTests(TestCase):
+    """EXPLAIN the hot lookups and check they are answered from an index"""
+
+    def setUp(self):
+        self.location = Location.objects.create(name='Somewhere', raw_text='Text', latlon_json={})
+
+    def assertUsesIndex(self, queryset):
+        if connection.vendor == 'postgresql':
+            # Tiny test tables would otherwise always be read sequentially
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            plan = queryset.explain()
+            self.assertIn('Index', plan)
+            self.assertNotIn('Seq Scan', plan)
+        elif connection.vendor == 'sqlite':
+            plan = queryset.explain()
+            self.assertRegex(plan, r'USING (COVERING )?INDEX')
+            self.assertNotRegex(plan, r'\bSCAN\b(?! CONSTANT)')
+        else:
+            self.skipTest(f'No plan assertions for {connection.vendor}')
+
+    def test_current_snippet_lookup(self):
+        self.assertUsesIndex(TextSnippet.objects.filter(location=self.location, length='short', is_current=True))
+
+    def test_snippet_hash_lookup(self):
+        self.assertUsesIndex(TextSnippet.objects.filter(hash='0cc175b9c0f1b6a831c399e269772661'))
+
+    def test_current_audio_lookup(self):
+        self.assertUsesIndex(AudioSnippet.objects.filter(text_snippet_id=1, voice_id='default', is_current=True))
+
+    def test_stitch_cache_lookup(self):
+        self.assertUsesIndex(StitchCache.objects.filter(
+            tour_id_or_hash='1', length='short', location_versions_hash='abc', expires_at__gt=timezone.now()
+        ))
+
+    def test_tour_stop_order_lookup(self):
+        self.assertUsesIndex(TourStop.objects.filter(tour_id=1).order_by('position').values('location_id'))
+
+    def test_tours_for_location_lookup(self):
+        self.assertUsesIndex(TourStop.objects.filter(location_id__in=[1, 2]).values('tour_id'))
+
+    def test_stitch_cache_expiry_scan(self):
+        self.assertUsesIndex(StitchCache.objects.filter(expires_at__lte=timezone.now()))
+
+    def test_search_vector_lookup(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest('Search documents only carry a tsvector on Postgres')
+        self.assertUsesIndex(SearchDocument.objects.filter(vector=SearchQuery('cathedral', config='english')))
+
+    def test_one_current_snippet_per_length(self):
+        TextSnippet.objects.create(location=self.location, length='short', text='a', hash='a', is_current=True)
+        TextSnippet.objects.create(location=self.location, length='short', text='b', hash='b', is_current=False)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            TextSnippet.objects.create(location=self.location, length='short', text='c', hash='c', is_current=True)
+
+
+class NearbySearchTests(TestCase):
+    CENTRES = [(51.5, -0.12), (0.0, 179.95), (-33.9, -179.9), (78.0, -179.5), (89.95, 10.0), (-89.9, -120.0)]
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(1)
+        points = []
+        for lat, lon in cls.CENTRES:
+            for _ in range(60):
+                point_lat = max(-90.0, min(90.0, lat + rng.uniform(-4, 4)))
+                point_lon = (lon + rng.uniform(-8, 8) + 180) % 360 - 180
+                points.append({'lat': point_lat, 'lon': point_lon})
+        points.append({})  # not geocoded
+        Location.objects.bulk_create([
+            Location(name=f'Point {index}', raw_text='', latlon_json=latlon, geohash=geohash_for(latlon))
+            for index, latlon in enumerate(points)
+        ])
+
+    def test_matches_brute_force_haversine(self):
+        rows = list(Location.objects.values_list('id', 'latlon_json'))
+        for lat, lon in self.CENTRES:
+            for radius in (1, 25, 150, 400):
+                with self.subTest(lat=lat, lon=lon, radius=radius):
+                    expected = sorted(
+                        (location_id, distance)
+                        for location_id, latlon in rows if latlon
+                        for distance in [haversine_km(lat, lon, latlon['lat'], latlon['lon'])]
+                        if distance <= radius
+                    )
+                    matches = find_nearby(Location.objects.all(), lat, lon, radius)
+                    self.assertEqual(sorted(matches), expected)
+                    self.assertEqual([distance for _, distance in matches], sorted(d for _, d in expected))
+
+    def test_save_keeps_geohash_current(self):
+        location = Location.objects.create(
+            name='Moving', raw_text='', latlon_json={'lat': 57.64911, 'lon': 10.40744}
+        )
+        self.assertEqual(location.geohash, 'u4pruydqq')
+
+        location.latlon_json = {'lat': -33.9, 'lon': 151.2}
+        location.save(update_fields=['latlon_json'])
+        location.refresh_from_db()
+        self.assertEqual(location.geohash, geohash_for({'lat': -33.9, 'lon': 151.2}))
+
+        location.latlon_json = {}
+        location.save()
+        self.assertEqual(Location.objects.get(pk=location.pk).geohash, '')
+
+
+class ConditionalWriteTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('editor', password='password123'))
+        self.location = Location.objects.create(name='Somewhere', raw_text='Text', latlon_json={})
+        self.tour = Tour.objects.create(name='Tour', description='')
+
+    def test_location_update_requires_current_etag(self):
+        etag = self.client.get(f'/api/locations/{self.location.pk}/')['ETag']
+        response = self.client.patch(f'/api/locations/{self.location.pk}/', {'raw_text': 'New'}, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['version'], 2)
+        self.assertNotEqual(response['ETag'], etag)
+
+        response = self.client.patch(f'/api/locations/{self.location.pk}/', {'raw_text': 'Stale'}, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 412)
+        self.location.refresh_from_db()
+        self.assertEqual((self.location.raw_text, self.location.version), ('New', 2))
+
+    def test_add_location_requires_current_etag(self):
+        etag = self.client.get(f'/api/tours/{self.tour.pk}/')['ETag']
+        url = f'/api/tours/{self.tour.pk}/add-location/'
+        response = self.client.post(url, {'location_id': self.location.pk}, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        other = Location.objects.create(name='Elsewhere', raw_text='Text', latlon_json={})
+        self.assertEqual(self.client.post(url, {'location_id': other.pk}, HTTP_IF_MATCH=etag).status_code, 412)
+        self.assertEqual(self.tour.location_order, [self.location.pk])
+
+
+class BulkSnippetGenerationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('editor', password='password123'))
+        self.locations = [
+            Location.objects.create(name=f'Place {index}', raw_text='A sentence about this place. ' * 10,
+                                    latlon_json={})
+            for index in range(3)
+        ]
+
+    def generate(self, body):
+        return self.client.post('/api/locations/generate-snippets/?sync=true', body, format='json')
+
+    def test_generates_for_listed_ids(self):
+        response = self.generate({'ids': [self.locations[0].pk]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['locations'], 1)
+        self.assertEqual(
+            set(TextSnippet.objects.values_list('location_id', flat=True).distinct()), {self.locations[0].pk}
+        )
+
+    def test_generates_for_all(self):
+        response = self.generate({'all': True})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['locations'], 3)
+
+    def test_queues_by_default(self):
+        response = self.client.post('/api/locations/generate-snippets/', {'all': True}, format='json')
+        self.assertEqual(response.status_code, 202)
+        job = Job.objects.get(pk=response.data['job_id'])
+        self.assertEqual(job.kind, 'generate_snippets')
+        self.assertFalse(TextSnippet.objects.exists())
+
+    def test_rejects_non_integer_ids(self):
+        for ids in (['abc'], [1, '2'], [True], 'abc'):
+            with self.subTest(ids=ids):
+                response = self.generate({'ids': ids})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('ids', response.data['error'])
+
+
+class GuidebookIngestTests(TestCase):
+    GUIDEBOOK = (
+        '\n'
+        '---\n'
+        'loc_map:\n'
+        '  bridge: "# Bridge"\n'
+        '  museum: "# Museum"\n'
+        '  park: "## Park"\n'
+        '---\n'
+        '# Museum of Art (closed Mondays)\n'
+        'Paintings.\n'
+        '## Park\n'
+        'Trees.\n'
+        '```\n'
+        '# Bridge\n'
+        '```\n'
+        '# Bridge\n'
+        'Stone arches.\n'
+    )
+
+    def test_extract_keeps_loc_map_order_and_prefix_matching(self):
+        self.assertEqual(extract_locations_from_document(self.GUIDEBOOK), [
+            {'slug': 'bridge', 'name': 'Bridge'},
+            {'slug': 'museum', 'name': 'Museum'},
+            {'slug': 'park', 'name': 'Park'},
+        ])
+
+    def test_sections_stream_in_document_order_skipping_code_fences(self):
+        sections = list(iter_document_sections(io.StringIO(self.GUIDEBOOK)))
+        self.assertEqual([(section['slug'], section['text']) for section in sections], [
+            ('museum', 'Paintings.'), ('park', 'Trees.\n```\n# Bridge\n```'), ('bridge', 'Stone arches.'),
+        ])
+
+    def test_front_matter_follows_python_frontmatter(self):
+        for document in (
+            'loc_map:\n  museum: "# Museum"\n# Museum\n',  # no front matter
+            '---\nloc_map:\n  museum: "# Museum"\n# Museum\n',  # unterminated
+            '---\n- museum\n---\n# Museum\n',  # not a mapping
+        ):
+            with self.subTest(document=document):
+                self.assertEqual(extract_locations_from_document(document), [])
+        self.assertEqual(
+            extract_locations_from_document('----  \nloc_map: {museum: "# Museum"}\n-----\n# Museum\n'),
+            [{'slug': 'museum', 'name': 'Museum'}],
+        )
+
+    def test_import_bumps_version_only_when_text_changes(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = Path(directory.name) / 'guidebook.md'
+        path.write_text(self.GUIDEBOOK, encoding='utf-8')
+
+        self.assertEqual(import_guidebook(path, chunk_size=2), {'created': 3, 'updated': 0, 'unchanged': 0})
+        self.assertEqual(import_guidebook(path), {'created': 0, 'updated': 0, 'unchanged': 3})
+
+        path.write_text(self.GUIDEBOOK.replace('Trees.', 'Old trees.'), encoding='utf-8')
+        self.assertEqual(import_guidebook(path), {'created': 0, 'updated': 1, 'unchanged': 2})
+        self.assertEqual(
+            dict(Location.objects.values_list('slug', 'version')), {'bridge': 1, 'museum': 1, 'park': 2}
+        )
+        self.assertTrue(Location.objects.get(slug='park').raw_text.startswith('Old trees.'))
+
+
+class SnippetWriteTests(TestCase):
+    def setUp(self):
+        self.location = Location.objects.create(
+            name='Somewhere', raw_text='A sentence about this place. ' * 10, latlon_json={}
+        )
+
+    def test_unchanged_text_keeps_every_snippet(self):
+        created, unchanged = sync_location_snippets(self.location)
+        self.assertEqual((len(created), unchanged), (3, []))
+
+        created_again, unchanged = sync_location_snippets(self.location)
+        self.assertEqual(created_again, [])
+        self.assertEqual({snippet.pk for snippet in unchanged}, {snippet.pk for snippet in created})
+        self.assertEqual(TextSnippet.objects.count(), 3)
+
+    def test_changed_text_supersedes_snippets_and_audio(self):
+        old, _ = sync_location_snippets(self.location)
+        short = next(snippet for snippet in old if snippet.length == 'short')
+        audio = AudioSnippet.objects.create(text_snippet=short, voice_id='v', audio_url='/a.mp3', is_current=True)
+
+        self.location.raw_text = 'A different sentence entirely.'
+        self.location.version += 1
+        self.location.save()
+        created, unchanged = sync_location_snippets(self.location)
+        self.assertEqual((len(created), unchanged), (3, []))
+
+        old_ids = [snippet.pk for snippet in old]
+        self.assertFalse(TextSnippet.objects.filter(pk__in=old_ids, is_current=True).exists())
+        self.assertEqual(TextSnippet.objects.filter(pk__in=old_ids).count(), 3)
+        audio.refresh_from_db()
+        self.assertFalse(audio.is_current)
+        self.assertEqual(
+            set(TextSnippet.objects.filter(is_current=True).values_list('pk', flat=True)),
+            {snippet.pk for snippet in created},
+        )
+
+    def test_changed_locations_includes_never_generated(self):
+        self.assertIsNone(self.location.snippets_version)
+        self.assertEqual(list(changed_locations()), [self.location])
+
+        sync_location_snippets(self.location)
+        self.assertEqual(list(changed_locations()), [])
+
+        self.location.version += 1
+        self.location.save()
+        self.assertEqual(list(changed_locations()), [self.location])
+
+
+class SummariserTests(TestCase):
+    TEXT = (
+        'The old harbour was built in 1820 to serve the fishing fleet. '
+        'Fishing boats still land their catch in the harbour every morning. '
+        'A small cafe sells tea. '
+        'The harbour wall shelters the fishing boats from winter storms.'
+    )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_textrank_keeps_central_sentences_in_order(self):
+        summary = TextRankSummariser().summarise(self.TEXT, 140)
+        self.assertLessEqual(len(summary), 140)
+        self.assertNotIn('cafe', summary)
+        sentences = [sentence for sentence in self.TEXT.split('. ') if sentence.rstrip('.') in summary]
+        self.assertEqual(len(sentences), 2)
+        self.assertEqual(summary, ' '.join(sentence.rstrip('.') + '.' for sentence in sentences))
+
+        self.assertEqual(TextRankSummariser().summarise('  Short text.  ', 200), 'Short text.')
+        self.assertEqual(TextRankSummariser().summarise('one long sentence without a stop ' * 10, 20), 'one long sentence...')
+
+    def test_truncate_matches_original_snippets(self):
+        for raw_text in ('', 'Short.', 'x' * 200, 'word ' * 41, 'word ' * 120):
+            for limit in (200, 500):
+                with self.subTest(length=len(raw_text), limit=limit):
+                    expected = raw_text[:limit] + '...' if len(raw_text) > limit else raw_text
+                    self.assertEqual(TruncateSummariser().summarise(raw_text, limit), expected)
+
+    def test_summaries_are_memoised_by_text_hash(self):
+        summariser = get_summariser()
+        key = summary_key(summariser, self.TEXT, 'short', 200)
+        self.assertEqual(key, f'summary:textrank:short:200:{hashlib.md5(self.TEXT.encode()).hexdigest()}')
+
+        with mock.patch.object(summariser, 'summarise_batch', wraps=summariser.summarise_batch) as summarise:
+            first = summarise_texts([self.TEXT, self.TEXT])
+            self.assertEqual(summarise.call_count, 2)  # short and medium, each text once
+            self.assertEqual([call.args[0] for call in summarise.call_args_list], [[self.TEXT], [self.TEXT]])
+            self.assertEqual(summarise_texts([self.TEXT]), first[:1])
+            self.assertEqual(summarise.call_count, 2)
+        self.assertEqual(cache.get(key), first[0]['short'])
+
+    def test_pool_workers_set_up_django_under_spawn(self):
+        location = Location.objects.create(name='Harbour', raw_text=self.TEXT * 3, latlon_json={})
+        spawn_pool = mock.patch(
+            'core.utils.snippets.ProcessPoolExecutor',
+            lambda **kwargs: ProcessPoolExecutor(mp_context=multiprocessing.get_context('spawn'), **kwargs),
+        )
+        with spawn_pool:
+            pool = summary_pool(2)
+            try:
+                # A backend importing models needs the app registry in the worker
+                self.assertIs(pool.submit(import_string, 'core.models.Location').result(), Location)
+            finally:
+                pool.shutdown()
+            stats = generate_snippets_bulk(Location.objects.filter(pk=location.pk), workers=2)
+        self.assertEqual(stats, {'locations': 1, 'created': 3, 'unchanged': 0})
+        short = TextSnippet.objects.get(location=location, length='short', is_current=True)
+        self.assertEqual(short.text, TextRankSummariser().summarise(location.raw_text, 200))
+
+    def test_pool_falls_back_to_serial_without_a_settings_module(self):
+        self.assertIsNone(summary_pool(1))
+        with mock.patch.object(settings, 'SETTINGS_MODULE', None):
+            self.assertIsNone(summary_pool(4))
+
+
+class SpeechSynthesisTests(TestCase):
+    def setUp(self):
+        audio_root = tempfile.TemporaryDirectory()
+        self.addCleanup(audio_root.cleanup)
+        self.audio_root = Path(audio_root.name)
+        self.enterContext(override_settings(AUDIO_ROOT=self.audio_root))
+        for index, text in enumerate(('Welcome to the harbour.', 'Welcome to the harbour.', 'The old mill.')):
+            location = Location.objects.create(name=f'Stop {index}', raw_text=text, latlon_json={})
+            TextSnippet.objects.create(location=location, length='short', text=text, hash=snippet_hash(text),
+                                       is_current=True)
+
+    def synthesise(self, voice_id='alto'):
+        backend = get_backend()
+        with mock.patch.object(backend, 'synthesise', wraps=backend.synthesise) as synthesise:
+            stats = synthesise_snippets(TextSnippet.objects.all(), voice_id=voice_id, workers=2)
+        return stats, [call.args for call in synthesise.call_args_list]
+
+    def stored_files(self):
+        return sorted(path.name for path in (self.audio_root / 'tts').rglob('*') if path.is_file())
+
+    def test_same_text_and_voice_share_one_file(self):
+        stats, calls = self.synthesise()
+        self.assertEqual(stats, {'snippets': 3, 'synthesised': 2, 'reused': 0})
+        self.assertEqual(sorted(calls), [('The old mill.', 'alto'), ('Welcome to the harbour.', 'alto')])
+        self.assertEqual(len(self.stored_files()), 2)
+
+        urls = dict(AudioSnippet.objects.values_list('text_snippet__location__name', 'audio_url'))
+        self.assertEqual(urls['Stop 0'], urls['Stop 1'])
+        self.assertNotEqual(urls['Stop 0'], urls['Stop 2'])
+        self.assertTrue(all(url.startswith('/media/audio/tts/') for url in urls.values()))
+
+        # Nothing is missing audio any more
+        self.assertEqual(self.synthesise(), ({'snippets': 0, 'synthesised': 0, 'reused': 0}, []))
+
+    def test_stored_audio_is_reused_and_voices_are_separate(self):
+        self.synthesise()
+        AudioSnippet.objects.all().delete()
+        stats, calls = self.synthesise()
+        self.assertEqual((stats, calls), ({'snippets': 3, 'synthesised': 0, 'reused': 2}, []))
+
+        stats, calls = self.synthesise('bass')
+        self.assertEqual(stats['synthesised'], 2)
+        self.assertEqual(len(self.stored_files()), 4)
+
+
+class StitchTestMixin:
+    def setUp(self):
+        audio_root = tempfile.TemporaryDirectory()
+        self.addCleanup(audio_root.cleanup)
+        self.audio_root = Path(audio_root.name)
+        self.enterContext(override_settings(AUDIO_ROOT=self.audio_root))
+        self.tour = Tour.objects.create(name='Tour', description='')
+        locations = [Location.objects.create(name=f'Stop {index}', raw_text='Text', latlon_json={}) for index in range(2)]
+        for location in locations:
+            snippet = TextSnippet.objects.create(location=location, length='short', text='Short',
+                                                 hash=str(location.pk), is_current=True)
+            self.write_wav(f'{location.pk}.wav')
+            AudioSnippet.objects.create(text_snippet=snippet, voice_id='default', is_current=True,
+                                        audio_url=f'/media/audio/{location.pk}.wav')
+        set_location_order(self.tour, [location.pk for location in locations])
+
+    def write_wav(self, name):
+        with wave.open(str(self.audio_root / name), 'wb') as output:
+            output.setnchannels(1)
+            output.setsampwidth(2)
+            output.setframerate(8000)
+            output.writeframes(b'\x00\x01' * 100)
+
+
+class StitchCacheTests(StitchTestMixin, TestCase):
+    def expired_entry(self):
+        self.write_wav('stitched-old.wav')
+        return StitchCache.objects.create(
+            tour_id_or_hash=str(self.tour.pk), length='short', location_versions_hash='old',
+            audio_url='/media/audio/stitched-old.wav', expires_at=timezone.now() - timedelta(minutes=1),
+        )
+
+    def test_serves_cached_stitch_until_a_stop_changes(self):
+        entry, cached = get_or_build_stitch(self.tour, 'short')
+        self.assertFalse(cached)
+        self.assertTrue(stitching.audio_path(entry.audio_url).is_file())
+        self.assertEqual(get_or_build_stitch(self.tour, 'short'), (entry, True))
+
+        Location.objects.filter(pk=self.tour.location_order[0]).update(version=2)
+        rebuilt, cached = get_or_build_stitch(self.tour, 'short')
+        self.assertFalse(cached)
+        self.assertNotEqual(rebuilt.pk, entry.pk)
+
+    def test_new_audio_at_the_same_version_rebuilds(self):
+        entry, _ = get_or_build_stitch(self.tour, 'short')
+        old = AudioSnippet.objects.get(text_snippet__location_id=self.tour.location_order[0])
+        old.is_current = False
+        old.save()
+        self.write_wav('resynthesised.wav')
+        AudioSnippet.objects.create(text_snippet=old.text_snippet, voice_id='default', is_current=True,
+                                    audio_url='/media/audio/resynthesised.wav')
+
+        self.assertIsNone(stitching.find_stitch(self.tour, 'short'))
+        rebuilt, cached = get_or_build_stitch(self.tour, 'short')
+        self.assertFalse(cached)
+        self.assertNotEqual(rebuilt.location_versions_hash, entry.location_versions_hash)
+
+    def test_evicted_files_are_deleted_on_commit(self):
+        expired = self.expired_entry()
+        with self.captureOnCommitCallbacks(execute=True):
+            get_or_build_stitch(self.tour, 'short')
+        self.assertFalse(StitchCache.objects.filter(pk=expired.pk).exists())
+        self.assertFalse((self.audio_root / 'stitched-old.wav').exists())
+
+    def test_failed_build_keeps_evicted_files(self):
+        expired = self.expired_entry()
+        AudioSnippet.objects.filter(text_snippet__location_id=self.tour.location_order[1]).delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(stitching.MissingAudioError):
+                get_or_build_stitch(self.tour, 'short')
+        self.assertTrue(StitchCache.objects.filter(pk=expired.pk).exists())
+        self.assertTrue((self.audio_root / 'stitched-old.wav').exists())
+
+    def test_refuses_to_join_non_wav_audio(self):
+        audio = AudioSnippet.objects.get(text_snippet__location_id=self.tour.location_order[1])
+        (self.audio_root / 'clip.mp3').write_bytes(b'ID3 not a wav')
+        audio.audio_url = '/media/audio/clip.mp3'
+        audio.save()
+        with self.assertRaisesMessage(stitching.StitchError, 'Only WAV audio can be stitched, got .mp3, .wav'):
+            get_or_build_stitch(self.tour, 'short')
+        self.assertFalse(StitchCache.objects.exists())
+        self.assertEqual(list((self.audio_root / 'stitched').iterdir()), [])
+
+    def test_repeated_misses_queue_one_job(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('listener', password='password123'))
+        url = f'/api/tours/{self.tour.pk}/stitch/'
+        job_ids = {client.get(url, {'length': 'short'}).data['job_id'] for _ in range(3)}
+        self.assertEqual(len(job_ids), 1)
+        self.assertEqual(Job.objects.filter(kind='stitch_tour').count(), 1)
+        # Another length is different work
+        self.assertNotIn(client.get(url, {'length': 'medium'}).data['job_id'], job_ids)
+
+        job = run_job(claim_job('worker'))
+        self.assertEqual(job.status, 'succeeded')
+        response = client.get(url, {'length': 'short'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['cached'])
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class StitchCoalescingTests(StitchTestMixin, TransactionTestCase):
+    def test_concurrent_misses_build_once(self):
+        barrier = threading.Barrier(4)
+        results = []
+
+        def request_stitch():
+            try:
+                barrier.wait()
+                results.append(get_or_build_stitch(self.tour, 'short'))
+            finally:
+                connections.close_all()
+
+        with mock.patch('core.utils.stitching.concatenate_audio', wraps=stitching.concatenate_audio) as concatenate:
+            threads = [threading.Thread(target=request_stitch) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(concatenate.call_count, 1)
+        self.assertEqual(len({entry.pk for entry, _ in results}), 1)
+        self.assertEqual(sorted(cached for _, cached in results), [False, True, True, True])
+        self.assertEqual(stitching._build_locks, {})
+
+
+class AudioFileRangeTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('listener', password='password123'))
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.audio_root = audio_root = Path(directory.name) / 'audio'
+        audio_root.mkdir()
+        (audio_root / 'clip.mp3').write_bytes(b'0123456789')
+        (Path(directory.name) / 'secret.txt').write_bytes(b'secret')
+        self.enterContext(override_settings(AUDIO_ROOT=audio_root, AUDIO_SERVE_MODE='python'))
+
+    def fetch(self, path='clip.mp3', **headers):
+        return self.client.get(f'/media/audio/{path}', **headers)
+
+    def test_serves_byte_ranges(self):
+        for header, content_range, body in (
+            ('bytes=2-4', 'bytes 2-4/10', b'234'),
+            ('bytes=-3', 'bytes 7-9/10', b'789'),
+        ):
+            with self.subTest(range=header):
+                response = self.fetch(HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(response['Content-Range'], content_range)
+                self.assertEqual(b''.join(response.streaming_content), body)
+
+    def test_full_responses_are_not_compressed(self):
+        (self.audio_root / 'clip.bin').write_bytes(b'\0' * 4096)
+        (self.audio_root / 'clip.mp3').write_bytes(b'\0' * 4096)
+        for path in ('clip.bin', 'clip.mp3'):
+            with self.subTest(path=path):
+                response = self.fetch(path, HTTP_ACCEPT_ENCODING='gzip')
+                self.assertEqual(response.status_code, 200)
+                self.assertFalse(response.has_header('Content-Encoding'))
+                self.assertFalse(response['ETag'].startswith('W/'))
+
+    def test_unsatisfiable_range(self):
+        response = self.fetch(HTTP_RANGE='bytes=10-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */10')
+
+    def test_rejects_paths_outside_audio_root(self):
+        self.assertEqual(self.fetch().status_code, 200)
+        for path in ('../secret.txt', '%2e%2e/secret.txt', 'missing.mp3'):
+            with self.subTest(path=path):
+                self.assertEqual(self.fetch(path).status_code, 404)
+
+
+class StatelessAuthTests(TestCase):
+    def setUp(self):
+        authentication._user_states.clear()
+        authentication._revoked_tokens.clear()
+        self.user = User.objects.create_user('reader', password='password123')
+        self.location = Location.objects.create(name='Somewhere', raw_text='Text', latlon_json={})
+        self.client = APIClient()
+        response = self.client.post('/api/auth/login/', {'username': 'reader', 'password': 'password123'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['user']['username'], 'reader')
+        self.tokens = response.data
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.tokens["access"]}')
+
+    def test_warm_reads_skip_user_query(self):
+        url = f'/api/locations/{self.location.pk}/'
+        self.assertEqual(self.client.get(url).status_code, 200)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertFalse([query for query in queries if 'auth_user' in query['sql']])
+
+    def test_logout_and_deactivation_lock_token_out(self):
+        url = f'/api/locations/{self.location.pk}/'
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(url).status_code, 401)
+
+        self.user.is_active = True
+        self.user.save()
+        response = self.client.post('/api/auth/logout/', {'refresh': self.tokens['refresh']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(url).status_code, 401)
+
+    def test_revocation_reaches_other_processes(self):
+        url = f'/api/locations/{self.location.pk}/'
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.client.post('/api/auth/logout/', {'refresh': self.tokens['refresh']})
+        # Another process: nothing memoised, no shared cache
+        authentication._revoked_tokens.clear()
+        cache.clear()
+        self.assertEqual(self.client.get(url).status_code, 401)
+
+
+class TokenPruneTests(TestCase):
+    def test_prunes_only_expired_tokens_in_chunks(self):
+        now = timezone.now()
+        for index in range(5):
+            token = OutstandingToken.objects.create(
+                jti=f'expired-{index}', token='', expires_at=now - timedelta(days=1)
+            )
+            BlacklistedToken.objects.create(token=token)
+        live = OutstandingToken.objects.create(jti='live', token='', expires_at=now + timedelta(days=1))
+        BlacklistedToken.objects.create(token=live)
+
+        stats = prune_expired_tokens(chunk_size=2)
+        self.assertEqual(stats, {'outstanding': 5, 'blacklisted': 5, 'chunks': 3})
+        self.assertEqual(list(OutstandingToken.objects.values_list('jti', flat=True)), ['live'])
+        self.assertEqual(BlacklistedToken.objects.count(), 1)
+
+
+    def test_table_sizes_are_exported_to_metrics(self):
+        now = timezone.now()
+        for index in range(3):
+            OutstandingToken.objects.create(jti=f'expired-{index}', token='', expires_at=now - timedelta(days=1))
+        OutstandingToken.objects.create(jti='live', token='', expires_at=now + timedelta(days=1))
+
+        with override_settings(METRICS_TOKEN='scrape'):
+            response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape')
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('# TYPE guidea_expired_tokens gauge\nguidea_expired_tokens 3\n', body)
+        # Row counts are planner estimates on Postgres, exact elsewhere
+        self.assertRegex(body, r'\nguidea_outstanding_tokens \d+\n')
+        self.assertRegex(body, r'\nguidea_blacklisted_tokens \d+\n')
+
+class SearchTests(TestCase):
+    def setUp(self):
+        inverted_index.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('reader', password='password123'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cathedral = Location.objects.create(
+                name='Cathedral', raw_text='Gothic towers above the river.', latlon_json={}
+            )
+            self.museum = Location.objects.create(
+                name='Museum', raw_text='Paintings, and a view of the cathedral.', latlon_json={}
+            )
+
+    def test_ranks_name_matches_first(self):
+        response = self.client.get('/api/locations/search/', {'q': 'cathedral'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual([location['id'] for location in response.data['locations']],
+                         [self.cathedral.pk, self.museum.pk])
+        self.assertEqual(self.client.get('/api/locations/search/').status_code, 400)
+
+    def test_reindexes_when_version_bumps(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(f'/api/locations/{self.museum.pk}/', {'raw_text': 'Sculpture garden.'})
+        self.assertEqual(response.data['version'], 2)
+        self.assertFalse(stale_documents().exists())
+        self.assertEqual(search_locations('cathedral')[0][0], self.cathedral.pk)
+        self.assertEqual(len(search_locations('cathedral')), 1)
+        self.assertEqual([pk for pk, _ in search_locations('sculpture')], [self.museum.pk])
+
+
+class TourPackageTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('reader', password='password123'))
+        self.tour = Tour.objects.create(name='Tour', description='')
+        self.location = Location.objects.create(name='Somewhere', raw_text='Text', latlon_json={})
+        set_location_order(self.tour, [self.location.pk])
+        TextSnippet.objects.create(location=self.location, length='short', text='Short', hash='a', is_current=True)
+        package_root = tempfile.TemporaryDirectory()
+        self.addCleanup(package_root.cleanup)
+        self.enterContext(override_settings(PACKAGE_ROOT=package_root.name))
+
+    def download(self, **headers):
+        return self.client.get(f'/api/tours/{self.tour.pk}/package/', {'length': 'short'}, **headers)
+
+    def test_package_is_built_once_per_version(self):
+        response = self.download(HTTP_ACCEPT='application/zip')
+        self.assertEqual(response.status_code, 200)
+        archive = b''.join(response.streaming_content)
+        manifest = json.loads(zipfile.ZipFile(io.BytesIO(archive)).read('manifest.json'))
+        self.assertEqual([stop['snippet']['text'] for stop in manifest['locations']], ['Short'])
+
+        repeat = self.download()
+        self.assertEqual(b''.join(repeat.streaming_content), archive)
+        self.assertEqual(self.download(HTTP_IF_NONE_MATCH=repeat['ETag']).status_code, 304)
+
+        self.location.version += 1
+        self.location.save()
+        self.assertNotEqual(self.download()['ETag'], repeat['ETag'])
+
+    def test_renaming_a_stop_rebuilds_the_package(self):
+        before = self.download()
+        self.location.name = 'Renamed'
+        self.location.save()
+        after = self.download()
+        self.assertNotEqual(after['ETag'], before['ETag'])
+        manifest = json.loads(zipfile.ZipFile(io.BytesIO(b''.join(after.streaming_content))).read('manifest.json'))
+        self.assertEqual([stop['name'] for stop in manifest['locations']], ['Renamed'])
+
+
+class TourAdminTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='password123'))
+        self.tour = Tour.objects.create(name='Tour', description='')
+        self.locations = [
+            Location.objects.create(name=f'Stop {index}', raw_text='Text', latlon_json={}) for index in range(3)
+        ]
+        set_location_order(self.tour, [location.pk for location in self.locations[:2]])
+
+    def post_stops(self, rows):
+        """Submit the change form with (stop, location, position, delete) inline rows"""
+        data = {
+            'name': 'Tour', 'description': 'A walk',
+            'stops-TOTAL_FORMS': len(rows), 'stops-INITIAL_FORMS': sum(stop is not None for stop, *_ in rows),
+            'stops-MIN_NUM_FORMS': 0, 'stops-MAX_NUM_FORMS': 1000,
+        }
+        for index, (stop, location, position, delete) in enumerate(rows):
+            data.update({
+                f'stops-{index}-id': stop.pk if stop else '', f'stops-{index}-tour': self.tour.pk,
+                f'stops-{index}-location': location.pk, f'stops-{index}-position': position,
+            })
+            if delete:
+                data[f'stops-{index}-DELETE'] = 'on'
+        return self.client.post(f'/admin/core/tour/{self.tour.pk}/change/', data)
+
+    def test_inline_edits_go_through_set_location_order(self):
+        first, second = TourStop.objects.filter(tour=self.tour)
+        StitchCache.objects.create(tour_id_or_hash=str(self.tour.pk), length='short', location_versions_hash='old',
+                                   audio_url='/media/audio/missing.wav', expires_at=timezone.now() + timedelta(hours=1))
+        updated = Tour.objects.get(pk=self.tour.pk).updated
+        Change.objects.all().delete()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post_stops([
+                (first, self.locations[0], 1, True),
+                (second, self.locations[1], 9000, False),
+                (None, self.locations[2], 5, False),
+            ])
+        self.assertEqual(response.status_code, 302)
+        tour = Tour.objects.get(pk=self.tour.pk)
+        self.assertEqual(tour.location_order, [self.locations[2].pk, self.locations[1].pk])
+        self.assertGreater(tour.updated, updated)
+        self.assertTrue(Change.objects.filter(kind='tour', object_id=tour.pk).exists())
+        self.assertFalse(StitchCache.objects.exists())
+
+    def test_rejects_duplicate_stops(self):
+        first, second = TourStop.objects.filter(tour=self.tour)
+        response = self.post_stops([
+            (first, self.locations[0], 1, False),
+            (second, self.locations[1], 2, False),
+            (None, self.locations[0], 3, False),
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['inline_admin_formsets'][0].formset.non_form_errors(),
+                         ['Please correct the duplicate data for location.'])
+        self.assertEqual(self.tour.location_order, [self.locations[0].pk, self.locations[1].pk])
+
+class SyncTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('reader', password='password123'))
+        self.enterContext(override_settings(SYNC_SETTLE=timedelta(0)))
+        self.location = Location.objects.create(name='Somewhere', raw_text='Text', latlon_json={})
+
+    def sync(self, cursor=None):
+        response = self.client.get('/api/sync/', {'since': cursor} if cursor else {})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_returns_changes_and_tombstones_after_cursor(self):
+        first = self.sync()
+        self.assertEqual([location['id'] for location in first['locations']], [self.location.pk])
+        self.assertEqual(self.sync(first['cursor'])['locations'], [])
+
+        snippet = TextSnippet.objects.create(location=self.location, length='short', text='Short', hash='a')
+        location_id = self.location.pk
+        self.location.delete()
+        changes = self.sync(first['cursor'])
+        self.assertEqual(changes['locations'], [])
+        self.assertEqual(changes['deleted']['locations'], [location_id])
+        self.assertEqual(changes['deleted']['text_snippets'], [snippet.pk])
+
+    def test_rejects_bad_and_expired_cursors(self):
+        self.assertEqual(self.client.get('/api/sync/', {'since': 'nonsense'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/sync/', {'since': '1.0'}).status_code, 410)
+
+
+class AsyncReadParityTests(TestCase):
+    """The async views in guidea_engine.asgi_urls must answer exactly as the DRF views do"""
+
+    def setUp(self):
+        # Primary keys repeat across tests on some backends; keep cached responses from leaking
+        self.addCleanup(cache.clear)
+        user = User.objects.create_user('reader', password='password123')
+        self.authorization = f'Bearer {AccessToken.for_user(user)}'
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=self.authorization)
+        self.location = Location.objects.create(
+            name='Harbour', raw_text='Text', latlon_json={'lat': 51.5, 'lon': -0.12}
+        )
+        Location.objects.create(name='Mill', raw_text='Text', latlon_json={'lat': 51.51, 'lon': -0.13})
+        snippet = TextSnippet.objects.create(location=self.location, length='short', text='Short', hash='a',
+                                             is_current=True)
+        AudioSnippet.objects.create(text_snippet=snippet, voice_id='alto', audio_url='/a.mp3', is_current=True)
+        self.tour = Tour.objects.create(name='Tour', description='')
+        set_location_order(self.tour, [self.location.pk])
+
+    def async_request(self, method, url, **kwargs):
+        with override_settings(ROOT_URLCONF='guidea_engine.asgi_urls'):
+            return async_to_sync(getattr(self.async_client, method))(url, **kwargs)
+
+    def assertSameResponse(self, url, **headers):
+        cache.clear()
+        expected = self.client.get(url, **{f'HTTP_{name.upper()}': value for name, value in headers.items()})
+        cache.clear()
+        actual = self.async_request('get', url, headers=headers)
+        self.assertEqual(actual.status_code, expected.status_code)
+        self.assertEqual(actual.json(), expected.json())
+        for header in ('ETag', 'WWW-Authenticate'):
+            self.assertEqual(actual.get(header), expected.get(header), header)
+        return actual
+
+    def test_reads_match_the_sync_views(self):
+        urls = {
+            f'/api/locations/{self.location.pk}/': async_views.location_detail,
+            '/api/locations/0/': async_views.location_detail,
+            f'/api/locations/{self.location.pk}/snippets/': async_views.location_snippets,
+            '/api/locations/nearby/?lat=51.5&lon=-0.12&radius=5': async_views.nearby_locations,
+            '/api/locations/nearby/?lat=north&lon=-0.12': async_views.nearby_locations,
+            f'/api/tours/{self.tour.pk}/bundle/?length=short&voice=alto': async_views.tour_bundle,
+            f'/api/tours/{self.tour.pk}/bundle/?length=huge': async_views.tour_bundle,
+        }
+        for url, view in urls.items():
+            with self.subTest(url=url):
+                self.assertIs(resolve(url.partition('?')[0], 'guidea_engine.asgi_urls').func, view)
+                self.assertSameResponse(url, authorization=self.authorization)
+
+    def test_unauthenticated_reads_match_the_sync_views(self):
+        self.client.credentials()
+        for headers in ({}, {'authorization': 'Bearer nonsense'}):
+            with self.subTest(headers=headers):
+                response = self.assertSameResponse(f'/api/locations/{self.location.pk}/', **headers)
+                self.assertEqual(response.status_code, 401)
+
+    def test_writes_and_projection_fall_back_to_the_sync_views(self):
+        url = f'/api/locations/{self.location.pk}/'
+        projected = self.assertSameResponse(f'{url}?fields=id,name', authorization=self.authorization)
+        self.assertEqual(projected.json(), {'id': self.location.pk, 'name': 'Harbour'})
+
+        etag = self.async_request('get', url, headers={'authorization': self.authorization})['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.async_request(
+                'patch', url, data={'name': 'Old harbour'}, content_type='application/json',
+                headers={'authorization': self.authorization, 'if-match': etag},
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.location.refresh_from_db()
+        self.assertEqual(self.location.name, 'Old harbour')
+        self.assertEqual(
+            self.async_request('get', url, headers={'authorization': self.authorization}).json()['name'], 'Old harbour'
+        )
+
+
+class RendererTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('reader', password='password123'))
+        Location.objects.bulk_create([
+            Location(name=f'Café {index}', raw_text='Text ' * 20, latlon_json={'lat': 1.5}) for index in range(20)
+        ])
+
+    def test_orjson_matches_default_renderer(self):
+        default = self.client.get('/api/locations/')
+        fast = self.client.get('/api/locations/', HTTP_ACCEPT='application/json; encoder=orjson')
+        self.assertEqual(default['Content-Type'], 'application/json')
+        self.assertEqual(fast['Content-Type'], 'application/json; encoder=orjson')
+        self.assertEqual(fast.content, default.content)
+
+    @skipUnless(msgpack, 'msgpack is not installed')
+    def test_msgpack(self):
+        default = self.client.get('/api/locations/')
+        packed = self.client.get('/api/locations/', HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(msgpack.unpackb(packed.content), default.json())
+
+    def test_compresses_large_responses(self):
+        plain = self.client.get('/api/locations/')
+        compressed = self.client.get('/api/locations/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+        self.assertIn('Accept-Encoding', compressed['Vary'])
+
+        with override_settings(COMPRESSION_MIN_BYTES=len(plain.content) + 1):
+            self.assertFalse(self.client.get('/api/locations/', HTTP_ACCEPT_ENCODING='gzip').has_header('Content-Encoding'))
+
+
+    def test_compressed_responses_carry_weak_etags(self):
+        location = Location.objects.create(name='Long', raw_text='A long description. ' * 200, latlon_json={})
+        url = f'/api/locations/{location.pk}/'
+        strong = self.client.get(url)['ETag']
+        compressed = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertEqual(compressed['ETag'], f'W/{strong}')
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=compressed['ETag']).status_code, 304)
+        response = self.client.patch(url, {'name': 'Longer'}, HTTP_IF_MATCH=compressed['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+class ValuesSerializerTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('reader', password='password123'))
+        self.cathedral = Location.objects.create(name='Cathédrale', raw_text='Text', latlon_json={'lat': 48.85})
+        self.museum = Location.objects.create(name='Museum', raw_text='Text', latlon_json={})
+        TextSnippet.objects.create(location=self.cathedral, length='short', text='Short', hash='a', is_current=True)
+        TextSnippet.objects.create(location=self.museum, length='long', text='Long', hash='b')
+        set_location_order(Tour.objects.create(name='Walk', description='A walk'), [self.museum.pk, self.cathedral.pk])
+        Tour.objects.create(name='Empty', description='')
+
+    def assertSameOutput(self, values_serializer_class, queryset, fields=None):
+        values_serializer = values_serializer_class(fields=fields)
+        expected = values_serializer_class.serializer_class(queryset, many=True, fields=fields).data
+        fast = values_serializer.to_representation(values_serializer.select(queryset))
+        self.assertEqual(JSONRenderer().render(fast), JSONRenderer().render(expected))
+
+    def test_matches_model_serializers(self):
+        for values_serializer_class, queryset in (
+            (LocationValuesSerializer, Location.objects.order_by('id')),
+            (TextSnippetValuesSerializer, TextSnippet.objects.order_by('id')),
+            (TourValuesSerializer, Tour.objects.order_by('id')),
+        ):
+            with self.subTest(values_serializer_class.__name__):
+                self.assertSameOutput(values_serializer_class, queryset)
+                self.assertSameOutput(values_serializer_class, queryset, fields=['id', 'created'])
+
+    def test_location_count_ignores_outer_joins(self):
+        tours = self.client.get(f'/api/locations/{self.cathedral.pk}/tours/').json()['tours']
+        self.assertEqual(tours, [
+            {'id': tours[0]['id'], 'name': 'Walk', 'location_order_json': [self.museum.pk, self.cathedral.pk],
+             'location_count': 2},
+        ])
+
+
+class PerformanceMiddlewareTests(TestCase):
+    def setUp(self):
+        registry.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('reader', password='password123'))
+        self.location = Location.objects.create(name='Somewhere', raw_text='Text', latlon_json={})
+
+    def test_records_view_action_metrics(self):
+        cache.clear()
+        response = self.client.get(f'/api/locations/{self.location.pk}/')
+        self.assertRegex(response['Server-Timing'], r'^app;dur=[\d.]+, db;dur=[\d.]+;desc="1 queries", ser;dur=[\d.]+$')
+
+        with override_settings(METRICS_TOKEN='scrape'):
+            body = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape').content.decode()
+        labels = '{view="LocationViewSet.retrieve",method="GET",status="200"}'
+        self.assertIn(f'guidea_requests_total{labels} 1', body)
+        self.assertIn(f'guidea_db_queries_total{labels} 1', body)
+        self.assertIn(f'guidea_response_bytes_total{labels} {len(response.content)}', body)
+
+
+    def test_metrics_need_the_token(self):
+        with override_settings(METRICS_TOKEN=''):
+            self.assertEqual(self.client.get('/metrics').status_code, 404)
+            with override_settings(DEBUG=True):
+                self.assertEqual(self.client.get('/metrics').status_code, 200)
+        with override_settings(METRICS_TOKEN='scrape'):
+            self.assertEqual(self.client.get('/metrics').status_code, 401)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentWriteTests(TransactionTestCase):
+    """Parallel writers must not lose each other's appends or version increments"""
+    writers = 8
+    writes_per_writer = 5
+
+    def setUp(self):
+        self.user = User.objects.create_user('editor', password='password123')
+
+    def run_writers(self, write):
+        barrier = threading.Barrier(self.writers)
+        errors = []
+
+        def worker(index):
+            client = APIClient()
+            client.force_authenticate(self.user)
+            try:
+                barrier.wait()
+                for step in range(self.writes_per_writer):
+                    response = write(client, index, step)
+                    if response.status_code != 200:
+                        errors.append((response.status_code, response.data))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker, args=(index,)) for index in range(self.writers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_no_lost_appends(self):
+        tour = Tour.objects.create(name='Tour', description='')
+        locations = Location.objects.bulk_create([
+            Location(name=f'Stop {index}', raw_text='Text', latlon_json={})
+            for index in range(self.writers * self.writes_per_writer)
+        ])
+
+        def write(client, index, step):
+            location = locations[index * self.writes_per_writer + step]
+            return client.post(f'/api/tours/{tour.pk}/add-location/', {'location_id': location.pk})
+
+        self.run_writers(write)
+        self.assertCountEqual(tour.location_order, [location.pk for location in locations])
+
+    def test_no_lost_version_increments(self):
+        location = Location.objects.create(name='Busy', raw_text='Text', latlon_json={})
+
+        def write(client, index, step):
+            return client.patch(f'/api/locations/{location.pk}/', {'raw_text': f'Edit {index}.{step}'})
+
+        self.run_writers(write)
+        location.refresh_from_db()
+        self.assertEqual(location.version, 1 + self.writers * self.writes_per_writer)
+
+
+class JobRetryTests(TestCase):
+    def test_missing_tour_fails_without_retry(self):
+        tour = Tour.objects.create(name='Tour', description='')
+        job = enqueue('stitch_tour', {'tour_id': tour.pk, 'length': 'short'})
+        tour.delete()
+        job = run_job(claim_job('worker'))
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(job.attempts, 1)
+        self.assertIn('DoesNotExist', job.error)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'claims are serialized with Postgres advisory locks')
+class JobClaimTests(TransactionTestCase):
+    def test_concurrent_claims_respect_concurrency_limit(self):
+        jobs = [enqueue('prune_tokens') for _ in range(2)]
+        claimed = []
+
+        def claim_elsewhere():
+            try:
+                claimed.append(claim_job('worker-b'))
+            finally:
+                connections.close_all()
+
+        with override_settings(JOB_CONCURRENCY_LIMITS={'prune_tokens': 1}):
+            with transaction.atomic():
+                self.assertEqual(claim_job('worker-a'), jobs[0])
+                # Worker b reads the running count before worker a commits its claim
+                other = threading.Thread(target=claim_elsewhere)
+                other.start()
+                other.join(0.5)
+            other.join()
+        self.assertEqual(claimed, [None])
+        self.assertEqual(Job.objects.filter(status='running').count(), 1)
@@ -3,8 +3,8 @@ from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenRefreshView
 
 from .views import (
-    LocationViewSet, TextSnippetViewSet, AudioSnippetViewSet, TourViewSet,
-    RegisterView, LoginView, LogoutView, UserProfileView, UserView
+    LocationViewSet, TextSnippetViewSet, AudioSnippetViewSet, TourViewSet, JobViewSet,
+    RegisterView, LoginView, LogoutView, UserProfileView, UserView, SyncView
 )
 
 router = DefaultRouter()
@@ -12,6 +12,7 @@ router.register(r'locations', LocationViewSet)
 router.register(r'text-snippets', TextSnippetViewSet)
 router.register(r'audio-snippets', AudioSnippetViewSet)
 router.register(r'tours', TourViewSet)
+router.register(r'jobs', JobViewSet)
 
 urlpatterns = [
     # Authentication endpoints
@@ -21,4 +22,5 @@ urlpatterns = [
     path('auth/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('auth/profile/', UserProfileView.as_view(), name='user_profile'),
     path('auth/user/', UserView.as_view(), name='user'),
+    path('sync/', SyncView.as_view(), name='sync'),
 ] + router.urls
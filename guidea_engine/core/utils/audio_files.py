@@ -0,0 +1,71 @@
+import hashlib
+import mimetypes
+import re
+
+from django.core.cache import cache
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+STREAM_BLOCK_SIZE = 64 * 1024
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def content_type(path):
+    return mimetypes.guess_type(path.name)[0] or 'application/octet-stream'
+
+
+def file_etag(path, stat):
+    """
+    Strong ETag from the sha256 of the file's bytes. The digest is cached
+    against (path, size, mtime), so a file is only hashed again if it changes.
+    """
+    key = f'audio-etag:{path}:{stat.st_size}:{stat.st_mtime_ns}'
+    digest = cache.get(key)
+    if digest is None:
+        with open(path, 'rb') as source:
+            digest = hashlib.file_digest(source, 'sha256').hexdigest()
+        cache.set(key, digest, None)
+    return f'"{digest}"'
+
+
+def parse_range(header, size):
+    """
+    (start, end) inclusive byte offsets for a single-range Range header, or
+    None when the header should be ignored and the whole file sent (absent,
+    malformed, or several ranges). Raises RangeNotSatisfiable when the range
+    lies outside the file.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the final N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise RangeNotSatisfiable()
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable()
+    return start, end
+
+
+def iter_range(path, start, end, block_size=STREAM_BLOCK_SIZE):
+    """Yield the bytes from start to end (inclusive) in blocks"""
+    remaining = end - start + 1
+    with open(path, 'rb') as source:
+        source.seek(start)
+        while remaining > 0:
+            block = source.read(min(block_size, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            yield block
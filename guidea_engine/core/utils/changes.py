@@ -0,0 +1,101 @@
+"""
+Change log behind GET /api/sync/: every write to a location, snippet, audio
+snippet or tour appends a Change row, and clients ask for the rows after the
+cursor they last saw.
+
+Row saves and deletes (including cascades) are recorded by signals; bulk
+writes call record_changes themselves. The log is compacted so it holds the
+latest entry per object, plus tombstones for SYNC_TOMBSTONE_RETENTION.
+"""
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from core.models import Change
+
+DEFAULT_COMPACT_CHUNK_SIZE = 5000
+
+
+class CursorExpired(Exception):
+    """The cursor predates tombstones that have since been pruned"""
+
+
+def record_changes(kind, object_ids, deleted=False):
+    Change.objects.bulk_create([Change(kind=kind, object_id=object_id, deleted=deleted) for object_id in object_ids])
+
+
+def encode_cursor(change_id, issued):
+    return f'{change_id}.{int(issued.timestamp())}'
+
+
+def decode_cursor(cursor):
+    """(change id, issued datetime) for a cursor; raises ValueError when malformed"""
+    change_id, issued = cursor.split('.')
+    change_id, issued = int(change_id), int(issued)
+    if change_id < 0:
+        raise ValueError(cursor)
+    return change_id, datetime.fromtimestamp(issued, tz=dt_timezone.utc)
+
+
+def changes_since(cursor, limit):
+    """
+    (latest change per (kind, object id), next cursor, more) for up to limit
+    log entries after cursor. An empty or missing cursor starts from the
+    beginning of the log.
+
+    Ids are assigned at insert but become visible at commit, so a change can
+    appear behind one already returned. The next cursor therefore never moves
+    past entries younger than SYNC_SETTLE; they are sent again next time,
+    which clients treat as idempotent upserts.
+    """
+    now = timezone.now()
+    change_id = 0
+    if cursor:
+        change_id, issued = decode_cursor(cursor)
+        if issued < now - settings.SYNC_TOMBSTONE_RETENTION:
+            raise CursorExpired(cursor)
+
+    rows = list(
+        Change.objects.filter(id__gt=change_id).order_by('id').values_list('id', 'kind', 'object_id', 'deleted', 'created')
+        [:limit + 1]
+    )
+    more = len(rows) > limit
+    rows = rows[:limit]
+
+    latest = {}
+    next_id = change_id
+    settled = True
+    for row_id, kind, object_id, deleted, created in rows:
+        latest[kind, object_id] = deleted
+        settled = settled and created <= now - settings.SYNC_SETTLE
+        if settled:
+            next_id = row_id
+    # Entries past an unsettled one are younger still; stop paging until they settle
+    return latest, encode_cursor(next_id, now), more and settled
+
+
+def compact_changes(chunk_size=DEFAULT_COMPACT_CHUNK_SIZE, now=None):
+    """
+    Drop entries superseded by a newer one for the same object, then
+    tombstones older than SYNC_TOMBSTONE_RETENTION. Deletes run in chunks,
+    one short transaction each.
+    """
+    now = now or timezone.now()
+    newer = Change.objects.filter(kind=OuterRef('kind'), object_id=OuterRef('object_id'), id__gt=OuterRef('id'))
+    stale = {
+        'superseded': Change.objects.filter(Exists(newer)),
+        'tombstones': Change.objects.filter(deleted=True, created__lt=now - settings.SYNC_TOMBSTONE_RETENTION),
+    }
+    stats = {name: 0 for name in stale}
+    for name, queryset in stale.items():
+        while True:
+            with transaction.atomic():
+                ids = list(queryset.order_by('id').values_list('id', flat=True)[:chunk_size])
+                if ids:
+                    stats[name] += Change.objects.filter(id__in=ids).delete()[0]
+            if len(ids) < chunk_size:
+                break
+    return stats
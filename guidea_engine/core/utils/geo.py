@@ -0,0 +1,178 @@
+import math
+
+from django.db.models import Q
+
+EARTH_RADIUS_KM = 6371.0088
+GEOHASH_PRECISION = 9
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+# Upper bound on the number of cells a radius query may expand into
+MAX_QUERY_CELLS = 16
+
+
+def parse_latlon(latlon):
+    """Return (lat, lon) floats from a latlon_json value, or None if unusable"""
+    try:
+        if isinstance(latlon, dict):
+            lat = latlon.get('lat', latlon.get('latitude'))
+            lon = latlon.get('lon', latlon.get('lng', latlon.get('longitude')))
+        elif isinstance(latlon, (list, tuple)) and len(latlon) == 2:
+            lat, lon = latlon
+        else:
+            return None
+        lat, lon = float(lat), float(lon)
+    except (TypeError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return lat, lon
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance between two points in kilometres"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def cell_size(precision):
+    """(lat_degrees, lon_degrees) covered by a geohash cell of the given precision"""
+    bits = precision * 5
+    lon_bits = (bits + 1) // 2
+    lat_bits = bits // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+
+def encode_geohash(lat, lon, precision=GEOHASH_PRECISION):
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bit = 0
+    ch = 0
+    even = True
+    while len(chars) < precision:
+        rng, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        ch <<= 1
+        if value >= mid:
+            ch |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bit += 1
+        if bit == 5:
+            chars.append(GEOHASH_ALPHABET[ch])
+            bit = 0
+            ch = 0
+    return ''.join(chars)
+
+
+def geohash_for(latlon):
+    """Geohash for a latlon_json value; empty string when it has no usable point"""
+    point = parse_latlon(latlon)
+    if point is None:
+        return ''
+    return encode_geohash(*point)
+
+
+def _cells_at(lat, lon, radius_km, precision):
+    lat_h, lon_w = cell_size(precision)
+    dlat = radius_km / 111.32
+    min_lat, max_lat = max(-90.0, lat - dlat), min(90.0, lat + dlat)
+
+    # Widen the longitude span by the latitude closest to a pole
+    widest = max(abs(min_lat), abs(max_lat))
+    cos_lat = math.cos(math.radians(widest))
+    if cos_lat < 1e-6 or radius_km / (111.32 * cos_lat) >= 180:
+        lon_cols = range(int(round(360.0 / lon_w)))
+    else:
+        dlon = radius_km / (111.32 * cos_lat)
+        first = math.floor((lon - dlon + 180) / lon_w)
+        last = math.floor((lon + dlon + 180) / lon_w)
+        lon_cols = range(first, last + 1)
+
+    n_lon = int(round(360.0 / lon_w))
+    n_lat = int(round(180.0 / lat_h))
+    first_row = math.floor((min_lat + 90) / lat_h)
+    last_row = min(n_lat - 1, math.floor((max_lat + 90) / lat_h))
+
+    n_cells = (last_row - first_row + 1) * min(len(lon_cols), n_lon)
+    if n_cells > MAX_QUERY_CELLS:
+        return None
+
+    cells = set()
+    for row in range(first_row, last_row + 1):
+        cell_lat = -90 + (row + 0.5) * lat_h
+        for col in lon_cols:
+            cell_lon = -180 + ((col % n_lon) + 0.5) * lon_w
+            cells.add(encode_geohash(cell_lat, cell_lon, precision))
+    return cells
+
+
+def covering_cells(lat, lon, radius_km):
+    """
+    Geohash prefixes whose cells together cover the circle around (lat, lon).
+    Picks the finest precision that keeps the prefix list small.
+    """
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        cells = _cells_at(lat, lon, radius_km, precision)
+        if cells is not None:
+            return sorted(cells)
+    # Radius spans most of the globe; every geocoded location is a candidate
+    return list(GEOHASH_ALPHABET)
+
+
+def prefix_range(prefix):
+    """
+    Half-open [low, high) string range holding every geohash that starts with
+    prefix. Range filters use a plain btree index on any backend, unlike LIKE.
+    """
+    stem = prefix.rstrip(GEOHASH_ALPHABET[-1])
+    if not stem:
+        return prefix, None
+    next_char = GEOHASH_ALPHABET[GEOHASH_ALPHABET.index(stem[-1]) + 1]
+    return prefix, stem[:-1] + next_char
+
+
+def nearby_candidates(queryset, lat, lon, radius_km):
+    """(id, latlon_json) rows in the geohash cells covering the circle"""
+    cell_filter = Q()
+    for cell in covering_cells(lat, lon, radius_km):
+        low, high = prefix_range(cell)
+        cell_range = Q(geohash__gte=low)
+        if high is not None:
+            cell_range &= Q(geohash__lt=high)
+        cell_filter |= cell_range
+    return queryset.filter(cell_filter).exclude(geohash='').values_list('id', 'latlon_json')
+
+
+def _within_radius(rows, lat, lon, radius_km):
+    matches = []
+    for location_id, latlon in rows:
+        point = parse_latlon(latlon)
+        if point is None:
+            continue
+        distance = haversine_km(lat, lon, point[0], point[1])
+        if distance <= radius_km:
+            matches.append((location_id, distance))
+    matches.sort(key=lambda match: (match[1], match[0]))
+    return matches
+
+
+def find_nearby(queryset, lat, lon, radius_km):
+    """
+    Return [(location_id, distance_km), ...] within radius_km of (lat, lon),
+    nearest first. Only rows in the covering geohash cells are read; the
+    haversine pass then drops candidates outside the circle.
+    """
+    candidates = nearby_candidates(queryset, lat, lon, radius_km)
+    return _within_radius(candidates.iterator(chunk_size=2000), lat, lon, radius_km)
+
+
+async def afind_nearby(queryset, lat, lon, radius_km):
+    """Async find_nearby for async views"""
+    candidates = nearby_candidates(queryset, lat, lon, radius_km)
+    return _within_radius([row async for row in candidates], lat, lon, radius_km)
@@ -0,0 +1,70 @@
+from django.db import transaction
+from django.utils import timezone
+
+from core.models import Location
+from core.utils import response_cache
+from core.utils.changes import record_changes
+from core.utils.markdown_parser import iter_document_sections
+from core.utils.search import index_locations_on_commit
+from core.utils.snippets import chunked
+from core.utils.tours import invalidate_stitches_for_locations
+
+DEFAULT_CHUNK_SIZE = 500
+
+
+def upsert_sections(sections, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Create or update a Location per section, matched on slug.
+
+    Sections are consumed in chunks; each chunk costs one lookup query plus one
+    bulk_create and one bulk_update. version is only bumped when a section's
+    text actually changed.
+    """
+    stats = {'created': 0, 'updated': 0, 'unchanged': 0}
+    for chunk in chunked(sections, chunk_size):
+        with transaction.atomic():
+            existing = Location.objects.select_for_update().filter(
+                slug__in=[section['slug'] for section in chunk]
+            ).only('id', 'slug', 'name', 'raw_text', 'version').in_bulk(field_name='slug')
+
+            now = timezone.now()
+            to_create = []
+            to_update = []
+            bumped = []
+            for section in chunk:
+                location = existing.get(section['slug'])
+                if location is None:
+                    to_create.append(Location(
+                        slug=section['slug'],
+                        name=section['name'],
+                        raw_text=section['text'],
+                        latlon_json={},
+                    ))
+                    continue
+                if location.raw_text == section['text'] and location.name == section['name']:
+                    stats['unchanged'] += 1
+                    continue
+                if location.raw_text != section['text']:
+                    location.raw_text = section['text']
+                    location.version += 1
+                    bumped.append(location.pk)
+                location.name = section['name']
+                location.updated = now  # bulk_update skips auto_now
+                to_update.append(location)
+
+            Location.objects.bulk_create(to_create)
+            Location.objects.bulk_update(to_update, ['name', 'raw_text', 'version', 'updated'])
+            response_cache.invalidate_locations([location.pk for location in to_update])
+            index_locations_on_commit(location.pk for location in to_create + to_update)
+            record_changes('location', [location.pk for location in to_create + to_update])
+            if bumped:
+                invalidate_stitches_for_locations(bumped)
+            stats['created'] += len(to_create)
+            stats['updated'] += len(to_update)
+    return stats
+
+
+def import_guidebook(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Stream a markdown guidebook from disk into Location rows"""
+    with open(path, encoding='utf-8') as document:
+        return upsert_sections(iter_document_sections(document), chunk_size=chunk_size)
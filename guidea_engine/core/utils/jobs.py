@@ -0,0 +1,186 @@
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import connection, transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from core.models import Job, Location, TextSnippet, Tour
+from core.utils.snippets import changed_locations, generate_snippets_bulk
+from core.utils.changes import DEFAULT_COMPACT_CHUNK_SIZE, compact_changes
+from core.utils.stitching import MissingAudioError, StitchError, get_or_build_stitch
+from core.utils.tokens import DEFAULT_PRUNE_CHUNK_SIZE, prune_expired_tokens
+from core.utils.tts import synthesise_snippets
+
+logger = logging.getLogger(__name__)
+
+# kind -> callable taking the job payload as keyword arguments
+HANDLERS = {}
+
+
+class PermanentJobError(Exception):
+    """Raised by handlers for failures a retry cannot fix"""
+
+
+def job_handler(kind):
+    """Register a function as the handler for jobs of this kind"""
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+
+def enqueue(kind, payload=None, max_attempts=None, dedupe=False):
+    """
+    Queue a job. With dedupe=True an identical job (same kind and payload)
+    that is still queued or running is returned instead of adding another, so
+    repeated requests for the same work share one job.
+    """
+    if kind not in HANDLERS:
+        raise ValueError(f'Unknown job kind: {kind}')
+    payload = payload or {}
+    with transaction.atomic():
+        if dedupe:
+            # Two requests could both find no pending job; the lock makes the second wait and see the first
+            _lock_kind(kind, 'enqueue')
+            pending = Job.objects.select_for_update().filter(kind=kind, status__in=('queued', 'running'))
+            for job in pending.order_by('id'):
+                if job.payload == payload:
+                    return job
+        return Job.objects.create(
+            kind=kind,
+            payload=payload,
+            max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+        )
+
+
+def _saturated_kinds():
+    """Kinds that already have as many running jobs as their concurrency limit allows"""
+    limits = settings.JOB_CONCURRENCY_LIMITS
+    running = Job.objects.filter(status='running', kind__in=list(limits)).values('kind').annotate(running=Count('id'))
+    return [row['kind'] for row in running if row['running'] >= limits[row['kind']]]
+
+
+def _lock_kind(kind, purpose='claim'):
+    """
+    Serialize claims (or deduplicated enqueues) of one kind until the
+    transaction ends. Postgres takes a transaction-level advisory lock; SQLite
+    already serializes writers.
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', [f'core.job.{purpose}:{kind}'])
+
+
+def claim_job(worker_id, kinds=None):
+    """Atomically take the oldest runnable job, or return None when there is nothing to do"""
+    limits = settings.JOB_CONCURRENCY_LIMITS
+    with transaction.atomic():
+        queued = Job.objects.filter(status='queued', run_after__lte=timezone.now()).order_by('run_after', 'id')
+        if kinds:
+            queued = queued.filter(kind__in=kinds)
+        # Workers skip rows another worker has already locked instead of queueing behind it
+        skip_locked = connection.features.has_select_for_update_skip_locked
+        saturated = _saturated_kinds()
+        while True:
+            job = queued.exclude(kind__in=saturated).select_for_update(skip_locked=skip_locked).first()
+            if job is None:
+                return None
+            if job.kind not in limits:
+                break
+            # The count above was read without a lock, so two workers could both see a free
+            # slot. Recount under the kind's lock; a claim that committed meanwhile is counted.
+            _lock_kind(job.kind)
+            if Job.objects.filter(status='running', kind=job.kind).count() < limits[job.kind]:
+                break
+            saturated.append(job.kind)
+
+        job.status = 'running'
+        job.attempts += 1
+        job.locked_by = worker_id
+        job.locked_at = timezone.now()
+        job.save(update_fields=['status', 'attempts', 'locked_by', 'locked_at', 'updated'])
+    return job
+
+
+def run_job(job):
+    """Run a claimed job, recording its result or scheduling a retry with exponential backoff"""
+    try:
+        handler = HANDLERS[job.kind]
+        job.result = handler(**job.payload)
+        job.status = 'succeeded'
+        job.error = ''
+    except (ObjectDoesNotExist, PermanentJobError):
+        # The tour or location is gone, or the input can never work; retrying will not help
+        job.error = traceback.format_exc()
+        job.status = 'failed'
+        logger.error('Job %s (%s) failed permanently', job.pk, job.kind)
+    except Exception:
+        job.error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            job.status = 'queued'
+            job.run_after = timezone.now() + timedelta(seconds=settings.JOB_RETRY_BACKOFF * 2 ** (job.attempts - 1))
+            logger.warning('Job %s (%s) failed, retry %s scheduled', job.pk, job.kind, job.attempts)
+        else:
+            job.status = 'failed'
+            logger.error('Job %s (%s) failed permanently', job.pk, job.kind)
+    job.locked_by = ''
+    job.locked_at = None
+    job.save(update_fields=['result', 'status', 'error', 'run_after', 'locked_by', 'locked_at', 'updated'])
+    return job
+
+
+def requeue_stale_jobs():
+    """Put back jobs whose worker died mid-run"""
+    cutoff = timezone.now() - settings.JOB_STALE_AFTER
+    return Job.objects.filter(status='running', locked_at__lt=cutoff).update(
+        status='queued', locked_by='', locked_at=None, run_after=timezone.now()
+    )
+
+
+@job_handler('generate_snippets')
+def generate_snippets_job(location_ids=None, changed=False, replace=False):
+    if location_ids is not None:
+        locations = Location.objects.filter(pk__in=location_ids)
+    elif changed:
+        locations = changed_locations()
+    else:
+        locations = Location.objects.all()
+    return generate_snippets_bulk(locations, replace=replace)
+
+
+@job_handler('synthesise_audio')
+def synthesise_audio_job(location_ids=None, voice_id=None):
+    snippets = TextSnippet.objects.all()
+    if location_ids is not None:
+        snippets = snippets.filter(location_id__in=location_ids)
+    return synthesise_snippets(snippets, voice_id=voice_id)
+
+
+@job_handler('stitch_tour')
+def stitch_tour_job(tour_id, length, voice_id=None):
+    try:
+        entry, cached = get_or_build_stitch(Tour.objects.get(pk=tour_id), length, voice_id)
+    except MissingAudioError:
+        raise  # Audio may still be on its way from a synthesis job
+    except StitchError as e:
+        raise PermanentJobError(str(e)) from e
+    return {
+        'audio_url': entry.audio_url,
+        'cached': cached,
+        'location_versions_hash': entry.location_versions_hash,
+        'expires_at': entry.expires_at.isoformat(),
+    }
+
+
+@job_handler('prune_tokens')
+def prune_tokens_job(chunk_size=DEFAULT_PRUNE_CHUNK_SIZE):
+    return prune_expired_tokens(chunk_size=chunk_size)
+
+
+@job_handler('compact_changes')
+def compact_changes_job(chunk_size=DEFAULT_COMPACT_CHUNK_SIZE):
+    return compact_changes(chunk_size=chunk_size)
@@ -1,17 +1,112 @@
-import frontmatter
 import re
+from itertools import chain
 
-def extract_locations_from_document(document: str):
-    post = frontmatter.loads(document)
-    loc_map = post.get('loc_map', {})
-    body = post.content
+import yaml
+
+HEADING_RE = re.compile(r'^(#{1,6})\s')
+FENCE_RE = re.compile(r'^\s*(```|~~~)')
+FRONT_MATTER_BOUNDARY_RE = re.compile(r'^-{3,}\s*$')
+
+
+def read_front_matter(lines):
+    """
+    Consume a leading '---' delimited YAML block from an iterator of lines.
+    Returns (metadata, body_lines) where body_lines continues the same iterator.
+
+    Follows python-frontmatter: leading blank lines are skipped, a boundary is
+    three or more dashes, and an unterminated block or a non-mapping header
+    leaves the document without metadata.
+    """
+    lines = iter(lines)
+    first = next(lines, None)
+    while first is not None and not first.strip():
+        first = next(lines, None)
+    if first is None:
+        return {}, iter(())
+    if not FRONT_MATTER_BOUNDARY_RE.match(first):
+        return {}, chain([first.lstrip()], lines)
 
-    locations = []
+    header = []
+    for line in lines:
+        if FRONT_MATTER_BOUNDARY_RE.match(line):
+            break
+        header.append(line)
+    else:
+        return {}, iter([first] + header)
+    metadata = yaml.safe_load(''.join(header))
+    return (metadata if isinstance(metadata, dict) else {}), lines
+
+
+def iter_location_sections(lines, loc_map):
+    """
+    Yield {'slug', 'name', 'text'} for every loc_map heading found in the body,
+    in document order, scanning the lines once.
+
+    A line matches a loc_map heading when it starts with it, so '# Museum'
+    also claims '# Museum of Art (closed Mondays)'; lines inside code fences
+    never match. The name comes from the loc_map heading. A section runs from
+    its heading to the next heading of the same or a higher level, or the next
+    mapped heading, whichever comes first. Only the section being read is held
+    in memory.
+    """
+    slugs_by_heading = {}
     for slug, heading in loc_map.items():
-        pattern = re.escape(heading.strip())
-        if re.search(rf'^{pattern}', body, re.MULTILINE):
-            locations.append({
-                'slug': slug,
-                'name': heading.lstrip('# ').strip()
-            })
-    return locations
+        slugs_by_heading.setdefault(heading.strip(), []).append(slug)
+    # Longest first, so the most specific heading names the section
+    lengths = sorted({len(heading) for heading in slugs_by_heading if heading}, reverse=True)
+
+    seen = set()
+    in_fence = False
+    current = None  # ([(slug, name)], level, [lines])
+    for line in lines:
+        if FENCE_RE.match(line):
+            in_fence = not in_fence
+        if in_fence:
+            if current is not None:
+                current[2].append(line)
+            continue
+
+        matched = [
+            (slug, loc_map[slug].lstrip('# ').strip())
+            for length in lengths
+            for slug in slugs_by_heading.get(line[:length], ())
+            if slug not in seen
+        ]
+        heading = HEADING_RE.match(line)
+        # A mapped line that is not a markdown heading ends at the next heading
+        level = len(heading.group(1)) if heading else 7
+        if current is not None and (matched or (heading and level <= current[1])):
+            yield from _sections(current)
+            current = None
+        if matched:
+            seen.update(slug for slug, _ in matched)
+            current = (matched, level, [])
+            continue
+        if current is not None:
+            current[2].append(line)
+
+    if current is not None:
+        yield from _sections(current)
+
+
+def _sections(current):
+    text = ''.join(current[2]).strip()
+    for slug, name in current[0]:
+        yield {'slug': slug, 'name': name, 'text': text}
+
+
+def iter_document_sections(lines):
+    """Yield location sections from a guidebook given as an iterator of lines"""
+    metadata, body = read_front_matter(lines)
+    yield from iter_location_sections(body, metadata.get('loc_map') or {})
+
+
+def extract_locations_from_document(document: str):
+    """{'slug', 'name'} for each loc_map entry whose heading is in the document, in loc_map order"""
+    metadata, body = read_front_matter(document.splitlines(keepends=True))
+    loc_map = metadata.get('loc_map') or {}
+    found = {section['slug'] for section in iter_location_sections(body, loc_map)}
+    return [
+        {'slug': slug, 'name': heading.lstrip('# ').strip()}
+        for slug, heading in loc_map.items() if slug in found
+    ]
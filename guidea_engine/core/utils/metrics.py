@@ -0,0 +1,180 @@
+"""
+Per-request performance metrics: wall time, database queries and their time,
+serializer time and response size, aggregated per view action.
+
+PerformanceMiddleware opens a RequestMetrics for each request. Database time
+comes from an execute wrapper installed on every connection, serializer time
+from TimedSerializerMixin. Totals are kept in this process and rendered in
+the Prometheus text format for /metrics; with several worker processes, each
+one reports its own.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+logger = logging.getLogger('core.performance')
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    __slots__ = ('start', 'queries', 'db_time', 'serializer_time', '_serializer_depth')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self._serializer_depth = 0
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+
+def begin_request():
+    """Start collecting for the current request; pass the token to end_request"""
+    return _current.set(RequestMetrics())
+
+
+def end_request(token):
+    metrics = _current.get()
+    _current.reset(token)
+    return metrics
+
+
+def record_query(execute, sql, params, many, context):
+    """Connection execute wrapper adding each query to the current request"""
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - start
+        metrics.queries += 1
+        metrics.db_time += duration
+        if duration * 1000 >= settings.PERFORMANCE_SLOW_QUERY_MS:
+            logger.warning('Slow query (%.1f ms): %.500s', duration * 1000, sql)
+
+
+def instrument_connection(connection):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def serializer_timer():
+    """Time serializer work, counting nested serializers once"""
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    metrics._serializer_depth += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics._serializer_depth -= 1
+        if not metrics._serializer_depth:
+            metrics.serializer_time += time.perf_counter() - start
+
+
+def view_label(request):
+    """`ViewClass.action` for DRF views, the function name for others"""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    func = match.func
+    cls = getattr(func, 'cls', None)
+    if cls is None:
+        return f'{func.__module__}.{func.__name__}'
+    actions = getattr(func, 'actions', None)
+    if actions:
+        return f'{cls.__name__}.{actions.get(request.method.lower(), request.method.lower())}'
+    return cls.__name__
+
+
+class Registry:
+    """Thread-safe totals keyed by (view, method, status)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, view, method, status, duration, metrics, response_bytes):
+        key = (view, method, str(status))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {
+                    'count': 0, 'duration': 0.0, 'buckets': [0] * len(DURATION_BUCKETS),
+                    'queries': 0, 'db_time': 0.0, 'serializer_time': 0.0, 'bytes': 0,
+                }
+            series['count'] += 1
+            series['duration'] += duration
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    series['buckets'][index] += 1
+            series['queries'] += metrics.queries
+            series['db_time'] += metrics.db_time
+            series['serializer_time'] += metrics.serializer_time
+            series['bytes'] += response_bytes
+
+    def snapshot(self):
+        with self._lock:
+            return {key: {**series, 'buckets': list(series['buckets'])} for key, series in self._series.items()}
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+registry = Registry()
+
+
+def _labels(view, method, status):
+    def escape(value):
+        return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return f'view="{escape(view)}",method="{method}",status="{status}"'
+
+
+def render_prometheus(gauges=()):
+    """
+    All series in the Prometheus text exposition format, followed by gauges:
+    (name, help text, value) triples read by the caller at scrape time.
+    """
+    snapshot = sorted(registry.snapshot().items())
+    lines = []
+
+    def family(name, kind, help_text, field):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for key, series in snapshot:
+            lines.append(f'{name}{{{_labels(*key)}}} {series[field]}')
+
+    family('guidea_requests_total', 'counter', 'Requests handled.', 'count')
+    lines.append('# HELP guidea_request_duration_seconds Wall time from middleware entry to response.')
+    lines.append('# TYPE guidea_request_duration_seconds histogram')
+    for key, series in snapshot:
+        labels = _labels(*key)
+        for bound, count in zip(DURATION_BUCKETS, series['buckets']):
+            lines.append(f'guidea_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+        lines.append(f'guidea_request_duration_seconds_bucket{{{labels},le="+Inf"}} {series["count"]}')
+        lines.append(f'guidea_request_duration_seconds_sum{{{labels}}} {series["duration"]}')
+        lines.append(f'guidea_request_duration_seconds_count{{{labels}}} {series["count"]}')
+    family('guidea_db_queries_total', 'counter', 'Database queries run.', 'queries')
+    family('guidea_db_seconds_total', 'counter', 'Time spent in database queries.', 'db_time')
+    family('guidea_serializer_seconds_total', 'counter', 'Time spent serializing and validating.',
+           'serializer_time')
+    family('guidea_response_bytes_total', 'counter', 'Response body bytes, where the length is known.', 'bytes')
+    for name, help_text, value in gauges:
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} gauge', f'{name} {value}']
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,98 @@
+import hashlib
+import json
+import os
+import tempfile
+import zipfile
+from pathlib import Path
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.text import slugify
+
+from core.models import AudioSnippet, Location, TextSnippet
+from core.utils.stitching import StitchError, audio_path, location_versions_hash
+
+# Bump when the archive layout changes so cached packages are rebuilt
+PACKAGE_FORMAT = 1
+
+
+def package_hash(tour, length, voice_id=None):
+    """
+    location_versions_hash over the tour's stops, extended with each stop's
+    updated time (version only tracks raw_text, the manifest also carries
+    name and latlon), its current snippet and audio ids, and the tour's own
+    updated time: anything that would change the archive changes the hash.
+    """
+    location_ids = tour.location_order
+    versions = {
+        location_id: [version, updated.isoformat()]
+        for location_id, version, updated in Location.objects.filter(pk__in=location_ids).values_list(
+            'id', 'version', 'updated'
+        )
+    }
+    snippets = TextSnippet.objects.filter(location_id__in=location_ids, length=length, is_current=True)
+    snippet_locations = dict(snippets.values_list('id', 'location_id'))
+    audio = AudioSnippet.objects.filter(text_snippet_id__in=snippet_locations, is_current=True)
+    if voice_id:
+        audio = audio.filter(voice_id=voice_id)
+    audio_ids = {}
+    for audio_id, snippet_id in audio.order_by('id').values_list('id', 'text_snippet_id'):
+        audio_ids.setdefault(snippet_id, []).append(audio_id)
+    for snippet_id, location_id in sorted(snippet_locations.items()):
+        versions[location_id] += [snippet_id, audio_ids.get(snippet_id, [])]
+
+    versions_hash = location_versions_hash(location_ids, versions, length, voice_id)
+    return hashlib.md5(f'{PACKAGE_FORMAT}:{versions_hash}:{tour.updated.isoformat()}'.encode()).hexdigest()
+
+
+def package_path(tour_id, length, voice_id, digest):
+    return Path(settings.PACKAGE_ROOT) / f'{tour_id}-{length}-{slugify(voice_id or "all")}-{digest}.zip'
+
+
+def _add_audio_files(payload):
+    """
+    Point each audio entry in the bundle payload at its file inside the
+    archive; returns {arcname: path} of the files to include.
+    """
+    files = {}
+    root = Path(settings.AUDIO_ROOT).resolve()
+    for stop in payload['locations']:
+        for audio in stop['audio']:
+            audio['file'] = None
+            try:
+                path = audio_path(audio['audio_url'])
+            except StitchError:
+                continue
+            if path.is_file():
+                audio['file'] = f'audio/{path.relative_to(root).as_posix()}'
+                files[audio['file']] = path
+    return files
+
+
+def write_package(destination, payload):
+    """
+    Write the tour bundle payload and the audio it references to a zip at
+    destination. Audio is copied into the archive in blocks and stored
+    uncompressed; the file is built beside destination and renamed into
+    place, so readers never see a partial archive.
+    """
+    files = _add_audio_files(payload)
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    fd, partial = tempfile.mkstemp(dir=destination.parent, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as output, zipfile.ZipFile(output, 'w') as archive:
+            manifest = json.dumps({'format': PACKAGE_FORMAT, **payload}, cls=DjangoJSONEncoder, ensure_ascii=False)
+            archive.writestr('manifest.json', manifest, zipfile.ZIP_DEFLATED)
+            for arcname, path in files.items():
+                archive.write(path, arcname, zipfile.ZIP_STORED)
+        os.replace(partial, destination)
+    except BaseException:
+        Path(partial).unlink(missing_ok=True)
+        raise
+
+    # Older builds for the same tour, length and voice are superseded
+    prefix = destination.name.rsplit('-', 1)[0]
+    for stale in destination.parent.glob(f'{prefix}-*.zip'):
+        if stale != destination and stale.name.rsplit('-', 1)[0] == prefix:
+            stale.unlink(missing_ok=True)
+    return destination
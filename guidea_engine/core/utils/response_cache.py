@@ -0,0 +1,137 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.http import http_date, parse_http_date_safe, parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def location_key(location_id):
+    return f'response:location:{location_id}'
+
+
+def snippets_key(location_id):
+    return f'response:location:{location_id}:snippets'
+
+
+def tour_key(tour_id):
+    return f'response:tour:{tour_id}'
+
+
+def location_etag(location):
+    return f'"loc-{location.pk}-v{location.version}-{location.updated.timestamp():.6f}"'
+
+
+def snippets_etag(snippets):
+    digest = hashlib.md5()
+    for snippet in snippets:
+        digest.update(f'{snippet.pk}:{snippet.hash}:{snippet.is_current}:{snippet.updated.timestamp():.6f};'.encode())
+    return f'"snip-{digest.hexdigest()}"'
+
+
+def tour_etag(tour):
+    return f'"tour-{tour.pk}-{tour.updated.timestamp():.6f}"'
+
+
+def get(key):
+    return cache.get(key)
+
+
+def _entry(etag, last_modified, data):
+    return {
+        'etag': etag,
+        'last_modified': int(last_modified.timestamp()) if last_modified else None,
+        'data': data,
+    }
+
+
+def store(key, etag, last_modified, data):
+    """Cache serialized response data along with its validators"""
+    entry = _entry(etag, last_modified, data)
+    cache.set(key, entry, settings.RESPONSE_CACHE_TIMEOUT)
+    return entry
+
+
+async def aget(key):
+    return await cache.aget(key)
+
+
+async def astore(key, etag, last_modified, data):
+    entry = _entry(etag, last_modified, data)
+    await cache.aset(key, entry, settings.RESPONSE_CACHE_TIMEOUT)
+    return entry
+
+
+def etag_matches(header, etag):
+    """
+    True when an If-None-Match or If-Match header lists etag or '*'. The W/
+    prefix is ignored: these ETags name row and file versions, and only a
+    content coding (CompressionMiddleware) marks them weak.
+    """
+    etags = {tag.removeprefix('W/') for tag in parse_etags(header)}
+    return '*' in etags or etag.removeprefix('W/') in etags
+
+
+def not_modified(request, entry):
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        return etag_matches(if_none_match, entry['etag'])
+    if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+    if if_modified_since is not None and entry['last_modified'] is not None:
+        return entry['last_modified'] <= if_modified_since
+    return False
+
+
+def if_match_failed(request, etag):
+    """True when the request carries an If-Match header that does not match etag"""
+    if_match = request.headers.get('If-Match')
+    return bool(if_match) and not etag_matches(if_match, etag)
+
+
+def respond(request, entry):
+    """200 with the cached body, or 304 when the client's validators still match"""
+    if not_modified(request, entry):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = Response(entry['data'])
+    for header, value in validator_headers(entry).items():
+        response[header] = value
+    return response
+
+
+def validator_headers(entry):
+    headers = {'ETag': entry['etag']}
+    if entry['last_modified'] is not None:
+        headers['Last-Modified'] = http_date(entry['last_modified'])
+    # Clients must revalidate, which is cheap thanks to the ETag
+    headers['Cache-Control'] = 'private, no-cache'
+    return headers
+
+
+def _delete_after_commit(keys):
+    # Deleting before commit would let a concurrent read re-cache the old rows
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def invalidate_locations(location_ids):
+    keys = []
+    for location_id in location_ids:
+        keys += [location_key(location_id), snippets_key(location_id)]
+    if keys:
+        _delete_after_commit(keys)
+
+
+def invalidate_location(location_id):
+    invalidate_locations([location_id])
+
+
+def invalidate_snippets(location_ids):
+    keys = [snippets_key(location_id) for location_id in location_ids]
+    if keys:
+        _delete_after_commit(keys)
+
+
+def invalidate_tour(tour_id):
+    _delete_after_commit([tour_key(tour_id)])
@@ -0,0 +1,191 @@
+"""
+Full-text search over locations: name, raw_text and current snippet text.
+
+Each location has a SearchDocument, rebuilt whenever the location is saved
+or its snippets are regenerated. On Postgres the document holds a weighted
+tsvector behind a GIN index and queries are ranked with ts_rank. Other
+databases (SQLite test runs) search an in-process inverted index built from
+the same rows and kept in step through SearchDocument.updated.
+"""
+import math
+import re
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection, transaction
+from django.db.models import F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from core.models import Location, SearchDocument, TextSnippet
+
+DEFAULT_CHUNK_SIZE = 500
+
+# Relative weight of each source, as Postgres ranks its A/B/C labels by default
+FIELD_WEIGHTS = {'name': 1.0, 'raw_text': 0.4, 'snippets': 0.2}
+
+TERM_RE = re.compile(r'\w+')
+STOP_WORDS = frozenset(
+    'a an and are as at be but by for from has have in is it its of on or that the this to was were with'.split()
+)
+
+
+def uses_tsvector():
+    return connection.vendor == 'postgresql'
+
+
+def tokenize(text):
+    return [term for term in TERM_RE.findall(text.lower()) if term not in STOP_WORDS]
+
+
+def stale_documents():
+    """Locations without a search document built from their current versions"""
+    # snippets_version is null until snippets are first generated; 0 stands in for it
+    return Location.objects.annotate(
+        indexed_version=F('search_document__version'),
+        indexed_snippets_version=Coalesce('search_document__snippets_version', 0),
+    ).filter(
+        Q(indexed_version__isnull=True)
+        | ~Q(indexed_version=F('version'))
+        | ~Q(indexed_snippets_version=Coalesce('snippets_version', 0))
+    )
+
+
+def _vector():
+    config = settings.SEARCH_CONFIG
+    location = Location.objects.filter(pk=OuterRef('location_id'))
+    snippets = TextSnippet.objects.filter(location_id=OuterRef('location_id'), is_current=True).values(
+        'location_id'
+    ).annotate(text=StringAgg('text', ' ', ordering='length')).values('text')
+    return (
+        SearchVector(Subquery(location.values('name')), weight='A', config=config)
+        + SearchVector(Subquery(location.values('raw_text')), weight='B', config=config)
+        + SearchVector(Subquery(snippets), weight='C', config=config)
+    )
+
+
+def _chunks(location_ids, chunk_size=DEFAULT_CHUNK_SIZE):
+    location_ids = list(location_ids)
+    for start in range(0, len(location_ids), chunk_size):
+        yield location_ids[start:start + chunk_size]
+
+
+def index_locations(location_ids, chunk_size=DEFAULT_CHUNK_SIZE):
+    """(Re)build the search documents of these locations; returns how many were written"""
+    written = 0
+    for chunk in _chunks(location_ids, chunk_size):
+        with transaction.atomic():
+            now = timezone.now()
+            documents = [
+                SearchDocument(location_id=pk, version=version, snippets_version=snippets_version, updated=now)
+                for pk, version, snippets_version in Location.objects.filter(pk__in=chunk).values_list(
+                    'pk', 'version', 'snippets_version'
+                )
+            ]
+            SearchDocument.objects.bulk_create(
+                documents, update_conflicts=True, unique_fields=['location'],
+                update_fields=['version', 'snippets_version', 'updated'],
+            )
+            if uses_tsvector():
+                SearchDocument.objects.filter(pk__in=chunk).update(vector=_vector())
+        written += len(documents)
+    return written
+
+
+def index_locations_on_commit(location_ids):
+    """Rebuild the documents once the current transaction has committed"""
+    location_ids = list(location_ids)
+    if location_ids:
+        transaction.on_commit(lambda: index_locations(location_ids))
+
+
+class InvertedIndex:
+    """
+    term -> {location id: weighted term frequency} over every search document.
+    Rows rebuilt since the last sync are reloaded before each search; a
+    change in the document count (deletions) triggers a full rebuild.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._postings = defaultdict(dict)
+        self._terms = {}
+        self._synced_until = None
+
+    def _document_terms(self, location_ids):
+        weighted = {pk: defaultdict(float) for pk in location_ids}
+        for pk, name, raw_text in Location.objects.filter(pk__in=location_ids).values_list('pk', 'name', 'raw_text'):
+            for field, text in (('name', name), ('raw_text', raw_text)):
+                for term in tokenize(text):
+                    weighted[pk][term] += FIELD_WEIGHTS[field]
+        snippets = TextSnippet.objects.filter(location_id__in=location_ids, is_current=True)
+        for pk, text in snippets.values_list('location_id', 'text'):
+            for term in tokenize(text):
+                weighted[pk][term] += FIELD_WEIGHTS['snippets']
+        return weighted
+
+    def _load(self, location_ids):
+        for chunk in _chunks(location_ids):
+            for pk, terms in self._document_terms(chunk).items():
+                for term in self._terms.pop(pk, ()):
+                    self._postings[term].pop(pk, None)
+                self._terms[pk] = terms
+                for term, weight in terms.items():
+                    self._postings[term][pk] = weight
+
+    def sync(self):
+        changed = SearchDocument.objects.all()
+        if self._synced_until is not None:
+            changed = changed.filter(updated__gte=self._synced_until)
+        rows = list(changed.values_list('location_id', 'updated'))
+        if rows:
+            self._load([pk for pk, _ in rows])
+            self._synced_until = max(updated for _, updated in rows)
+        if SearchDocument.objects.count() != len(self._terms):
+            self._reset()
+            self.sync()
+
+    def search(self, query):
+        """[(location id, score)] for documents containing every query term, best first"""
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        with self._lock:
+            self.sync()
+            postings = [self._postings.get(term, {}) for term in terms]
+            if not all(postings):
+                return []
+            total = len(self._terms)
+            scores = defaultdict(float)
+            for posting in postings:
+                idf = math.log(1 + total / len(posting))
+                for pk, weight in posting.items():
+                    scores[pk] += weight * idf
+            matches = set.intersection(*(set(posting) for posting in postings))
+        return sorted(((pk, scores[pk]) for pk in matches), key=lambda match: (-match[1], match[0]))
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+
+
+inverted_index = InvertedIndex()
+
+
+def search_locations(query):
+    """[(location id, rank)] of locations matching query, best first"""
+    if not uses_tsvector():
+        return inverted_index.search(query)
+    search_query = SearchQuery(query, search_type='websearch', config=settings.SEARCH_CONFIG)
+    return list(
+        SearchDocument.objects.filter(vector=search_query)
+        .annotate(rank=SearchRank(F('vector'), search_query))
+        .order_by('-rank', 'location_id')
+        .values_list('location_id', 'rank')
+    )
@@ -0,0 +1,211 @@
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice, repeat
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+
+from core.models import AudioSnippet, Location, TextSnippet
+from core.utils import response_cache
+from core.utils.changes import record_changes
+from core.utils.search import index_locations_on_commit
+from core.utils.summarisers import get_summariser, init_pool_worker, summarise_batch
+
+# Character budget per snippet length; None keeps the full text
+SNIPPET_LIMITS = {
+    'short': 200,
+    'medium': 500,
+    'long': None,
+}
+
+DEFAULT_CHUNK_SIZE = 500
+
+
+def snippet_hash(text):
+    """md5 of the snippet text, used for change detection"""
+    return hashlib.md5(text.encode()).hexdigest()
+
+
+def summary_key(summariser, raw_text, length, limit):
+    """Memo key: the backend, md5 of the raw text and the length target"""
+    return f'summary:{summariser.name}:{length}:{limit}:{hashlib.md5(raw_text.encode()).hexdigest()}'
+
+
+def summarise_texts(raw_texts, executor=None, workers=1):
+    """
+    Return [{length: text}] for every TextSnippet length, one dict per raw text.
+
+    Summaries are memoised in the cache, so unchanged text is never summarised
+    twice. The misses for each length go to the summariser as one batch, or as
+    `workers` batches over executor when a process pool is given.
+    """
+    summariser = get_summariser()
+    results = [{} for _ in raw_texts]
+    for length_choice, _ in TextSnippet.LENGTH_CHOICES:
+        limit = SNIPPET_LIMITS[length_choice]
+        if limit is None:
+            for result, raw_text in zip(results, raw_texts):
+                result[length_choice] = raw_text
+            continue
+
+        keys = [summary_key(summariser, raw_text, length_choice, limit) for raw_text in raw_texts]
+        summaries = cache.get_many(keys)
+        missing = {}
+        for key, raw_text in zip(keys, raw_texts):
+            if key not in summaries:
+                missing.setdefault(key, raw_text)
+        if missing:
+            texts = list(missing.values())
+            if executor is not None:
+                batch_size = -(-len(texts) // workers)
+                batches = [texts[start:start + batch_size] for start in range(0, len(texts), batch_size)]
+                computed = [text for batch in executor.map(summarise_batch, batches, repeat(limit)) for text in batch]
+            else:
+                computed = summariser.summarise_batch(texts, limit)
+            fresh = dict(zip(missing, computed))
+            cache.set_many(fresh, settings.SUMMARY_CACHE_TIMEOUT)
+            summaries.update(fresh)
+
+        for result, key in zip(results, keys):
+            result[length_choice] = summaries[key]
+    return results
+
+
+def build_snippet_texts(raw_text):
+    """Return {length: text} for every TextSnippet length"""
+    return summarise_texts([raw_text])[0]
+
+
+def write_snippets(locations, texts_by_location, replace=False):
+    """
+    Write snippets for a batch of locations in one transaction.
+
+    texts_by_location maps location id to {length: text}. In the default
+    incremental mode only lengths whose text hash differs from the current
+    snippet get a new row, and the superseded snippet and its audio are flipped
+    to is_current=False rather than deleted. replace=True deletes every snippet
+    for the batch (cascading to audio) and recreates them.
+
+    Returns {location_id: (created, unchanged)} lists of TextSnippets.
+    """
+    location_ids = [location.pk for location in locations]
+    results = {location_id: ([], []) for location_id in location_ids}
+
+    with transaction.atomic():
+        # Serialise concurrent regenerations of the same locations
+        list(Location.objects.select_for_update().filter(pk__in=location_ids).order_by('pk').values_list('pk'))
+        if replace:
+            TextSnippet.objects.filter(location_id__in=location_ids).delete()
+            current = {}
+        else:
+            current = {
+                (snippet.location_id, snippet.length): snippet
+                for snippet in TextSnippet.objects.select_for_update().filter(
+                    location_id__in=location_ids, is_current=True
+                )
+            }
+
+        superseded = []
+        to_create = []
+        for location in locations:
+            for length_choice, text in texts_by_location[location.pk].items():
+                text_hash = snippet_hash(text)
+                existing = current.get((location.pk, length_choice))
+                if existing is not None and existing.hash == text_hash:
+                    results[location.pk][1].append(existing)
+                    continue
+                if existing is not None:
+                    superseded.append(existing.pk)
+                to_create.append(TextSnippet(
+                    location_id=location.pk,
+                    length=length_choice,
+                    text=text,
+                    hash=text_hash,
+                    is_current=True
+                ))
+
+        if superseded:
+            TextSnippet.objects.filter(pk__in=superseded).update(is_current=False)
+            superseded_audio = list(AudioSnippet.objects.filter(
+                text_snippet_id__in=superseded, is_current=True
+            ).values_list('pk', flat=True))
+            AudioSnippet.objects.filter(pk__in=superseded_audio).update(is_current=False)
+            record_changes('audio_snippet', superseded_audio)
+        created = TextSnippet.objects.bulk_create(to_create)
+        for snippet in created:
+            results[snippet.location_id][0].append(snippet)
+        record_changes('text_snippet', superseded + [snippet.pk for snippet in created])
+
+        # Remember which version the current snippets were built from
+        for location in locations:
+            location.snippets_version = location.version
+        Location.objects.bulk_update(locations, ['snippets_version'])
+        response_cache.invalidate_snippets(location_ids)
+        index_locations_on_commit(location_ids)
+
+    return results
+
+
+def sync_location_snippets(location):
+    """Incrementally regenerate one location's snippets; returns (created, unchanged)"""
+    texts = {location.pk: build_snippet_texts(location.raw_text)}
+    return write_snippets([location], texts)[location.pk]
+
+
+def replace_location_snippets(location):
+    """Delete and recreate every snippet for the location; returns the created snippets"""
+    texts = {location.pk: build_snippet_texts(location.raw_text)}
+    return write_snippets([location], texts, replace=True)[location.pk][0]
+
+
+def changed_locations():
+    """Locations whose current snippets were not built from their current version"""
+    return Location.objects.exclude(snippets_version=F('version'))
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def summary_pool(workers):
+    """
+    A process pool for summarising, or None to summarise in-process: for a
+    single worker, or when settings were configured in code and cannot be
+    recreated in a worker.
+    """
+    settings_module = getattr(settings, 'SETTINGS_MODULE', None)
+    if not workers or workers < 2 or not settings_module:
+        return None
+    return ProcessPoolExecutor(max_workers=workers, initializer=init_pool_worker, initargs=(settings_module,))
+
+
+def generate_snippets_bulk(queryset, chunk_size=DEFAULT_CHUNK_SIZE, workers=None, replace=False):
+    """
+    Regenerate snippets for every location in queryset.
+
+    Locations are streamed in chunks, each chunk is summarised as a batch
+    (optionally across a process pool) and written with bulk_create/bulk_update
+    inside its own transaction.
+    """
+    stats = {'locations': 0, 'created': 0, 'unchanged': 0}
+    locations = queryset.only('id', 'raw_text', 'version').order_by('pk').iterator(chunk_size=chunk_size)
+
+    executor = summary_pool(workers)
+    try:
+        for chunk in chunked(locations, chunk_size):
+            texts = summarise_texts([location.raw_text for location in chunk], executor, workers or 1)
+            texts_by_location = {location.pk: location_texts for location, location_texts in zip(chunk, texts)}
+
+            for created, unchanged in write_snippets(chunk, texts_by_location, replace=replace).values():
+                stats['created'] += len(created)
+                stats['unchanged'] += len(unchanged)
+            stats['locations'] += len(chunk)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    return stats
@@ -0,0 +1,219 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import wave
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from core.models import AudioSnippet, Location, StitchCache, Tour
+
+
+class StitchError(Exception):
+    pass
+
+
+class MissingAudioError(StitchError):
+    def __init__(self, location_ids):
+        self.location_ids = location_ids
+        super().__init__(f'No current audio for locations {location_ids}')
+
+
+# cache key -> [lock, threads holding or waiting for it], so concurrent misses in this
+# process wait for a single build; entries are dropped once no thread needs them
+_build_locks = {}
+_build_locks_guard = threading.Lock()
+
+
+@contextmanager
+def _build_lock(key):
+    with _build_locks_guard:
+        entry = _build_locks.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _build_locks_guard:
+            entry[1] -= 1
+            if not entry[1]:
+                del _build_locks[key]
+
+
+def audio_path(audio_url):
+    """Map an audio_url onto its file under AUDIO_ROOT"""
+    root = Path(settings.AUDIO_ROOT).resolve()
+    relative = audio_url
+    if relative.startswith(settings.AUDIO_URL):
+        relative = relative[len(settings.AUDIO_URL):]
+    path = (root / relative.lstrip('/')).resolve()
+    if not path.is_relative_to(root):
+        raise StitchError(f'Audio path escapes AUDIO_ROOT: {audio_url}')
+    return path
+
+
+def audio_url_for(path):
+    return settings.AUDIO_URL + Path(path).resolve().relative_to(Path(settings.AUDIO_ROOT).resolve()).as_posix()
+
+
+def location_versions_hash(location_ids, versions, length, voice_id=None):
+    """
+    Hash of the tour's location order and each location's version (plus
+    whatever else callers fold into versions); changes whenever a location is
+    added, moved or edited.
+    """
+    payload = json.dumps({
+        'locations': [[location_id, versions.get(location_id)] for location_id in location_ids],
+        'length': length,
+        'voice_id': voice_id,
+    })
+    return hashlib.md5(payload.encode()).hexdigest()
+
+
+def concatenate_audio(sources, destination):
+    """
+    Join WAV files into destination, frame by frame under one header. Other
+    formats cannot be joined by appending bytes (headers and metadata would
+    land mid-stream), so they are refused.
+    """
+    formats = sorted({source.suffix.lower() for source in sources})
+    if formats != ['.wav']:
+        raise StitchError(f'Only WAV audio can be stitched, got {", ".join(formats) or "no files"}')
+    with wave.open(str(destination), 'wb') as output:
+        for index, source in enumerate(sources):
+            with wave.open(str(source), 'rb') as part:
+                if index == 0:
+                    output.setparams(part.getparams())
+                elif part.getparams()[:3] != output.getparams()[:3]:
+                    raise StitchError(f'{source.name} has a different sample format')
+                while frames := part.readframes(65536):
+                    output.writeframes(frames)
+
+
+def _unlink(paths):
+    for path in paths:
+        path.unlink(missing_ok=True)
+
+
+def delete_entries(entries):
+    """
+    Delete StitchCache rows in the queryset along with their stitched files.
+    The files go once the transaction commits, so a rollback never leaves
+    rows pointing at deleted files.
+    """
+    paths = []
+    for entry in entries.only('id', 'audio_url'):
+        try:
+            paths.append(audio_path(entry.audio_url))
+        except StitchError:
+            pass
+    deleted = entries.delete()[0]
+    transaction.on_commit(lambda: _unlink(paths))
+    return deleted
+
+
+def evict_expired():
+    """Delete expired cache rows and their stitched files"""
+    return delete_entries(StitchCache.objects.filter(expires_at__lte=timezone.now()))
+
+
+def _current_audio(location_ids, length, voice_id):
+    audio = AudioSnippet.objects.filter(
+        is_current=True,
+        text_snippet__is_current=True,
+        text_snippet__length=length,
+        text_snippet__location_id__in=location_ids,
+    ).select_related('text_snippet').only('audio_url', 'created', 'text_snippet__location_id').order_by('created')
+    if voice_id:
+        audio = audio.filter(voice_id=voice_id)
+    # Newest audio wins when a location has several current rows
+    return {row.text_snippet.location_id: row for row in audio}
+
+
+def _lookup(key, length, versions_hash):
+    return StitchCache.objects.filter(
+        tour_id_or_hash=key,
+        length=length,
+        location_versions_hash=versions_hash,
+        expires_at__gt=timezone.now(),
+    ).order_by('-created').first()
+
+
+def _stitch_key(tour, length, voice_id):
+    """
+    (location ids, current audio by location, cache key, versions hash) of the
+    tour's stitch at this length. The hash covers the audio row picked for
+    each stop, so regenerated snippets or resynthesised audio at the same
+    location version still miss the cache.
+    """
+    location_ids = tour.location_order
+    versions = dict(Location.objects.filter(pk__in=location_ids).values_list('id', 'version'))
+    location_ids = [location_id for location_id in location_ids if location_id in versions]
+    if not location_ids:
+        raise StitchError('Tour has no locations')
+    audio = _current_audio(location_ids, length, voice_id)
+    versions = {
+        location_id: [version, audio[location_id].pk if location_id in audio else None]
+        for location_id, version in versions.items()
+    }
+    return location_ids, audio, str(tour.pk), location_versions_hash(location_ids, versions, length, voice_id)
+
+
+def find_stitch(tour, length, voice_id=None):
+    """The tour's cached stitch at this length, or None when it has to be built"""
+    _, _, key, versions_hash = _stitch_key(tour, length, voice_id)
+    return _lookup(key, length, versions_hash)
+
+
+def get_or_build_stitch(tour, length, voice_id=None):
+    """
+    Return (StitchCache, cached) for the tour's stitched audio at this length.
+
+    A hit is served straight from StitchCache. On a miss the current audio of
+    every location is concatenated, in tour order, into one file. Concurrent
+    misses for the same key are coalesced: threads share a lock and other
+    processes queue on the tour row lock, then re-check the cache.
+    """
+    location_ids, audio, key, versions_hash = _stitch_key(tour, length, voice_id)
+    entry = _lookup(key, length, versions_hash)
+    if entry is not None:
+        return entry, True
+
+    with _build_lock((key, length, versions_hash)), transaction.atomic():
+        Tour.objects.select_for_update().filter(pk=tour.pk).first()
+        entry = _lookup(key, length, versions_hash)
+        if entry is not None:
+            return entry, True
+
+        evict_expired()
+
+        # Built from the audio the hash was taken over, so the entry matches its key
+        missing = [location_id for location_id in location_ids if location_id not in audio]
+        if missing:
+            raise MissingAudioError(missing)
+        sources = [audio_path(audio[location_id].audio_url) for location_id in location_ids]
+
+        destination = Path(settings.AUDIO_ROOT) / 'stitched' / f'{key}-{length}-{versions_hash}.wav'
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        # Build beside the target and rename, so readers never see a partial file
+        fd, partial = tempfile.mkstemp(dir=destination.parent, suffix='.part')
+        os.close(fd)
+        try:
+            concatenate_audio(sources, Path(partial))
+            os.replace(partial, destination)
+        except BaseException:
+            os.unlink(partial)
+            raise
+        entry = StitchCache.objects.create(
+            tour_id_or_hash=key,
+            length=length,
+            location_versions_hash=versions_hash,
+            audio_url=audio_url_for(destination),
+            expires_at=timezone.now() + settings.STITCH_CACHE_TTL,
+        )
+    return entry, False
@@ -0,0 +1,145 @@
+import os
+import re
+from functools import lru_cache
+
+import django
+import numpy as np
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# Sentence ends (., ! or ? then whitespace, but not after an initial or a
+# common abbreviation) and paragraph breaks
+SENTENCE_RE = re.compile(r'(?<=[.!?])(?<!\b[A-Z]\.)(?<!\b(?:St|Mt|Dr|Mr|Ms)\.)\s+|\n\s*\n')
+WORD_RE = re.compile(r"[a-z0-9][a-z0-9']*")
+STOP_WORDS = frozenset("""
+    a about above after again against all also am an and any are as at be because been before being below
+    between both but by can could did do does doing down during each few for from further had has have having
+    he her here hers him his how i if in into is it its itself just me more most my no nor not now of off on
+    once only or other our ours out over own same she should so some such than that the their theirs them
+    then there these they this those through to too under until up very was we were what when where which
+    while who whom why will with would you your yours
+""".split())
+
+
+class Summariser:
+    """
+    Turns a location's raw text into snippet text of at most `limit` characters.
+
+    Backends implement summarise_batch so that ones with a per-call cost (a
+    model load, a remote API) can handle many locations at once.
+    """
+    name = None
+
+    def summarise_batch(self, texts, limit):
+        """Return one summary per text, in order"""
+        raise NotImplementedError
+
+    def summarise(self, text, limit):
+        return self.summarise_batch([text], limit)[0]
+
+
+def truncate(text, limit):
+    """Cut text at the last word boundary within limit characters and mark the cut"""
+    if len(text) <= limit:
+        return text
+    cut = text[:limit].rsplit(None, 1)[0] if ' ' in text[:limit] else text[:limit]
+    return cut.rstrip(' ,;:') + '...'
+
+
+class TruncateSummariser(Summariser):
+    """The first `limit` characters, as snippets were originally built"""
+    name = 'truncate'
+
+    def summarise_batch(self, texts, limit):
+        return [text if len(text) <= limit else text[:limit] + '...' for text in texts]
+
+
+class TextRankSummariser(Summariser):
+    """
+    Extractive summary: sentences are ranked with TextRank over TF-IDF cosine
+    similarity and the best ones that fit the budget are kept in document order.
+    """
+    name = 'textrank'
+    damping = 0.85
+    max_iterations = 100
+    tolerance = 1e-6
+
+    def summarise_batch(self, texts, limit):
+        return [self.summarise_text(text, limit) for text in texts]
+
+    def summarise_text(self, text, limit):
+        text = text.strip()
+        if len(text) <= limit:
+            return text
+        sentences = [sentence.strip() for sentence in SENTENCE_RE.split(text) if sentence.strip()]
+        if len(sentences) < 2:
+            return truncate(text, limit)
+
+        scores = self.rank(sentences)
+        chosen = []
+        used = 0
+        for index in np.argsort(-scores, kind='stable'):
+            size = len(sentences[index]) + (1 if chosen else 0)
+            if used + size <= limit:
+                chosen.append(index)
+                used += size
+        if not chosen:
+            # Even the best sentence is over budget
+            return truncate(sentences[int(np.argmax(scores))], limit)
+        return ' '.join(sentences[index] for index in sorted(chosen))
+
+    def rank(self, sentences):
+        """TextRank score of each sentence"""
+        tokens = [[word for word in WORD_RE.findall(sentence.lower()) if word not in STOP_WORDS]
+                  for sentence in sentences]
+        vocabulary = {word: column for column, word in enumerate(sorted({word for words in tokens for word in words}))}
+        count = len(sentences)
+        if not vocabulary:
+            return np.zeros(count)
+
+        # TF-IDF rows, L2-normalised so the dot product is cosine similarity
+        counts = np.zeros((count, len(vocabulary)))
+        for row, words in enumerate(tokens):
+            for word in words:
+                counts[row, vocabulary[word]] += 1
+        document_frequency = np.count_nonzero(counts, axis=0)
+        idf = np.log((1 + count) / (1 + document_frequency)) + 1
+        weights = counts * idf
+        norms = np.linalg.norm(weights, axis=1, keepdims=True)
+        weights = np.divide(weights, norms, out=np.zeros_like(weights), where=norms > 0)
+
+        similarity = weights @ weights.T
+        np.fill_diagonal(similarity, 0)
+        row_sums = similarity.sum(axis=1, keepdims=True)
+        # Sentences sharing no words with any other link to every sentence equally
+        transition = np.divide(similarity, row_sums, out=np.full_like(similarity, 1 / count), where=row_sums > 0)
+
+        scores = np.full(count, 1 / count)
+        for _ in range(self.max_iterations):
+            updated = (1 - self.damping) / count + self.damping * (transition.T @ scores)
+            if np.abs(updated - scores).sum() < self.tolerance:
+                return updated
+            scores = updated
+        return scores
+
+
+@lru_cache(maxsize=None)
+def get_summariser():
+    """The backend named by settings.SNIPPET_SUMMARISER"""
+    return import_string(settings.SNIPPET_SUMMARISER)()
+
+
+def summarise_batch(texts, limit):
+    """Module-level entry point so process pool workers can run the configured backend"""
+    return get_summariser().summarise_batch(texts, limit)
+
+
+def init_pool_worker(settings_module):
+    """
+    Process pool initializer. Under the spawn and forkserver start methods
+    workers begin in a fresh interpreter, so Django is set up before any
+    backend reads settings or imports models. Lives here rather than next to
+    the pool because unpickling it must not import models.
+    """
+    os.environ['DJANGO_SETTINGS_MODULE'] = settings_module
+    django.setup()
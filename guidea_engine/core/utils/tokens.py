@@ -0,0 +1,89 @@
+import logging
+import time
+
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PRUNE_CHUNK_SIZE = 5000
+
+
+def prune_expired_tokens(chunk_size=DEFAULT_PRUNE_CHUNK_SIZE, pause=0.0, now=None):
+    """
+    Delete outstanding refresh tokens that have expired, with their blacklist
+    entries. An expired token fails its exp check before the blacklist is
+    consulted, so neither row is needed any more.
+
+    Rows go in chunks of chunk_size, oldest first, one short transaction per
+    chunk, so pruning a large backlog never holds long locks. pause sleeps
+    between chunks to leave room for refresh traffic.
+    """
+    now = now or timezone.now()
+    stats = {'outstanding': 0, 'blacklisted': 0, 'chunks': 0}
+    expired = OutstandingToken.objects.filter(expires_at__lte=now).order_by('expires_at', 'pk')
+    while True:
+        with transaction.atomic():
+            ids = list(expired.values_list('pk', flat=True)[:chunk_size])
+            if not ids:
+                break
+            # Loads only the ids; blacklist rows go in one DELETE ... WHERE token_id IN
+            _, deleted = OutstandingToken.objects.filter(pk__in=ids).only('pk').delete()
+        stats['outstanding'] += deleted.get(OutstandingToken._meta.label, 0)
+        stats['blacklisted'] += deleted.get(BlacklistedToken._meta.label, 0)
+        stats['chunks'] += 1
+        if len(ids) < chunk_size:
+            break
+        if pause:
+            time.sleep(pause)
+    logger.info('Pruned %(outstanding)s expired refresh tokens (%(blacklisted)s blacklisted) '
+                'in %(chunks)s chunks', stats)
+    return stats
+
+
+def _table_size(model):
+    """(rows, bytes) for model's table; estimates from the planner statistics on Postgres"""
+    table = model._meta.db_table
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint, pg_total_relation_size(oid) FROM pg_class WHERE oid = %s::regclass',
+                [table],
+            )
+            rows, size = cursor.fetchone()
+        # reltuples is -1 until the table is first analysed
+        if rows >= 0:
+            return rows, size
+        return model.objects.count(), size
+    return model.objects.count(), None
+
+
+def token_table_stats(now=None):
+    """Size of the refresh-token tables and how many outstanding rows are prunable"""
+    now = now or timezone.now()
+    outstanding_rows, outstanding_bytes = _table_size(OutstandingToken)
+    blacklisted_rows, blacklisted_bytes = _table_size(BlacklistedToken)
+    return {
+        'outstanding_rows': outstanding_rows,
+        'outstanding_bytes': outstanding_bytes,
+        'blacklisted_rows': blacklisted_rows,
+        'blacklisted_bytes': blacklisted_bytes,
+        # Index range count on expires_at
+        'expired_rows': OutstandingToken.objects.filter(expires_at__lte=now).count(),
+    }
+
+
+def token_table_gauges(now=None):
+    """token_table_stats as (name, help text, value) gauges for /metrics; sizes are left out where unknown"""
+    stats = token_table_stats(now)
+    gauges = [
+        ('guidea_outstanding_tokens', 'Rows in the outstanding refresh-token table.', stats['outstanding_rows']),
+        ('guidea_blacklisted_tokens', 'Rows in the token blacklist table.', stats['blacklisted_rows']),
+        ('guidea_expired_tokens', 'Outstanding tokens past expiry, removable by prune_tokens.', stats['expired_rows']),
+    ]
+    for table in ('outstanding', 'blacklisted'):
+        if stats[f'{table}_bytes'] is not None:
+            gauges.append((f'guidea_{table}_tokens_bytes', f'On-disk size of the {table} token table.',
+                           stats[f'{table}_bytes']))
+    return gauges
@@ -0,0 +1,152 @@
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from core.models import Location, StitchCache, Tour, TourStop
+from core.utils import response_cache
+from core.utils.changes import record_changes
+from core.utils.stitching import delete_entries
+
+# Gap left between consecutive stop positions so inserts rarely need a renumber
+STOP_SPACING = 1024
+
+
+class TourOrderError(Exception):
+    pass
+
+
+def touch_tour(tour):
+    """Mark the tour modified after its stops changed; keeps ETags and cached detail honest"""
+    tour.updated = timezone.now()
+    Tour.objects.filter(pk=tour.pk).update(updated=tour.updated)
+    # Stops prefetched before the change are stale now
+    getattr(tour, '_prefetched_objects_cache', {}).pop('stops', None)
+    response_cache.invalidate_tour(tour.pk)
+    record_changes('tour', [tour.pk])
+    # Stitches of the old stop list can no longer be hit; free their files
+    transaction.on_commit(lambda: delete_entries(StitchCache.objects.filter(tour_id_or_hash=str(tour.pk))))
+
+
+def _renumber(tour_id):
+    """Respace every stop of the tour STOP_SPACING apart, keeping their order"""
+    stops = list(TourStop.objects.filter(tour_id=tour_id).order_by('position').only('id', 'position'))
+    # Flip to negatives first so no intermediate row collides on (tour, position)
+    for stop in stops:
+        stop.position = -stop.position
+    TourStop.objects.bulk_update(stops, ['position'])
+    for index, stop in enumerate(reversed(stops)):
+        stop.position = (len(stops) - index) * STOP_SPACING
+    TourStop.objects.bulk_update(stops, ['position'])
+
+
+def _free_position(tour_id, location_id, after=None, before=None):
+    """
+    Position for location_id directly after/before another stop (by location
+    id), or at the end. Uses at most two indexed lookups; returns None when
+    the neighbours leave no gap.
+    """
+    others = TourStop.objects.filter(tour_id=tour_id).exclude(location_id=location_id)
+    if after is not None or before is not None:
+        anchor_id = after if after is not None else before
+        anchor = others.filter(location_id=anchor_id).values_list('position', flat=True).first()
+        if anchor is None:
+            raise TourOrderError(f'Location {anchor_id} is not in this tour')
+        if after is not None:
+            low = anchor
+            high = others.filter(position__gt=anchor).order_by('position').values_list('position', flat=True).first()
+        else:
+            high = anchor
+            low = others.filter(position__lt=anchor).order_by('-position').values_list('position', flat=True).first() or 0
+    else:
+        low = others.aggregate(last=Max('position'))['last'] or 0
+        high = None
+
+    if high is None:
+        return low + STOP_SPACING
+    if high - low < 2:
+        return None
+    return (low + high) // 2
+
+
+def _place(tour_id, location_id, after, before):
+    position = _free_position(tour_id, location_id, after, before)
+    if position is None:
+        _renumber(tour_id)
+        position = _free_position(tour_id, location_id, after, before)
+    return position
+
+
+def add_stop(tour, location_id, after=None, before=None):
+    """
+    Add a location to the tour, at the end or next to another stop.
+    Returns (stop, created); a location already on the tour is left where it is.
+    """
+    with transaction.atomic():
+        Tour.objects.select_for_update().filter(pk=tour.pk).first()
+        stop = TourStop.objects.filter(tour_id=tour.pk, location_id=location_id).first()
+        if stop is not None:
+            return stop, False
+        stop = TourStop.objects.create(
+            tour_id=tour.pk, location_id=location_id, position=_place(tour.pk, location_id, after, before)
+        )
+        touch_tour(tour)
+    return stop, True
+
+
+def move_stop(tour, location_id, after=None, before=None):
+    """Move a location already on the tour next to another stop, or to the end"""
+    if location_id in (after, before):
+        raise TourOrderError('A stop cannot be moved next to itself')
+    with transaction.atomic():
+        Tour.objects.select_for_update().filter(pk=tour.pk).first()
+        stop = TourStop.objects.filter(tour_id=tour.pk, location_id=location_id).first()
+        if stop is None:
+            raise TourOrderError(f'Location {location_id} is not in this tour')
+        stop.position = _place(tour.pk, location_id, after, before)
+        stop.save(update_fields=['position'])
+        touch_tour(tour)
+    return stop
+
+
+def remove_stop(tour, location_id):
+    with transaction.atomic():
+        Tour.objects.select_for_update().filter(pk=tour.pk).first()
+        deleted, _ = TourStop.objects.filter(tour_id=tour.pk, location_id=location_id).delete()
+        if not deleted:
+            raise TourOrderError(f'Location {location_id} is not in this tour')
+        touch_tour(tour)
+
+
+def set_location_order(tour, location_ids):
+    """Replace the tour's stops with location_ids, in that order"""
+    with transaction.atomic():
+        Tour.objects.select_for_update().filter(pk=tour.pk).first()
+        TourStop.objects.filter(tour_id=tour.pk).delete()
+        TourStop.objects.bulk_create([
+            TourStop(tour_id=tour.pk, location_id=location_id, position=(index + 1) * STOP_SPACING)
+            for index, location_id in enumerate(location_ids)
+        ])
+        touch_tour(tour)
+
+
+def validate_location_order(location_ids):
+    """Reject duplicate or unknown location ids"""
+    if len(set(location_ids)) != len(location_ids):
+        raise TourOrderError('A location can only appear once in a tour')
+    missing = set(location_ids) - set(Location.objects.filter(pk__in=location_ids).values_list('pk', flat=True))
+    if missing:
+        raise TourOrderError(f'Unknown location ids: {sorted(missing)}')
+
+
+def tours_containing(location_ids):
+    """Ids of tours that stop at any of the locations (served by the TourStop.location index)"""
+    return set(TourStop.objects.filter(location_id__in=location_ids).values_list('tour_id', flat=True))
+
+
+def invalidate_stitches_for_locations(location_ids):
+    """Drop stitched audio of every tour that visits one of these locations"""
+    def evict():
+        tour_ids = tours_containing(location_ids)
+        if tour_ids:
+            delete_entries(StitchCache.objects.filter(tour_id_or_hash__in=[str(tour_id) for tour_id in tour_ids]))
+    transaction.on_commit(evict)
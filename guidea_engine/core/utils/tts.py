@@ -0,0 +1,142 @@
+import hashlib
+import io
+import os
+import tempfile
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils.module_loading import import_string
+
+from core.models import AudioSnippet, TextSnippet
+from core.utils.changes import record_changes
+from core.utils.snippets import DEFAULT_CHUNK_SIZE, chunked
+from core.utils.stitching import audio_url_for
+
+
+class TTSBackend:
+    """
+    Turns snippet text into audio bytes for a voice. Output must depend only on
+    (text, voice_id) so files can be shared by every snippet with that text.
+    """
+    name = None
+    extension = 'wav'
+
+    def synthesise(self, text, voice_id):
+        raise NotImplementedError
+
+
+class ToneTTSBackend(TTSBackend):
+    """Deterministic local stand-in: a short tone per word, pitched by the word and voice"""
+    name = 'tone'
+    sample_rate = 16000
+    word_seconds = 0.12
+    gap_seconds = 0.03
+
+    def synthesise(self, text, voice_id):
+        times = np.arange(int(self.sample_rate * self.word_seconds)) / self.sample_rate
+        gap = np.zeros(int(self.sample_rate * self.gap_seconds))
+        parts = []
+        for word in text.split():
+            digest = hashlib.md5(f'{voice_id}:{word}'.encode()).digest()
+            frequency = 220 + int.from_bytes(digest[:2], 'big') % 660
+            parts += [0.3 * np.sin(2 * np.pi * frequency * times), gap]
+        samples = (np.concatenate(parts) if parts else gap) * 32767
+
+        buffer = io.BytesIO()
+        with wave.open(buffer, 'wb') as output:
+            output.setnchannels(1)
+            output.setsampwidth(2)
+            output.setframerate(self.sample_rate)
+            output.writeframes(samples.astype('<i2').tobytes())
+        return buffer.getvalue()
+
+
+@lru_cache(maxsize=None)
+def get_backend():
+    """The backend named by settings.TTS_BACKEND"""
+    return import_string(settings.TTS_BACKEND)()
+
+
+def audio_key(backend, text_hash, voice_id):
+    """Content address of the audio for a snippet text hash spoken by voice_id"""
+    return hashlib.sha256(f'{backend.name}:{voice_id}:{text_hash}'.encode()).hexdigest()
+
+
+def storage_path(backend, text_hash, voice_id):
+    key = audio_key(backend, text_hash, voice_id)
+    return Path(settings.AUDIO_ROOT) / 'tts' / key[:2] / f'{key}.{backend.extension}'
+
+
+def _synthesise_to(backend, text, voice_id, path):
+    """Synthesise into path unless another run already stored it"""
+    if path.exists():
+        return False
+    data = backend.synthesise(text, voice_id)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Write beside the target and rename, so readers never see a partial file
+    fd, partial = tempfile.mkstemp(dir=path.parent, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as output:
+            output.write(data)
+        os.replace(partial, path)
+    except BaseException:
+        os.unlink(partial)
+        raise
+    return True
+
+
+def missing_audio(voice_id):
+    """Current text snippets without current audio for voice_id"""
+    has_audio = AudioSnippet.objects.filter(text_snippet=OuterRef('pk'), voice_id=voice_id, is_current=True)
+    return TextSnippet.objects.filter(is_current=True).exclude(Exists(has_audio))
+
+
+def synthesise_snippets(snippets, voice_id=None, workers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Create current AudioSnippets for the text snippets in the queryset that lack one for voice_id.
+
+    Snippets are grouped by text hash, so each distinct text is synthesised
+    once per voice however many locations share it, and only when its
+    content-addressed file is not already on disk. Synthesis runs on a thread
+    pool of `workers`; rows are written one chunk per transaction.
+    """
+    backend = get_backend()
+    voice_id = voice_id or settings.TTS_DEFAULT_VOICE
+    workers = workers or settings.TTS_WORKERS
+    stats = {'snippets': 0, 'synthesised': 0, 'reused': 0}
+
+    snippets = snippets.filter(pk__in=missing_audio(voice_id).values('pk')).only('id', 'text', 'hash')
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for chunk in chunked(snippets.order_by('pk').iterator(chunk_size=chunk_size), chunk_size):
+            texts = {snippet.hash: snippet.text for snippet in chunk}
+            paths = {text_hash: storage_path(backend, text_hash, voice_id) for text_hash in texts}
+            created = executor.map(
+                lambda text_hash: _synthesise_to(backend, texts[text_hash], voice_id, paths[text_hash]), texts
+            )
+            for text_hash, synthesised in zip(texts, created):
+                stats['synthesised' if synthesised else 'reused'] += 1
+
+            with transaction.atomic():
+                # Re-check under lock so concurrent runs do not both add audio
+                ids = list(TextSnippet.objects.select_for_update().filter(
+                    pk__in=[snippet.pk for snippet in chunk]
+                ).order_by('pk').values_list('pk', flat=True))
+                pending = set(missing_audio(voice_id).filter(pk__in=ids).values_list('pk', flat=True))
+                created = AudioSnippet.objects.bulk_create([
+                    AudioSnippet(
+                        text_snippet_id=snippet.pk,
+                        voice_id=voice_id,
+                        audio_url=audio_url_for(paths[snippet.hash]),
+                        is_current=True,
+                    )
+                    for snippet in chunk if snippet.pk in pending
+                ])
+                record_changes('audio_snippet', [audio.pk for audio in created])
+            stats['snippets'] += len(pending)
+    return stats
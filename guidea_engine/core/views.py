@@ -1,159 +1,858 @@
+from pathlib import Path
+from urllib.parse import quote
+
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import APIException, ValidationError
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
 from rest_framework.views import APIView
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import SAFE_METHODS, AllowAny, IsAuthenticated
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 from rest_framework_simplejwt.tokens import RefreshToken
-from django.contrib.auth.models import User
-import hashlib
-
-from .models import Location, TextSnippet, AudioSnippet, Tour
+from django.conf import settings
+from django.db import transaction
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.crypto import constant_time_compare
+from django.utils.http import http_date
+from django.db.models import Prefetch
+
+from .authentication import StatelessJWTAuthentication, revoke_access_token
+from .models import Location, TextSnippet, AudioSnippet, Tour, TourStop, Job
 from .serializers import (
     LocationSerializer, TextSnippetSerializer, AudioSnippetSerializer, 
-    TourSerializer, UserRegistrationSerializer, UserSerializer
+    TourSerializer, JobSerializer, UserRegistrationSerializer, UserSerializer,
+    LocationValuesSerializer, TextSnippetValuesSerializer, TourValuesSerializer
 )
+from .utils import response_cache
+from .utils.metrics import render_prometheus
+from .utils.changes import CursorExpired, changes_since
+from .utils.geo import find_nearby
+from .utils.packages import package_hash, package_path, write_package
+from .utils.search import search_locations
+from .utils.jobs import enqueue
+from .utils.snippets import (
+    changed_locations, generate_snippets_bulk, replace_location_snippets, sync_location_snippets
+)
+from .utils.audio_files import RangeNotSatisfiable, content_type, file_etag, iter_range, parse_range
+from .utils.stitching import MissingAudioError, StitchError, audio_path, find_stitch, get_or_build_stitch
+from .utils.tokens import token_table_gauges
+from .utils.tours import TourOrderError, add_stop, move_stop, remove_stop
+from .utils.tts import synthesise_snippets
+
+NEARBY_MAX_LIMIT = 100
+SEARCH_MAX_LIMIT = 100
+
+# Fields of each object embedded in a tour bundle
+BUNDLE_LOCATION_FIELDS = ['id', 'name', 'slug', 'version', 'latlon_json']
+BUNDLE_SNIPPET_FIELDS = ['id', 'length', 'text', 'hash']
+BUNDLE_AUDIO_FIELDS = ['id', 'voice_id', 'audio_url']
+
+
+def cache_id(pk):
+    """Canonical integer id for cache keys, or None if the lookup value is not one"""
+    try:
+        return int(pk)
+    except (TypeError, ValueError):
+        return None
+
+
+def optional_id(data, name):
+    """Integer id from request data, None when absent; raises ValidationError otherwise"""
+    value = data.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValidationError({name: 'must be an integer id'})
+
+
+def wants_async(request):
+    """
+    Slow work is queued and answered with 202 unless the client asks for it
+    inline with ?sync=true (or ?async=false)
+    """
+    if request.query_params.get('sync', '').lower() in ('1', 'true', 'yes'):
+        return False
+    return request.query_params.get('async', '').lower() not in ('0', 'false', 'no')
+
+
+def job_accepted(request, job):
+    """202 response pointing the client at the job's status endpoint"""
+    return Response({
+        'job_id': job.id,
+        'status': job.status,
+        'status_url': request.build_absolute_uri(reverse('job-detail', args=[job.id]))
+    }, status=status.HTTP_202_ACCEPTED)
+
+
+def nearby_params(query_params):
+    """Validated ({lat, lon, radius, limit, offset}, None) for a nearby query, or (None, error message)"""
+    lat = query_params.get('lat')
+    lon = query_params.get('lon')
+
+    if not lat or not lon:
+        return None, 'lat and lon parameters required'
+
+    try:
+        lat = float(lat)
+        lon = float(lon)
+        radius = float(query_params.get('radius', 10))  # km
+        limit = int(query_params.get('limit', 10))
+        offset = int(query_params.get('offset', 0))
+    except ValueError:
+        return None, 'lat, lon, radius, limit and offset must be numeric'
+
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None, 'lat/lon out of range'
+    if radius <= 0 or limit < 1 or offset < 0:
+        return None, 'radius and limit must be positive, offset non-negative'
+    return {'lat': lat, 'lon': lon, 'radius': radius, 'limit': min(limit, NEARBY_MAX_LIMIT), 'offset': offset}, None
+
+
+def nearby_payload(params, matches, page, locations_by_id):
+    results = []
+    for location_id, distance in page:
+        data = LocationSerializer(locations_by_id[location_id]).data
+        data['distance_km'] = round(distance, 3)
+        results.append(data)
+
+    return {
+        'message': f'Locations within {params["radius"]:g}km of ({params["lat"]}, {params["lon"]})',
+        'count': len(matches),
+        'limit': params['limit'],
+        'offset': params['offset'],
+        'locations': results
+    }
+
+
+def stops_prefetch():
+    """Prefetch of a tour's stops carrying just what location_order needs"""
+    return Prefetch('stops', queryset=TourStop.objects.only('id', 'tour_id', 'location_id', 'position'))
+
+
+def bundle_locations(length, voice_id=None):
+    """
+    Locations queryset for a tour bundle: each location gets current_snippets
+    (its current snippet at length) carrying current_audio.
+    """
+    audio = AudioSnippet.objects.filter(is_current=True).order_by('-created')
+    if voice_id:
+        audio = audio.filter(voice_id=voice_id)
+    snippets = TextSnippet.objects.filter(is_current=True, length=length).prefetch_related(
+        Prefetch('audio_snippets', queryset=audio, to_attr='current_audio')
+    )
+    return Location.objects.defer('raw_text').prefetch_related(
+        Prefetch('text_snippets', queryset=snippets, to_attr='current_snippets')
+    )
+
+
+def bundle_payload(tour_data, location_order, locations, length, voice_id):
+    """Bundle response body from bundle_locations() rows keyed by id, in tour order"""
+    # Serialize each kind of object in one pass; per-object serializers are costly
+    ordered = [locations[location_id] for location_id in location_order if location_id in locations]
+    current = [location.current_snippets[0] if location.current_snippets else None for location in ordered]
+    present = [snippet for snippet in current if snippet is not None]
+    audio_rows = [audio for snippet in present for audio in snippet.current_audio]
+
+    snippet_data = iter(TextSnippetSerializer(present, many=True, fields=BUNDLE_SNIPPET_FIELDS).data)
+    audio_by_snippet = {snippet.pk: [] for snippet in present}
+    audio_data = AudioSnippetSerializer(audio_rows, many=True, fields=BUNDLE_AUDIO_FIELDS).data
+    for audio, data in zip(audio_rows, audio_data):
+        audio_by_snippet[audio.text_snippet_id].append(data)
+
+    stops = []
+    location_data = LocationSerializer(ordered, many=True, fields=BUNDLE_LOCATION_FIELDS).data
+    for data, snippet in zip(location_data, current):
+        stops.append({
+            **data,
+            'snippet': next(snippet_data) if snippet is not None else None,
+            'audio': audio_by_snippet[snippet.pk] if snippet is not None else [],
+        })
+
+    return {
+        'tour': tour_data,
+        'length': length,
+        'voice': voice_id,
+        'locations': stops
+    }
+
+
+class StatelessReadMixin:
+    """
+    Authenticate GET/HEAD/OPTIONS from the JWT claims alone, skipping the
+    per-request User query; writes keep the default authentication.
+    """
+
+    def get_authenticators(self):
+        if self.request.method in SAFE_METHODS:
+            return [StatelessJWTAuthentication()]
+        return super().get_authenticators()
+
+
+class PreconditionFailed(APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = 'If-Match does not match the current ETag; fetch the object again and retry.'
+    default_code = 'precondition_failed'
+
+
+class ConditionalWriteMixin:
+    """
+    Writes in locking_actions run in a transaction with the object's row
+    locked (SELECT ... FOR UPDATE), so concurrent writers queue instead of
+    losing each other's changes. An If-Match header is checked against the
+    locked row's ETag and a stale one is refused with 412. Responses carry the
+    new ETag for the client's next conditional write.
+
+    Custom actions listed in locking_actions must run inside transaction.atomic.
+    """
+    locking_actions = ('update', 'partial_update')
+
+    def get_etag(self, obj):
+        raise NotImplementedError
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in self.locking_actions:
+            queryset = queryset.select_for_update()
+        return queryset
+
+    def get_object(self):
+        obj = super().get_object()
+        if self.action in self.locking_actions and response_cache.if_match_failed(self.request, self.get_etag(obj)):
+            raise PreconditionFailed()
+        return obj
+
+    def update(self, request, *args, **kwargs):
+        with transaction.atomic():
+            response = super().update(request, *args, **kwargs)
+        response['ETag'] = self.written_etag
+        return response
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        self.written_etag = self.get_etag(serializer.instance)
+
 
+class FieldProjectionMixin:
+    """
+    Field projection for list and retrieve.
+
+    ?fields=id,name serializes only the named fields and ?lite=true drops the
+    large text fields in lite_exclude. Columns in deferrable_fields that the
+    response will not use are deferred so they never leave the database.
+    """
+    # serializer field -> model column only worth loading when that field is serialized
+    deferrable_fields = {}
+    lite_exclude = ()
+
+    def get_projected_fields(self):
+        """Serializer field names for this request, or None for the full representation"""
+        if self.action not in ('list', 'retrieve'):
+            return None
+
+        available = list(self.get_serializer_class().Meta.fields)
+        fields = available
+        requested = self.request.query_params.get('fields')
+        if requested:
+            wanted = {name.strip() for name in requested.split(',')}
+            fields = [name for name in available if name in wanted]
+            if not fields:
+                raise ValidationError({'fields': f'Choose from: {", ".join(available)}'})
+        if self.request.query_params.get('lite', '').lower() in ('1', 'true', 'yes'):
+            fields = [name for name in fields if name not in self.lite_exclude]
+
+        return None if fields == available else fields
 
-class LocationViewSet(viewsets.ModelViewSet):
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        fields = self.get_projected_fields()
+        if fields is not None:
+            deferred = [column for name, column in self.deferrable_fields.items() if name not in fields]
+            if deferred:
+                queryset = queryset.defer(*deferred)
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        fields = self.get_projected_fields()
+        if fields is not None:
+            kwargs.setdefault('fields', fields)
+        return super().get_serializer(*args, **kwargs)
+
+
+class ValuesListMixin:
+    """
+    list() through values_serializer_class: the page is read with .values()
+    and converted in one pass rather than through model instances and the
+    ModelSerializer. Field projection applies as usual.
+    """
+    values_serializer_class = None
+
+    def list(self, request, *args, **kwargs):
+        serializer = self.values_serializer_class(fields=self.get_projected_fields())
+        # The cursor paginator reads its position from the rows
+        ordering = getattr(self.paginator, 'ordering', None) or ()
+        if isinstance(ordering, str):
+            ordering = (ordering,)
+        queryset = serializer.select(
+            self.filter_queryset(self.get_queryset()), extra=[name.lstrip('-') for name in ordering]
+        )
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(serializer.to_representation(page))
+        return Response(serializer.to_representation(queryset))
+
+
+class LocationViewSet(StatelessReadMixin, ConditionalWriteMixin, FieldProjectionMixin, ValuesListMixin,
+                      viewsets.ModelViewSet):
     queryset = Location.objects.all()
     serializer_class = LocationSerializer
+    values_serializer_class = LocationValuesSerializer
     permission_classes = [IsAuthenticated]
+    deferrable_fields = {'raw_text': 'raw_text', 'latlon_json': 'latlon_json'}
+    lite_exclude = ('raw_text',)
+
+    def get_etag(self, obj):
+        return response_cache.location_etag(obj)
 
     @action(detail=True, methods=['post'], url_path='generate-snippets')
     def generate_snippets(self, request, pk=None):
-        """Generate text snippets of different lengths from the location's raw_text"""
+        """
+        Generate text snippets of different lengths from the location's raw_text.
+
+        By default only lengths whose text changed get a new snippet; pass
+        ?mode=replace to delete and recreate every snippet. The work is queued
+        and a job id returned straight away; ?sync=true runs it in the request.
+        """
         try:
             location = self.get_object()
         except Location.DoesNotExist:
             return Response({'error': 'Location not found'}, status=status.HTTP_404_NOT_FOUND)
 
-        # Clear existing snippets for this location
-        TextSnippet.objects.filter(location=location).delete()
-
-        # Generate snippets (this is a placeholder - you'd implement actual text processing)
-        snippets_created = []
-        raw_text = location.raw_text
-
-        for length_choice, length_display in TextSnippet.LENGTH_CHOICES:
-            # Simple text truncation logic (you'd want more sophisticated processing)
-            if length_choice == 'short':
-                text = raw_text[:200] + '...' if len(raw_text) > 200 else raw_text
-            elif length_choice == 'medium':
-                text = raw_text[:500] + '...' if len(raw_text) > 500 else raw_text
-            else:  # long
-                text = raw_text
-
-            # Create hash for change detection
-            text_hash = hashlib.md5(text.encode()).hexdigest()
-
-            snippet = TextSnippet.objects.create(
-                location=location,
-                length=length_choice,
-                text=text,
-                hash=text_hash,
-                is_current=True
-            )
-            snippets_created.append({
+        mode = request.query_params.get('mode', 'incremental')
+        if mode not in ('incremental', 'replace'):
+            return Response({'error': 'mode must be "incremental" or "replace"'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        if wants_async(request):
+            job = enqueue('generate_snippets', {'location_ids': [location.id], 'replace': mode == 'replace'})
+            return job_accepted(request, job)
+
+        if mode == 'replace':
+            created, unchanged = replace_location_snippets(location), []
+        else:
+            created, unchanged = sync_location_snippets(location)
+
+        snippets = [(snippet, 'created') for snippet in created] + [(snippet, 'unchanged') for snippet in unchanged]
+        return Response({
+            'message': f'Generated {len(created)} text snippets, {len(unchanged)} unchanged',
+            'snippets': [{
                 'id': snippet.id,
-                'length': length_choice,
-                'text_preview': text[:100] + '...' if len(text) > 100 else text
-            })
+                'length': snippet.length,
+                'status': snippet_status,
+                'text_preview': snippet.text[:100] + '...' if len(snippet.text) > 100 else snippet.text
+            } for snippet, snippet_status in snippets]
+        }, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+    @action(detail=False, methods=['post'], url_path='generate-snippets')
+    def generate_snippets_bulk(self, request):
+        """
+        Generate snippets for many locations at once.
+
+        Body takes either "ids" (list of location ids), "changed": true for
+        locations edited since their snippets were built, or "all": true.
+        The work is queued as a background job; ?sync=true runs it in the request.
+        """
+        mode = request.query_params.get('mode', 'incremental')
+        if mode not in ('incremental', 'replace'):
+            return Response({'error': 'mode must be "incremental" or "replace"'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        ids = request.data.get('ids')
+        changed = bool(request.data.get('changed'))
+        if ids is not None:
+            if not isinstance(ids, list) or not all(type(pk) is int for pk in ids):
+                return Response({'error': 'ids must be a list of integer location ids'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            locations = Location.objects.filter(pk__in=ids)
+        elif changed:
+            locations = changed_locations()
+        elif request.data.get('all'):
+            locations = Location.objects.all()
+        else:
+            return Response({'error': 'ids, changed or all required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if wants_async(request):
+            job = enqueue('generate_snippets', {'location_ids': ids, 'changed': changed, 'replace': mode == 'replace'})
+            return job_accepted(request, job)
+
+        stats = generate_snippets_bulk(locations, replace=mode == 'replace')
+        return Response({
+            'message': f'Generated snippets for {stats["locations"]} locations',
+            **stats
+        })
 
+    @action(detail=True, methods=['post'], url_path='synthesise-audio')
+    def synthesise_audio(self, request, pk=None):
+        """
+        Synthesise audio for the location's current snippets that have none for
+        ?voice= (default voice otherwise). The work is queued; ?sync=true runs
+        it in the request.
+        """
+        location = self.get_object()
+        voice_id = request.query_params.get('voice')
+
+        if wants_async(request):
+            job = enqueue('synthesise_audio', {'location_ids': [location.id], 'voice_id': voice_id})
+            return job_accepted(request, job)
+
+        stats = synthesise_snippets(TextSnippet.objects.filter(location=location), voice_id=voice_id)
         return Response({
-            'message': f'Generated {len(snippets_created)} text snippets',
-            'snippets': snippets_created
-        }, status=status.HTTP_201_CREATED)
+            'message': f'Created audio for {stats["snippets"]} snippets',
+            **stats
+        }, status=status.HTTP_201_CREATED if stats['snippets'] else status.HTTP_200_OK)
+
+    def retrieve(self, request, *args, **kwargs):
+        """Location detail, served from the response cache with ETag/Last-Modified validators"""
+        location_id = cache_id(kwargs[self.lookup_field])
+        if location_id is None or self.get_projected_fields() is not None:
+            return super().retrieve(request, *args, **kwargs)
+
+        key = response_cache.location_key(location_id)
+        entry = response_cache.get(key)
+        if entry is None:
+            location = self.get_object()
+            entry = response_cache.store(
+                key, response_cache.location_etag(location), location.updated, self.get_serializer(location).data
+            )
+        return response_cache.respond(request, entry)
 
     @action(detail=True, methods=['get'], url_path='snippets')
     def get_snippets(self, request, pk=None):
         """Get all text snippets for this location"""
-        try:
-            location = self.get_object()
-        except Location.DoesNotExist:
-            return Response({'error': 'Location not found'}, status=status.HTTP_404_NOT_FOUND)
-
-        snippets = TextSnippet.objects.filter(location=location).order_by('length')
-        serializer = TextSnippetSerializer(snippets, many=True)
-        return Response(serializer.data)
+        location_id = cache_id(pk)
+        key = response_cache.snippets_key(location_id)
+        entry = response_cache.get(key) if location_id is not None else None
+        if entry is None:
+            try:
+                location = self.get_object()
+            except Location.DoesNotExist:
+                return Response({'error': 'Location not found'}, status=status.HTTP_404_NOT_FOUND)
+
+            snippets = list(TextSnippet.objects.filter(location=location).select_related('location').order_by('length'))
+            serializer = TextSnippetSerializer(snippets, many=True)
+            last_modified = max((snippet.updated for snippet in snippets), default=location.updated)
+            entry = response_cache.store(key, response_cache.snippets_etag(snippets), last_modified, serializer.data)
+        return response_cache.respond(request, entry)
+
+    @action(detail=True, methods=['get'], url_path='tours')
+    def get_tours(self, request, pk=None):
+        """Tours that stop at this location"""
+        location = self.get_object()
+        serializer = TourValuesSerializer(fields=['id', 'name', 'location_order_json', 'location_count'])
+        tours = serializer.select(Tour.objects.filter(stops__location=location).order_by('name', 'id'))
+        return Response({'location_id': location.id, 'tours': serializer.to_representation(tours)})
 
     @action(detail=False, methods=['get'], url_path='nearby')
     def nearby_locations(self, request):
-        """Get locations near specified coordinates (placeholder for future implementation)"""
-        lat = request.query_params.get('lat')
-        lon = request.query_params.get('lon')
-        radius = request.query_params.get('radius', 10)  # km
-
-        if not lat or not lon:
-            return Response({'error': 'lat and lon parameters required'}, status=status.HTTP_400_BAD_REQUEST)
-
-        # Placeholder - you'd implement actual geographic search here
-        locations = Location.objects.all()[:10]  # Return first 10 for now
-        serializer = LocationSerializer(locations, many=True)
+        """Get locations within radius km of the given coordinates, nearest first"""
+        params, error = nearby_params(request.query_params)
+        if error:
+            return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+
+        matches = find_nearby(self.get_queryset(), params['lat'], params['lon'], params['radius'])
+        page = matches[params['offset']:params['offset'] + params['limit']]
+        locations_by_id = Location.objects.in_bulk([location_id for location_id, _ in page])
+        return Response(nearby_payload(params, matches, page, locations_by_id))
+
+    @action(detail=False, methods=['get'], url_path='search')
+    def search(self, request):
+        """Full-text search over names, raw text and current snippets, best match first"""
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'error': 'q parameter required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = int(request.query_params.get('limit', 10))
+            offset = int(request.query_params.get('offset', 0))
+        except ValueError:
+            return Response({'error': 'limit and offset must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        if limit < 1 or offset < 0:
+            return Response({'error': 'limit must be positive, offset non-negative'}, status=status.HTTP_400_BAD_REQUEST)
+        limit = min(limit, SEARCH_MAX_LIMIT)
+
+        matches = search_locations(query)
+        page = matches[offset:offset + limit]
+        locations_by_id = Location.objects.in_bulk([location_id for location_id, _ in page])
+        results = []
+        for location_id, rank in page:
+            data = LocationSerializer(locations_by_id[location_id]).data
+            data['rank'] = round(rank, 6)
+            results.append(data)
         return Response({
-            'message': f'Locations within {radius}km of ({lat}, {lon})',
-            'locations': serializer.data
+            'query': query,
+            'count': len(matches),
+            'limit': limit,
+            'offset': offset,
+            'locations': results
         })
 
 
-class TextSnippetViewSet(viewsets.ModelViewSet):
-    queryset = TextSnippet.objects.all()
+class TextSnippetViewSet(StatelessReadMixin, FieldProjectionMixin, ValuesListMixin, viewsets.ModelViewSet):
+    # location_name is read from the joined location; its large columns are never used
+    queryset = TextSnippet.objects.select_related('location').defer('location__raw_text', 'location__latlon_json')
     serializer_class = TextSnippetSerializer
+    values_serializer_class = TextSnippetValuesSerializer
     permission_classes = [IsAuthenticated]
+    deferrable_fields = {'text': 'text'}
+    lite_exclude = ('text',)
 
     def get_queryset(self):
-        queryset = TextSnippet.objects.all()
+        queryset = super().get_queryset()
         location_id = self.request.query_params.get('location_id')
         if location_id:
             queryset = queryset.filter(location_id=location_id)
         return queryset.order_by('-created')
 
 
-class AudioSnippetViewSet(viewsets.ModelViewSet):
-    queryset = AudioSnippet.objects.all()
+class AudioSnippetViewSet(StatelessReadMixin, FieldProjectionMixin, viewsets.ModelViewSet):
+    # text_snippet_info is read from the joined snippet and its location; their large columns are never used
+    queryset = AudioSnippet.objects.select_related('text_snippet__location').defer(
+        'text_snippet__text', 'text_snippet__location__raw_text', 'text_snippet__location__latlon_json'
+    )
     serializer_class = AudioSnippetSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        queryset = AudioSnippet.objects.all()
+        queryset = super().get_queryset()
         location_id = self.request.query_params.get('location_id')
         if location_id:
             queryset = queryset.filter(text_snippet__location_id=location_id)
         return queryset.order_by('-created')
 
 
-class TourViewSet(viewsets.ModelViewSet):
-    queryset = Tour.objects.all()
+class TourViewSet(StatelessReadMixin, ConditionalWriteMixin, FieldProjectionMixin, ValuesListMixin,
+                  viewsets.ModelViewSet):
+    queryset = Tour.objects.prefetch_related(stops_prefetch())
     serializer_class = TourSerializer
+    values_serializer_class = TourValuesSerializer
     permission_classes = [IsAuthenticated]
+    deferrable_fields = {'description': 'description'}
+    locking_actions = ('update', 'partial_update', 'add_location', 'move_location', 'remove_location')
+
+    def get_etag(self, obj):
+        return response_cache.tour_etag(obj)
+
+    def perform_content_negotiation(self, request, force=False):
+        # Clients fetching a package send Accept: application/zip; errors still render as JSON
+        return super().perform_content_negotiation(request, force=force or self.action == 'package')
+
+    def stop_response(self, tour, data):
+        response = Response({**data, 'location_order': tour.location_order})
+        response['ETag'] = self.get_etag(tour)
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        """Tour detail, served from the response cache with ETag/Last-Modified validators"""
+        tour_id = cache_id(kwargs[self.lookup_field])
+        if tour_id is None or self.get_projected_fields() is not None:
+            return super().retrieve(request, *args, **kwargs)
+
+        key = response_cache.tour_key(tour_id)
+        entry = response_cache.get(key)
+        if entry is None:
+            tour = self.get_object()
+            entry = response_cache.store(key, response_cache.tour_etag(tour), tour.updated, self.get_serializer(tour).data)
+        return response_cache.respond(request, entry)
 
     @action(detail=True, methods=['post'], url_path='add-location')
+    @transaction.atomic
     def add_location(self, request, pk=None):
-        """Add a location to the tour"""
+        """Add a location to the tour, at the end or next to an existing stop (after/before)"""
         tour = self.get_object()
-        location_id = request.data.get('location_id')
+        location_id = optional_id(request.data, 'location_id')
         
         if not location_id:
             return Response({'error': 'location_id required'}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            location = Location.objects.get(id=location_id)
+            location = Location.objects.only('id', 'name').get(id=location_id)
         except Location.DoesNotExist:
             return Response({'error': 'Location not found'}, status=status.HTTP_404_NOT_FOUND)
 
-        # Add location to tour order
-        location_order = tour.location_order_json or []
-        if location_id not in location_order:
-            location_order.append(location_id)
-            tour.location_order_json = location_order
-            tour.save()
+        try:
+            add_stop(tour, location_id, after=optional_id(request.data, 'after'),
+                     before=optional_id(request.data, 'before'))
+        except TourOrderError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return self.stop_response(tour, {'message': f'Added location "{location.name}" to tour'})
+
+    @action(detail=True, methods=['post'], url_path='move-location')
+    @transaction.atomic
+    def move_location(self, request, pk=None):
+        """Move a stop directly after/before another stop, or to the end when neither is given"""
+        tour = self.get_object()
+        location_id = optional_id(request.data, 'location_id')
+        if not location_id:
+            return Response({'error': 'location_id required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            move_stop(tour, location_id, after=optional_id(request.data, 'after'),
+                      before=optional_id(request.data, 'before'))
+        except TourOrderError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return self.stop_response(tour, {})
+
+    @action(detail=True, methods=['post'], url_path='remove-location')
+    @transaction.atomic
+    def remove_location(self, request, pk=None):
+        """Remove a location from the tour"""
+        tour = self.get_object()
+        location_id = optional_id(request.data, 'location_id')
+        if not location_id:
+            return Response({'error': 'location_id required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            remove_stop(tour, location_id)
+        except TourOrderError as e:
+            return Response({'error': str(e)}, status=status.HTTP_404_NOT_FOUND)
+
+        return self.stop_response(tour, {})
+
+    @action(detail=True, methods=['get'], url_path='bundle')
+    def bundle(self, request, pk=None):
+        """
+        Everything needed to render a tour in one response: the tour, its
+        locations in tour order, each location's current snippet for ?length=
+        and that snippet's current audio (optionally only ?voice=).
+        """
+        tour = self.get_object()
+        length = request.query_params.get('length', 'medium')
+        voice_id = request.query_params.get('voice')
+
+        if length not in dict(TextSnippet.LENGTH_CHOICES):
+            return Response({'error': 'length must be short, medium or long'}, status=status.HTTP_400_BAD_REQUEST)
+
+        location_order = tour.location_order
+        locations = bundle_locations(length, voice_id).in_bulk(location_order)
+        return Response(bundle_payload(self.get_serializer(tour).data, location_order, locations, length, voice_id))
+
+    @action(detail=True, methods=['get'], url_path='package')
+    def package(self, request, pk=None):
+        """
+        The tour for offline use as one zip: manifest.json holds the bundle
+        (?length=, ?voice=) with each audio entry's `file` inside the archive.
+        Built once per location-version hash; repeat downloads stream the file.
+        """
+        tour = self.get_object()
+        length = request.query_params.get('length', 'medium')
+        voice_id = request.query_params.get('voice')
+
+        if length not in dict(TextSnippet.LENGTH_CHOICES):
+            return Response({'error': 'length must be short, medium or long'}, status=status.HTTP_400_BAD_REQUEST)
+
+        digest = package_hash(tour, length, voice_id)
+        etag = f'"pkg-{digest}"'
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match and response_cache.etag_matches(if_none_match, etag):
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+            response['ETag'] = etag
+            return response
+
+        path = package_path(tour.pk, length, voice_id, digest)
+        try:
+            archive = open(path, 'rb')
+        except FileNotFoundError:
+            location_order = tour.location_order
+            locations = bundle_locations(length, voice_id).in_bulk(location_order)
+            payload = bundle_payload(self.get_serializer(tour).data, location_order, locations, length, voice_id)
+            archive = open(write_package(path, payload), 'rb')
+
+        response = FileResponse(
+            archive, as_attachment=True, filename=f'tour-{tour.pk}-{length}.zip', content_type='application/zip'
+        )
+        response['ETag'] = etag
+        return response
+
+    @action(detail=True, methods=['get', 'post'], url_path='stitch')
+    def stitch(self, request, pk=None):
+        """
+        Get the tour's stitched audio for a snippet length. A cached stitch is
+        returned directly; a miss queues the build (202) unless ?sync=true.
+        Repeated misses while the build is pending return the same job.
+        """
+        tour = self.get_object()
+        length = request.query_params.get('length', 'medium')
+        voice_id = request.query_params.get('voice')
+
+        if length not in dict(TextSnippet.LENGTH_CHOICES):
+            return Response({'error': 'length must be short, medium or long'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            if wants_async(request):
+                entry, cached = find_stitch(tour, length, voice_id), True
+                if entry is None:
+                    job = enqueue('stitch_tour', {'tour_id': tour.id, 'length': length, 'voice_id': voice_id},
+                                  dedupe=True)
+                    return job_accepted(request, job)
+            else:
+                entry, cached = get_or_build_stitch(tour, length, voice_id)
+        except MissingAudioError as e:
+            return Response({'error': 'Missing audio for some locations', 'location_ids': e.location_ids},
+                            status=status.HTTP_409_CONFLICT)
+        except StitchError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
         return Response({
-            'message': f'Added location "{location.name}" to tour',
-            'location_order': location_order
+            'audio_url': entry.audio_url,
+            'cached': cached,
+            'length': entry.length,
+            'location_versions_hash': entry.location_versions_hash,
+            'expires_at': entry.expires_at
         })
 
 
+class JobViewSet(StatelessReadMixin, viewsets.ReadOnlyModelViewSet):
+    """Status polling for queued background work"""
+    queryset = Job.objects.all()
+    serializer_class = JobSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        for param in ('status', 'kind'):
+            value = self.request.query_params.get(param)
+            if value:
+                queryset = queryset.filter(**{param: value})
+        return queryset
+
+
+class SyncView(StatelessReadMixin, APIView):
+    """
+    Locations, snippets, audio and tours changed since ?since=<cursor>, plus
+    the ids of deleted ones. Start without a cursor, then pass back `cursor`
+    until `more` is false; expired cursors get 410 and need a full resync.
+    """
+    permission_classes = [IsAuthenticated]
+    # change kind -> (response key, queryset, serializer)
+    sources = {
+        'location': ('locations', LocationViewSet.queryset, LocationSerializer),
+        'text_snippet': ('text_snippets', TextSnippetViewSet.queryset, TextSnippetSerializer),
+        'audio_snippet': ('audio_snippets', AudioSnippetViewSet.queryset, AudioSnippetSerializer),
+        'tour': ('tours', TourViewSet.queryset, TourSerializer),
+    }
+
+    def get(self, request):
+        try:
+            changes, cursor, more = changes_since(request.query_params.get('since'), settings.SYNC_PAGE_SIZE)
+        except ValueError:
+            return Response({'error': 'since must be a cursor returned by this endpoint'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        except CursorExpired:
+            return Response({'error': 'Cursor expired, sync again from the start'}, status=status.HTTP_410_GONE)
+
+        changed = {kind: set() for kind in self.sources}
+        gone = {kind: set() for kind in self.sources}
+        for (kind, object_id), deleted in changes.items():
+            (gone if deleted else changed)[kind].add(object_id)
+
+        payload = {'cursor': cursor, 'more': more}
+        deleted = {}
+        for kind, (key, queryset, serializer_class) in self.sources.items():
+            rows = queryset.filter(pk__in=changed[kind]).order_by('pk')
+            payload[key] = serializer_class(rows, many=True).data
+            # Rows deleted after this change, whose tombstone is still ahead of the cursor
+            found = {row['id'] for row in payload[key]}
+            deleted[key] = sorted(gone[kind] | (changed[kind] - found))
+        payload['deleted'] = deleted
+        return Response(payload)
+
+
+def metrics_view(request):
+    """Request metrics of this process and token table sizes in the Prometheus text format"""
+    token = settings.METRICS_TOKEN
+    if not token:
+        # Unconfigured: only exposed on development servers
+        if not settings.DEBUG:
+            raise Http404()
+    elif not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse(status=status.HTTP_401_UNAUTHORIZED)
+    return HttpResponse(render_prometheus(token_table_gauges()), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class AudioFileView(StatelessReadMixin, APIView):
+    """
+    Serve audio files under AUDIO_ROOT (the targets of audio_url) with strong
+    ETags and single byte-range requests, so players can seek without
+    downloading a whole tour.
+
+    With AUDIO_SERVE_MODE = 'x-accel' only the access check runs in Django;
+    the response carries X-Accel-Redirect and nginx streams the file (and
+    answers Range itself) from the internal AUDIO_ACCEL_PREFIX location.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def perform_content_negotiation(self, request, force=False):
+        # Players send Accept: audio/*; error bodies still render as JSON
+        return super().perform_content_negotiation(request, force=True)
+
+    def get(self, request, path):
+        try:
+            file_path = audio_path(path)
+            stat = file_path.stat()
+        except (StitchError, OSError):
+            raise Http404('Audio file not found')
+        if not file_path.is_file():
+            raise Http404('Audio file not found')
+
+        relative = file_path.relative_to(Path(settings.AUDIO_ROOT).resolve()).as_posix()
+        if settings.AUDIO_SERVE_MODE == 'x-accel':
+            response = HttpResponse(content_type=content_type(file_path))
+            response['X-Accel-Redirect'] = settings.AUDIO_ACCEL_PREFIX + quote(relative)
+            return response
+
+        etag = file_etag(file_path, stat)
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match and response_cache.etag_matches(if_none_match, etag):
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+            return self.audio_headers(response, etag, stat)
+
+        # A Range conditioned on a different version of the file gets the whole file
+        byte_range = request.headers.get('Range')
+        if_range = request.headers.get('If-Range')
+        if if_range and if_range != etag:
+            byte_range = None
+        try:
+            requested = parse_range(byte_range, stat.st_size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+            return self.audio_headers(response, etag, stat)
+
+        if requested is None:
+            response = FileResponse(open(file_path, 'rb'), content_type=content_type(file_path))
+        else:
+            start, end = requested
+            response = StreamingHttpResponse(
+                iter_range(file_path, start, end),
+                status=status.HTTP_206_PARTIAL_CONTENT,
+                content_type=content_type(file_path),
+            )
+            response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+            response['Content-Length'] = end - start + 1
+        return self.audio_headers(response, etag, stat)
+
+    def audio_headers(self, response, etag, stat):
+        response['Accept-Ranges'] = 'bytes'
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        response['Cache-Control'] = 'private, max-age=3600'
+        return response
+
+
 # Keep existing authentication views
 class RegisterView(APIView):
     permission_classes = [AllowAny]
@@ -176,17 +875,18 @@ class LoginView(TokenObtainPairView):
     permission_classes = [AllowAny]
 
     def post(self, request, *args, **kwargs):
-        response = super().post(request, *args, **kwargs)
-        if response.status_code == 200:
-            username = request.data.get('username')
-            try:
-                user = User.objects.get(username=username)
-                user_data = UserSerializer(user).data
-                response.data['user'] = user_data
-                response.data['message'] = 'Login successful'
-            except User.DoesNotExist:
-                pass
-        return response
+        serializer = self.get_serializer(data=request.data)
+        try:
+            serializer.is_valid(raise_exception=True)
+        except TokenError as e:
+            raise InvalidToken(e.args[0])
+
+        # The serializer already authenticated the user; no second lookup
+        return Response({
+            **serializer.validated_data,
+            'user': UserSerializer(serializer.user).data,
+            'message': 'Login successful'
+        })
 
 
 class LogoutView(APIView):
@@ -197,6 +897,8 @@ class LogoutView(APIView):
             refresh_token = request.data["refresh"]
             token = RefreshToken(refresh_token)
             token.blacklist()
+            # The access token would otherwise stay usable until it expires
+            revoke_access_token(request.auth)
             return Response({'message': 'Logout successful'}, status=status.HTTP_200_OK)
         except Exception as e:
             return Response({'error': 'Invalid token'}, status=status.HTTP_400_BAD_REQUEST)
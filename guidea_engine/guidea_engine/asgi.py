@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'guidea_engine.settings')
+# Route the hottest read-only endpoints to native async views
+os.environ.setdefault('DJANGO_ROOT_URLCONF', 'guidea_engine.asgi_urls')
 
 application = get_asgi_application()
@@ -0,0 +1,16 @@
+"""
+URL configuration used under ASGI: the async read views take the hottest
+read-only paths, everything else is routed as in guidea_engine.urls.
+"""
+from django.urls import path
+
+from core import async_views
+
+from .urls import urlpatterns as sync_urlpatterns
+
+urlpatterns = [
+    path('api/locations/nearby/', async_views.nearby_locations),
+    path('api/locations/<int:pk>/', async_views.location_detail),
+    path('api/locations/<int:pk>/snippets/', async_views.location_snippets),
+    path('api/tours/<int:pk>/bundle/', async_views.tour_bundle),
+] + sync_urlpatterns
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 from datetime import timedelta
+from importlib.util import find_spec
 import os
 from dotenv import load_dotenv
 
@@ -50,9 +51,12 @@ INSTALLED_APPS = [
     'core',
     'rest_framework',
     'rest_framework_simplejwt',
+    'rest_framework_simplejwt.token_blacklist',
 ]
 
 MIDDLEWARE = [
+    'core.middleware.PerformanceMiddleware',
+    'core.middleware.CompressionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -63,7 +67,8 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'guidea_engine.urls'
+# asgi.py switches to guidea_engine.asgi_urls, which adds the async read views
+ROOT_URLCONF = os.getenv('DJANGO_ROOT_URLCONF', 'guidea_engine.urls')
 
 TEMPLATES = [
     {
@@ -134,11 +139,64 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Audio files (local disk stands in for object storage)
+AUDIO_ROOT = BASE_DIR / 'media' / 'audio'
+AUDIO_URL = '/media/audio/'
+# 'python' streams audio from Django; 'x-accel' hands the file to nginx via X-Accel-Redirect
+AUDIO_SERVE_MODE = os.getenv('AUDIO_SERVE_MODE', 'python')
+AUDIO_ACCEL_PREFIX = '/protected-audio/'  # nginx `internal` location aliased to AUDIO_ROOT
+
+# Offline tour archives built by GET /api/tours/{id}/package/
+PACKAGE_ROOT = BASE_DIR / 'media' / 'packages'
+
+# Builds snippet text from raw location text; see core.utils.summarisers
+SNIPPET_SUMMARISER = 'core.utils.summarisers.TextRankSummariser'
+SUMMARY_CACHE_TIMEOUT = 60 * 60 * 24 * 30  # memoised summaries are keyed by text hash, so they never go stale
+
+# Text-to-speech backend for snippet audio; see core.utils.tts
+TTS_BACKEND = 'core.utils.tts.ToneTTSBackend'
+TTS_DEFAULT_VOICE = 'default'
+TTS_WORKERS = 4  # synthesis threads per run
+
+# How long a stitched tour audio file is served before it is rebuilt
+STITCH_CACHE_TTL = timedelta(days=7)
+
+# Background jobs (run by `manage.py run_jobs`)
+JOB_MAX_ATTEMPTS = 3
+JOB_RETRY_BACKOFF = 5  # seconds, doubled on every retry
+JOB_STALE_AFTER = timedelta(minutes=30)  # running jobs older than this are requeued
+JOB_CONCURRENCY_LIMITS = {  # max running jobs per kind across all workers
+    'generate_snippets': 2,
+    'synthesise_audio': 1,
+    'stitch_tour': 2,
+    'prune_tokens': 1,
+    'compact_changes': 1,
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Cache backend, chosen by CACHE_URL: redis://host:port/db, file:///path/to/dir,
+# or unset for per-process local memory
+CACHE_URL = os.getenv('CACHE_URL', '')
+if CACHE_URL.startswith(('redis://', 'rediss://')):
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': CACHE_URL}}
+elif CACHE_URL.startswith('file://'):
+    CACHES = {'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': CACHE_URL[len('file://'):],
+    }}
+else:
+    CACHES = {'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {'MAX_ENTRIES': 10000},  # room for memoised snippet summaries
+    }}
+
+# Seconds a cached read response lives; writes invalidate it sooner
+RESPONSE_CACHE_TIMEOUT = 300
+
 # REST Framework configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
@@ -147,7 +205,41 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    'DEFAULT_PAGINATION_CLASS': 'core.pagination.CreatedCursorPagination',
+    'PAGE_SIZE': 50,
+    # Plain application/json and */* still get JSONRenderer; see core.renderers
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.ORJSONRenderer',
+        'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
+if find_spec('msgpack'):
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'].append('core.renderers.MessagePackRenderer')
+
+# Responses to GET/HEAD at least this long are compressed (core.middleware.CompressionMiddleware)
+COMPRESSION_MIN_BYTES = 1024
+
+# Text search configuration for the Postgres tsvector index (core.utils.search)
+SEARCH_CONFIG = 'english'
+
+# Delta sync (GET /api/sync/, core.utils.changes)
+SYNC_PAGE_SIZE = 1000  # change-log entries per response
+SYNC_SETTLE = timedelta(seconds=60)  # cursors stay behind entries this young, which may commit out of order
+SYNC_TOMBSTONE_RETENTION = timedelta(days=90)  # older cursors get 410 and must resync from scratch
+
+# Request instrumentation (core.middleware.PerformanceMiddleware)
+PERFORMANCE_SERVER_TIMING = True
+PERFORMANCE_SLOW_REQUEST_MS = 500
+PERFORMANCE_SLOW_QUERY_MS = 100
+# /metrics (per-view timings, query counts, route names) requires `Authorization: Bearer <METRICS_TOKEN>`.
+# Left unset it answers 404, except with DEBUG on, where it is open for local use.
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# StatelessJWTAuthentication re-checks a user's active flag, password and
+# revoked tokens at most this often per process
+JWT_STATE_CACHE_TTL = 30  # seconds
+JWT_STATE_CACHE_SIZE = 10000
 
 # Simple JWT configuration
 SIMPLE_JWT = {
@@ -14,10 +14,16 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 
+from core.views import AudioFileView, metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('core.urls')),
+    path('metrics', metrics_view, name='metrics'),
+    # Serves the files audio_url values point at
+    path(settings.AUDIO_URL.lstrip('/') + '<path:path>', AudioFileView.as_view(), name='audio-file'),
 ]